@@ -0,0 +1,132 @@
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from rollups import BUCKET_COLUMNS, bucket_labels, stddev
+
+
+def _in_range(query, day_column, start: Optional[date], end: Optional[date]):
+    if start is not None:
+        query = query.where(day_column >= start)
+    if end is not None:
+        query = query.where(day_column <= end)
+    return query
+
+
+def _round(value, digits: int = 3):
+    return round(value, digits) if value is not None else None
+
+
+async def km_per_day(db: AsyncSession, start: Optional[date] = None, end: Optional[date] = None,
+                     bike_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Rides, distance and active bikes per day"""
+    rollup = models.RideRollup.__table__
+    query = select(
+        rollup.c.day,
+        func.sum(rollup.c.rides),
+        func.sum(rollup.c.distance_km),
+        func.count(rollup.c.bike_id.distinct()),
+    )
+    if bike_id is not None:
+        query = query.where(rollup.c.bike_id == bike_id)
+    query = _in_range(query, rollup.c.day, start, end).group_by(rollup.c.day).order_by(rollup.c.day)
+    return [
+        {"day": day.isoformat(), "rides": rides, "distance_km": _round(distance), "active_bikes": bikes}
+        for day, rides, distance, bikes in (await db.execute(query)).all()
+    ]
+
+
+async def component_failures(db: AsyncSession, start: Optional[date] = None,
+                             end: Optional[date] = None) -> Dict[str, Any]:
+    """Replacements per component, also per 1000 km ridden by the fleet"""
+    maintenance = models.MaintenanceRollup.__table__
+    rides = models.RideRollup.__table__
+    fleet_km = (await db.execute(
+        _in_range(select(func.coalesce(func.sum(rides.c.distance_km), 0)), rides.c.day, start, end)
+    )).scalar()
+    query = _in_range(
+        select(
+            maintenance.c.component,
+            func.sum(maintenance.c.records),
+            func.count(maintenance.c.bike_id.distinct()),
+        ).where(maintenance.c.action == "replaced"),
+        maintenance.c.day, start, end,
+    ).group_by(maintenance.c.component).order_by(maintenance.c.component)
+    components = [
+        {
+            "component": component,
+            "replacements": replacements,
+            "bikes_affected": bikes,
+            "per_1000_km": _round(replacements * 1000 / fleet_km, 4) if fleet_km else None,
+        }
+        for component, replacements, bikes in (await db.execute(query)).all()
+    ]
+    return {"fleet_distance_km": _round(fleet_km), "components": components}
+
+
+async def vibration_by_weather(db: AsyncSession, start: Optional[date] = None,
+                               end: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Distribution of average ride vibration per weather condition"""
+    rollup = models.RideRollup.__table__
+    query = _in_range(
+        select(
+            rollup.c.weather_condition,
+            func.sum(rollup.c.rides),
+            func.sum(rollup.c.vibration_count),
+            func.sum(rollup.c.vibration_sum),
+            func.sum(rollup.c.vibration_sq_sum),
+            func.min(rollup.c.vibration_min),
+            func.max(rollup.c.vibration_max),
+            *[func.sum(rollup.c[column]) for column in BUCKET_COLUMNS],
+        ),
+        rollup.c.day, start, end,
+    ).group_by(rollup.c.weather_condition).order_by(rollup.c.weather_condition)
+    labels = bucket_labels()
+    result = []
+    for weather, rides, count, total, sq_total, low, high, *buckets in (await db.execute(query)).all():
+        result.append({
+            "weather_condition": weather,
+            "rides": rides,
+            "rides_with_vibration": count,
+            "mean": _round(total / count, 4) if count else None,
+            "stddev": _round(stddev(count, total, sq_total), 4),
+            "min": low,
+            "max": high,
+            "histogram": dict(zip(labels, buckets)),
+        })
+    return result
+
+
+async def replacement_intervals(db: AsyncSession, start: Optional[date] = None,
+                                end: Optional[date] = None) -> Dict[str, Any]:
+    """Mean km ridden between consecutive replacements of the same component,
+    for replacements dated in the range"""
+    rollup = models.MaintenanceRollup.__table__
+    query = _in_range(
+        select(
+            rollup.c.component,
+            func.sum(rollup.c.records),
+            func.sum(rollup.c.intervals),
+            func.sum(rollup.c.interval_km_sum),
+        ).where(rollup.c.action == "replaced"),
+        rollup.c.day, start, end,
+    ).group_by(rollup.c.component).order_by(rollup.c.component)
+    components = []
+    total_intervals = total_km = 0
+    for component, replacements, intervals, km in (await db.execute(query)).all():
+        total_intervals += intervals or 0
+        total_km += km or 0
+        components.append({
+            "component": component,
+            "replacements": replacements,
+            "intervals": intervals,
+            "mean_km_between_replacements": _round(km / intervals, 2) if intervals else None,
+        })
+    return {
+        "intervals": total_intervals,
+        "mean_km_between_replacements": _round(total_km / total_intervals, 2) if total_intervals else None,
+        "components": components,
+    }
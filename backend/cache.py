@@ -0,0 +1,368 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from fastapi import Request
+
+# "redis://host:port/db" switches to a shared Redis-compatible backend
+CACHE_URL = os.getenv("CACHE_URL", "")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "100000"))
+
+# Recompute the whole fleet in one query once this share of bikes is stale
+FULL_RECOMPUTE_RATIO = 0.5
+
+_STARTED_AT = time.time()
+
+
+class PredictionPlan(NamedTuple):
+    """What get_predictions found in the cache and still has to compute"""
+    index: Optional[List[int]]
+    entries: Dict[str, Any]
+    cached: Dict[int, Dict[str, Any]]
+    bike_ids: Optional[List[int]]  # None means recompute the whole fleet
+    needs_compute: bool
+
+
+class LRUCache:
+    """In-process LRU cache with a per-entry TTL and generation counters"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: int = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._counters: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None:
+                    continue
+                expires_at, value = entry
+                if expires_at <= now:
+                    del self._data[key]
+                    self.expirations += 1
+                    continue
+                self._data.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, mapping: Dict[str, Any]) -> None:
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = (expires_at, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def incr(self, names: Iterable[str]) -> None:
+        now = time.time()
+        with self._lock:
+            for name in names:
+                value, _ = self._counters.get(name, (0, _STARTED_AT))
+                self._counters[name] = (value + 1, now)
+
+    def counter(self, name: str) -> Tuple[int, float]:
+        """Return (generation, unix time of the last change)"""
+        with self._lock:
+            return self._counters.get(name, (0, _STARTED_AT))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._data)
+        return {
+            "backend": "memory",
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def _isoformat(value):
+    # List pages hold the dates and times read from the database
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class RedisCache:
+    """Same interface as LRUCache, shared between workers through Redis.
+
+    Eviction is left to the server's maxmemory policy; its evicted_keys
+    counter is reported in stats().
+    """
+
+    DATA_PREFIX = "bpm:c:"
+    GEN_PREFIX = "bpm:gen:"
+
+    def __init__(self, url: str, ttl: int = CACHE_TTL_SECONDS):
+        import redis  # optional dependency, only needed with CACHE_URL
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.mget([self.DATA_PREFIX + key for key in keys])
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, mapping: Dict[str, Any]) -> None:
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipeline.set(self.DATA_PREFIX + key, json.dumps(value, default=_isoformat), ex=self.ttl)
+        pipeline.execute()
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        keys = [self.DATA_PREFIX + key for key in keys]
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self) -> None:
+        # Generation counters survive so validators never go backwards
+        keys = list(self.client.scan_iter(match=self.DATA_PREFIX + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def incr(self, names: Iterable[str]) -> None:
+        now = time.time()
+        pipeline = self.client.pipeline(transaction=False)
+        for name in names:
+            key = self.GEN_PREFIX + name
+            pipeline.hincrby(key, "value", 1)
+            pipeline.hset(key, "modified_at", now)
+        pipeline.execute()
+
+    def counter(self, name: str) -> Tuple[int, float]:
+        value, modified_at = self.client.hmget(self.GEN_PREFIX + name, "value", "modified_at")
+        if value is None:
+            return 0, _STARTED_AT
+        return int(value), float(modified_at)
+
+    def stats(self) -> Dict[str, Any]:
+        info = self.client.info("stats")
+        return {
+            "backend": "redis",
+            "size": self.client.dbsize(),
+            "ttl_seconds": self.ttl,
+            "evictions": info.get("evicted_keys", 0),
+            "expirations": info.get("expired_keys", 0),
+        }
+
+
+def make_backend():
+    if CACHE_URL.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(CACHE_URL)
+    return LRUCache()
+
+
+def http_date(timestamp: float) -> str:
+    return format_datetime(datetime.fromtimestamp(timestamp, timezone.utc), usegmt=True)
+
+
+def not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since against the current validators"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+def validator_headers(etag: str, last_modified: float) -> Dict[str, str]:
+    return {"ETag": etag, "Last-Modified": http_date(last_modified), "Cache-Control": "no-cache"}
+
+
+class ResultCache:
+    """Caches per-bike predictions and list pages, invalidated per bike.
+
+    Each bike's predictions live under their own key, so a ride or
+    maintenance write for one bike only forces that bike to be recomputed.
+    Generation counters per table and per bike drive list-page keys and the
+    ETag / Last-Modified validators.
+    """
+
+    INDEX_KEY = "pred:index"
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else make_backend()
+        self.prediction_hits = 0
+        self.prediction_misses = 0
+        self.list_hits = 0
+        self.list_misses = 0
+        self._listeners: List[Callable[[Optional[Set[int]]], None]] = []
+
+    # Validators
+
+    def _time_bucket(self) -> int:
+        # Features such as days_since_service drift with time, so validators
+        # roll over with the TTL even when nothing was written
+        return int(time.time() // max(self.backend.ttl, 1))
+
+    def prediction_validators(self, variant: str) -> Tuple[str, float]:
+        generation, modified_at = self.backend.counter("predictions")
+        bucket = self._time_bucket()
+        tag = hashlib.sha1(f"{generation}:{variant}:{bucket}".encode()).hexdigest()[:16]
+        return f'W/"{tag}"', max(modified_at, bucket * self.backend.ttl)
+
+    def _list_scope(self, table: str, bike_id: Optional[int]) -> str:
+        return table if bike_id is None else f"{table}:bike:{bike_id}"
+
+    def list_validators(self, table: str, bike_id: Optional[int], query: str) -> Tuple[str, float]:
+        scope = self._list_scope(table, bike_id)
+        generation, modified_at = self.backend.counter(scope)
+        tag = hashlib.sha1(f"{scope}:{generation}:{query}".encode()).hexdigest()[:16]
+        return f'W/"{tag}"', modified_at
+
+    # Predictions
+
+    def get_predictions(self, variant: str, compute: Callable[[Optional[List[int]]], List[Dict[str, Any]]]):
+        """Return fleet predictions, recomputing only bikes without a cached entry.
+
+        ``compute(None)`` must return the whole fleet and ``compute(ids)`` the
+        predictions for just those bikes.
+        """
+        plan = self._plan_predictions(variant)
+        computed = compute(plan.bike_ids) if plan.needs_compute else []
+        return self._merge_predictions(variant, plan, computed)
+
+    async def aget_predictions(self, variant: str, compute: Callable[[Optional[List[int]]], Awaitable[List[Dict[str, Any]]]]):
+        """Async counterpart of get_predictions for an awaitable ``compute``"""
+        plan = self._plan_predictions(variant)
+        computed = await compute(plan.bike_ids) if plan.needs_compute else []
+        return self._merge_predictions(variant, plan, computed)
+
+    def _plan_predictions(self, variant: str) -> "PredictionPlan":
+        index = self.backend.get_many([self.INDEX_KEY]).get(self.INDEX_KEY)
+        if index is None:
+            return PredictionPlan(None, {}, {}, None, True)
+
+        keys = [f"pred:{bike_id}" for bike_id in index]
+        entries = self.backend.get_many(keys)
+        cached, missing = {}, []
+        for bike_id, key in zip(index, keys):
+            entry = entries.get(key)
+            if entry is not None and variant in entry:
+                cached[bike_id] = entry[variant]
+            else:
+                missing.append(bike_id)
+        self.prediction_hits += len(cached)
+        if len(missing) > len(index) * FULL_RECOMPUTE_RATIO:
+            return PredictionPlan(index, entries, cached, None, True)
+        return PredictionPlan(index, entries, cached, missing, bool(missing))
+
+    def _merge_predictions(self, variant: str, plan: "PredictionPlan", computed) -> List[Dict[str, Any]]:
+        self.prediction_misses += len(computed)
+        self._store_predictions(variant, computed, plan.entries)
+        if plan.bike_ids is None:
+            # Whole fleet recomputed: it also becomes the new index
+            self.backend.set_many({self.INDEX_KEY: [p["bike_id"] for p in computed]})
+            return computed
+        cached = dict(plan.cached)
+        cached.update((p["bike_id"], p) for p in computed)
+        return [cached[bike_id] for bike_id in plan.index if bike_id in cached]
+
+    def _store_predictions(self, variant, predictions, entries) -> None:
+        mapping = {}
+        for prediction in predictions:
+            key = f"pred:{prediction['bike_id']}"
+            entry = dict(entries.get(key) or {})
+            entry[variant] = prediction
+            mapping[key] = entry
+        self.backend.set_many(mapping)
+
+    # List pages
+
+    def page_key(self, table: str, bike_id: Optional[int], query: str) -> str:
+        scope = self._list_scope(table, bike_id)
+        generation, _ = self.backend.counter(scope)
+        return f"list:{scope}:{generation}:{query}"
+
+    def get_page(self, key: str) -> Optional[Any]:
+        cached = self.backend.get_many([key])
+        if key in cached:
+            self.list_hits += 1
+            return cached[key]
+        self.list_misses += 1
+        return None
+
+    def store_page(self, key: str, value: Any) -> None:
+        self.backend.set_many({key: value})
+
+    # Invalidation
+
+    def add_listener(self, callback: Callable[[Optional[Set[int]]], None]) -> None:
+        """Call ``callback(bike_ids)`` on every invalidation (None means all bikes)"""
+        self._listeners.append(callback)
+
+    def invalidate_bikes(self, bike_ids: Iterable[int], tables: Iterable[str] = ("rides",)) -> None:
+        """Drop cached predictions and list pages touching these bikes"""
+        bike_ids = set(bike_ids)
+        if not bike_ids:
+            return
+        self.backend.delete_many(f"pred:{bike_id}" for bike_id in bike_ids)
+        scopes = ["predictions"]
+        for table in set(tables) | {"bikes"}:
+            scopes.append(table)
+            scopes.extend(self._list_scope(table, bike_id) for bike_id in bike_ids)
+        self.backend.incr(scopes)
+        for callback in self._listeners:
+            callback(bike_ids)
+
+    def invalidate_predictions(self, bike_ids: Iterable[int]) -> None:
+        """Drop cached predictions whose inputs did not change (e.g. recomputed ones)"""
+        bike_ids = set(bike_ids)
+        if not bike_ids:
+            return
+        self.backend.delete_many(f"pred:{bike_id}" for bike_id in bike_ids)
+        self.backend.incr(["predictions"])
+
+    def invalidate_all(self) -> None:
+        self.backend.clear()
+        self.backend.incr(["predictions", "bikes", "rides", "maintenance"])
+        for callback in self._listeners:
+            callback(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.backend.stats(),
+            "prediction_hits": self.prediction_hits,
+            "prediction_misses": self.prediction_misses,
+            "list_hits": self.list_hits,
+            "list_misses": self.list_misses,
+        }
+
+
+result_cache = ResultCache()
@@ -1,28 +1,76 @@
 from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 import os
 from dotenv import load_dotenv
+from metrics import instrument_engine
 
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./bike_maintenance.db")
 
-# Debug: Print the database URL
-print(f"Database URL: {SQLALCHEMY_DATABASE_URL}")
+# Connection pool tuning, shared by the sync and async engines
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+def pool_options(url):
+    """Engine keyword arguments for the configured connection pool"""
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    # SQLite picks its own pool class; sizing only applies to server databases
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    return options
+
+def async_database_url(url):
+    """Map a sync database URL onto its asyncio driver (aiosqlite / asyncpg)"""
+    scheme, _, rest = url.partition("://")
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    if scheme in ("postgres", "postgresql") or scheme.startswith("postgresql+"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
 
 # Create engine with conditional connection arguments
 if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
     engine = create_engine(
         SQLALCHEMY_DATABASE_URL,
-        connect_args={"check_same_thread": False}
+        connect_args={"check_same_thread": False},
+        **pool_options(SQLALCHEMY_DATABASE_URL)
     )
 else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, **pool_options(SQLALCHEMY_DATABASE_URL))
+
+instrument_engine(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# The async engine is created on first use so scripts that only need the
+# sync engine don't require the asyncio drivers
+_async_engine = None
+_async_sessionmaker = None
+
+def get_async_engine():
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        url = async_database_url(SQLALCHEMY_DATABASE_URL)
+        _async_engine = create_async_engine(url, **pool_options(url))
+        instrument_engine(_async_engine.sync_engine)
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False)
+    return _async_engine
+
+def AsyncSessionLocal():
+    get_async_engine()
+    return _async_sessionmaker()
+
 def get_db():
     db = SessionLocal()
     try:
@@ -30,6 +78,49 @@ def get_db():
     finally:
         db.close()
 
+async def dispose_async_engine():
+    """Close the async engine's pooled connections, if it was ever created"""
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# The ON CONFLICT upserts (rollups, work queue claims) and the claim locks
+# are written for these
+SUPPORTED_DIALECTS = ("postgresql", "sqlite")
+
+def check_dialect(bind=None):
+    """Refuse to start on a database the application does not support"""
+    name = (bind or engine).dialect.name
+    if name not in SUPPORTED_DIALECTS:
+        raise RuntimeError(f"Unsupported database '{name}' in DATABASE_URL; use PostgreSQL or SQLite")
+
+def run_migrations(bind=None):
+    """Bring the database schema up to date with the Alembic migrations.
+
+    Databases created before migrations existed are stamped at the baseline
+    revision first so the later migrations can upgrade them in place. Runs
+    first on every start, so an unsupported database is rejected here.
+    """
+    check_dialect(bind)
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import inspect
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    config = Config(os.path.join(backend_dir, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(backend_dir, "migrations"))
+    config.attributes["configure_logger"] = False
+
+    with (bind or engine).begin() as connection:
+        config.attributes["connection"] = connection
+        inspector = inspect(connection)
+        if not inspector.has_table("alembic_version") and inspector.has_table("bikes"):
+            command.stamp(config, "0001")
+        command.upgrade(config, "head")
+
 def test_db_connection():
     """Test database connection and print status"""
     try:
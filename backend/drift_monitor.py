@@ -0,0 +1,353 @@
+import json
+import logging
+import os
+import shlex
+import subprocess
+import sys
+import threading
+from collections import deque
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import String, func, select, type_coerce
+
+import models
+from database import SessionLocal
+from feature_store import to_date
+from model_registry import ModelRegistry
+from predictions import FEATURE_COLUMNS, HIGH_RISK_PROBABILITY, add_score_listener
+
+logger = logging.getLogger(__name__)
+
+# A high-priority score counts as a hit when the bike has a replacement
+# within this many days; the same horizon as the training label
+DRIFT_HORIZON_DAYS = int(os.getenv("DRIFT_HORIZON_DAYS", os.getenv("SNAPSHOT_HORIZON_DAYS", "30")))
+# Precision and recall are computed over the outcomes of the last N days
+DRIFT_WINDOW_DAYS = int(os.getenv("DRIFT_WINDOW_DAYS", "30"))
+# Quantile bins per feature in the training baseline
+DRIFT_BASELINE_BINS = 10
+# A PSI above 0.25 is the usual "significant shift"
+DRIFT_PSI_THRESHOLD = float(os.getenv("DRIFT_PSI_THRESHOLD", "0.25"))
+# Rolling quality below these triggers retraining (0 disables the check)
+DRIFT_MIN_PRECISION = float(os.getenv("DRIFT_MIN_PRECISION", "0.2"))
+DRIFT_MIN_RECALL = float(os.getenv("DRIFT_MIN_RECALL", "0.5"))
+# Precision/recall are only checked once the window holds this many outcomes,
+# and PSI once this many bikes were scored
+DRIFT_MIN_OUTCOMES = int(os.getenv("DRIFT_MIN_OUTCOMES", "30"))
+DRIFT_MIN_BIKES = int(os.getenv("DRIFT_MIN_BIKES", "100"))
+# Replacements read per query while polling
+DRIFT_POLL_BATCH = 10000
+# Started from the backend directory when a threshold is breached; empty
+# only reports breaches
+DRIFT_RETRAIN_COMMAND = os.getenv("DRIFT_RETRAIN_COMMAND", f"{shlex.quote(sys.executable)} scripts/train_model.py")
+# Retraining is started at most once per this many seconds, across processes
+DRIFT_RETRAIN_COOLDOWN_SECONDS = float(os.getenv("DRIFT_RETRAIN_COOLDOWN_SECONDS", "86400"))
+# Written in the registry root when retraining starts; its mtime is the cooldown clock
+RETRAIN_MARKER = "RETRAIN_TRIGGERED"
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Keeps empty bins from making PSI infinite
+PSI_EPSILON = 1e-4
+
+
+def feature_baseline(features, bins: int = DRIFT_BASELINE_BINS) -> Dict[str, Any]:
+    """Quantile bin edges and bin shares of each model feature in the training rows"""
+    matrix = np.asarray(features, dtype=np.float64)
+    baseline = {"rows": len(matrix), "features": {}}
+    for i, name in enumerate(FEATURE_COLUMNS):
+        column = matrix[:, i]
+        column = column[~np.isnan(column)]
+        edges = np.unique(np.quantile(column, np.linspace(0, 1, bins + 1)[1:-1])) if len(column) else np.array([])
+        counts = np.bincount(np.searchsorted(edges, column, side="right"), minlength=len(edges) + 1)
+        baseline["features"][name] = {
+            "edges": edges.tolist(),
+            "proportions": (counts / max(len(column), 1)).tolist(),
+        }
+    return baseline
+
+
+def psi(counts, expected) -> float:
+    """Population stability index of observed bin counts against expected shares"""
+    actual = np.asarray(counts, dtype=np.float64)
+    actual = np.maximum(actual / max(actual.sum(), 1), PSI_EPSILON)
+    expected = np.maximum(np.asarray(expected, dtype=np.float64), PSI_EPSILON)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+class DriftMonitor:
+    """Rolling prediction quality and feature drift of the served model.
+
+    Every batch the model scores is recorded per bike: the day it was first
+    seen, its open flag (the first and last day of high-priority scores not
+    yet followed by a replacement) and the baseline bin of each feature, so
+    the feature histograms always describe the fleet's latest scores.
+    ``poll`` reads the replacements written since the last poll by
+    record_id, never the history: a replacement within ``horizon_days`` of
+    a flag is a hit, any other replacement of a scored bike a missed
+    failure, and a flag with no replacement within the horizon a false
+    alarm. Outcomes are counted per day over the last ``window_days``.
+    Memory is one short list per bike plus the histograms; everything
+    starts over when another model version is served.
+    """
+
+    def __init__(self, session_factory=SessionLocal, registry: Optional[ModelRegistry] = None,
+                 horizon_days: int = DRIFT_HORIZON_DAYS, window_days: int = DRIFT_WINDOW_DAYS,
+                 retrain_command: str = DRIFT_RETRAIN_COMMAND):
+        self.session_factory = session_factory
+        self.registry = registry or ModelRegistry()
+        self.horizon_days = horizon_days
+        self.window_days = window_days
+        self.retrain_command = retrain_command
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._last_record_id: Optional[int] = None
+        self._retrain: Optional[subprocess.Popen] = None
+        self.last_retrain: Optional[Dict[str, Any]] = None
+        self._reset(None)
+
+    @staticmethod
+    def today() -> int:
+        """The current day as an ordinal, the unit of every date the monitor keeps"""
+        return date.today().toordinal()
+
+    def _reset(self, version: Optional[str]) -> None:
+        self.version = version
+        self.since = datetime.now()
+        self.recorded = 0
+        # bike_id -> [first seen, first flag, last flag, feature bins]; days as ordinals
+        self._bikes: Dict[int, list] = {}
+        # [day, hits, false alarms, missed failures], oldest first
+        self._days: deque = deque(maxlen=self.window_days)
+        self._expired_through: Optional[int] = None
+        self._edges: Optional[List[np.ndarray]] = None
+        self._expected: List[list] = []
+        self._counts: List[List[int]] = []
+        baseline = self.registry.baseline(version) if version else None
+        features = (baseline or {}).get("features", {})
+        if baseline is not None and all(name in features for name in FEATURE_COLUMNS):
+            self._edges = [np.array(features[name]["edges"], dtype=np.float32) for name in FEATURE_COLUMNS]
+            self._expected = [features[name]["proportions"] for name in FEATURE_COLUMNS]
+            self._counts = [[0] * (len(edges) + 1) for edges in self._edges]
+
+    def record(self, bike_ids: List[int], features: np.ndarray, probabilities, version: Optional[str]) -> None:
+        """Score listener: remember what the model said about these bikes"""
+        today = self.today()
+        flagged = (np.asarray(probabilities) >= HIGH_RISK_PROBABILITY).tolist()
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            bins = None
+            if self._edges is not None:
+                bins = np.column_stack([
+                    np.searchsorted(edges, features[:, i], side="right") for i, edges in enumerate(self._edges)
+                ]).tolist()
+            for i, bike_id in enumerate(bike_ids):
+                state = self._bikes.get(bike_id)
+                if state is None:
+                    state = self._bikes[bike_id] = [today, None, None, None]
+                if flagged[i]:
+                    if state[1] is None:
+                        state[1] = today
+                    state[2] = today
+                if bins is not None and state[3] != bins[i]:
+                    for feature, (old, new) in enumerate(zip(state[3] or [None] * len(bins[i]), bins[i])):
+                        if old is not None:
+                            self._counts[feature][old] -= 1
+                        self._counts[feature][new] += 1
+                    state[3] = bins[i]
+            self.recorded += len(bike_ids)
+
+    def _today_counts(self, today: int) -> list:
+        if not self._days or self._days[-1][0] != today:
+            self._days.append([today, 0, 0, 0])
+        return self._days[-1]
+
+    def _expire(self, today: int) -> None:
+        """Count flags whose horizon passed without a replacement as false alarms (once a day)"""
+        if self._expired_through == today:
+            return
+        counts = self._today_counts(today)
+        for state in self._bikes.values():
+            while state[1] is not None and state[1] + self.horizon_days < today:
+                counts[2] += 1
+                # Still flagged after that horizon: a new flag starts at the last score
+                state[1] = state[2] if state[2] > state[1] + self.horizon_days else None
+        self._expired_through = today
+
+    def _apply_replacement(self, bike_id: int, day: int, today: int) -> None:
+        state = self._bikes.get(bike_id)
+        if state is None or day < state[0]:
+            # Not scored before it failed (or the same failure again)
+            return
+        counts = self._today_counts(today)
+        first_flag = state[1]
+        if first_flag is not None and first_flag <= day <= first_flag + self.horizon_days:
+            counts[1] += 1
+        else:
+            counts[3] += 1
+            if first_flag is not None and day < first_flag:
+                # Flagged after this failure; that flag stays open
+                return
+        state[0], state[1], state[2] = day + 1, None, None
+
+    def poll(self, retrain: bool = False) -> List[str]:
+        """Resolve the replacements written since the last poll; returns the breached thresholds.
+
+        The first poll only notes the latest record_id. With ``retrain`` a
+        breach starts DRIFT_RETRAIN_COMMAND (see ``_maybe_retrain``).
+        """
+        record = models.MaintenanceRecord.__table__
+        with self._poll_lock:
+            db = self.session_factory()
+            try:
+                if self._last_record_id is None:
+                    self._last_record_id = db.execute(select(func.max(record.c.record_id))).scalar() or 0
+                while True:
+                    rows = db.execute(
+                        select(
+                            record.c.record_id,
+                            record.c.bike_id,
+                            type_coerce(record.c.maintenance_date, String).label("maintenance_date"),
+                        )
+                        .where(record.c.record_id > self._last_record_id, record.c.action == "replaced")
+                        .order_by(record.c.record_id)
+                        .limit(DRIFT_POLL_BATCH)
+                    ).all()
+                    if not rows:
+                        break
+                    today = self.today()
+                    with self._lock:
+                        for row in rows:
+                            day = to_date(row.maintenance_date)
+                            if day is not None:
+                                self._apply_replacement(row.bike_id, day.toordinal(), today)
+                    self._last_record_id = rows[-1].record_id
+                    if len(rows) < DRIFT_POLL_BATCH:
+                        break
+            finally:
+                db.close()
+            with self._lock:
+                self._expire(self.today())
+                breaches = self._breaches()
+            if retrain and breaches:
+                self._maybe_retrain(breaches)
+            return breaches
+
+    def _outcomes(self) -> Dict[str, Any]:
+        oldest = self.today() - self.window_days
+        hits = false_alarms = misses = 0
+        for day, day_hits, day_false_alarms, day_misses in self._days:
+            if day > oldest:
+                hits += day_hits
+                false_alarms += day_false_alarms
+                misses += day_misses
+        return {
+            "hits": hits,
+            "false_alarms": false_alarms,
+            "missed_failures": misses,
+            "precision": hits / (hits + false_alarms) if hits + false_alarms else None,
+            "recall": hits / (hits + misses) if hits + misses else None,
+        }
+
+    def _psi(self) -> Optional[Dict[str, float]]:
+        if self._edges is None:
+            return None
+        return {
+            name: round(psi(counts, expected), 4)
+            for name, counts, expected in zip(FEATURE_COLUMNS, self._counts, self._expected)
+        }
+
+    def _breaches(self) -> List[str]:
+        breaches = []
+        outcomes = self._outcomes()
+        if outcomes["hits"] + outcomes["false_alarms"] >= DRIFT_MIN_OUTCOMES \
+                and outcomes["precision"] < DRIFT_MIN_PRECISION:
+            breaches.append(f"precision {outcomes['precision']:.3f} < {DRIFT_MIN_PRECISION}")
+        if outcomes["hits"] + outcomes["missed_failures"] >= DRIFT_MIN_OUTCOMES \
+                and outcomes["recall"] < DRIFT_MIN_RECALL:
+            breaches.append(f"recall {outcomes['recall']:.3f} < {DRIFT_MIN_RECALL}")
+        if len(self._bikes) >= DRIFT_MIN_BIKES:
+            for name, value in (self._psi() or {}).items():
+                if value > DRIFT_PSI_THRESHOLD:
+                    breaches.append(f"{name} PSI {value:.3f} > {DRIFT_PSI_THRESHOLD}")
+        return breaches
+
+    def _maybe_retrain(self, breaches: List[str]) -> None:
+        """Start the retrain command unless it is running or ran within the cooldown.
+
+        The cooldown is read from the marker file's mtime, so API workers
+        and the standalone scheduler share it and a restart does not reset it.
+        """
+        if not self.retrain_command:
+            return
+        if self._retrain is not None and self._retrain.poll() is None:
+            return
+        marker = os.path.join(self.registry.root, RETRAIN_MARKER)
+        try:
+            if datetime.now().timestamp() - os.stat(marker).st_mtime < DRIFT_RETRAIN_COOLDOWN_SECONDS:
+                return
+        except FileNotFoundError:
+            pass
+        self.last_retrain = {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "model_version": self.version,
+            "reasons": breaches,
+        }
+        os.makedirs(self.registry.root, exist_ok=True)
+        with open(marker, "w") as f:
+            json.dump(self.last_retrain, f, indent=2)
+        logger.warning("Model drift (%s), retraining: %s", "; ".join(breaches), self.retrain_command)
+        try:
+            self._retrain = subprocess.Popen(shlex.split(self.retrain_command), cwd=BACKEND_DIR)
+        except OSError as e:
+            logger.error("Could not start retraining: %s", e)
+            self.last_retrain["error"] = str(e)
+
+    def feature_psi(self) -> Optional[Dict[str, float]]:
+        with self._lock:
+            return self._psi()
+
+    def outcomes(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._outcomes()
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            outcomes = self._outcomes()
+            feature_psi = self._psi()
+            breaches = self._breaches()
+            bikes = len(self._bikes)
+            open_flags = sum(1 for state in self._bikes.values() if state[1] is not None)
+        process = self._retrain
+        return {
+            "model_version": self.version,
+            "since": self.since.isoformat(timespec="seconds"),
+            "predictions_recorded": self.recorded,
+            "bikes_scored": bikes,
+            "open_flags": open_flags,
+            "last_record_id": self._last_record_id,
+            "horizon_days": self.horizon_days,
+            "window_days": self.window_days,
+            "outcomes": outcomes,
+            "feature_psi": feature_psi,
+            "thresholds": {
+                "psi": DRIFT_PSI_THRESHOLD,
+                "min_precision": DRIFT_MIN_PRECISION,
+                "min_recall": DRIFT_MIN_RECALL,
+                "min_outcomes": DRIFT_MIN_OUTCOMES,
+                "min_bikes": DRIFT_MIN_BIKES,
+            },
+            "breaches": breaches,
+            "retrain": {
+                "command": self.retrain_command or None,
+                "cooldown_seconds": DRIFT_RETRAIN_COOLDOWN_SECONDS,
+                "running": process is not None and process.poll() is None,
+                "returncode": process.poll() if process is not None else None,
+                "last": self.last_retrain,
+            },
+        }
+
+
+drift_monitor = DriftMonitor()
+add_score_listener(drift_monitor.record)
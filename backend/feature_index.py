@@ -0,0 +1,225 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
+
+from cache import result_cache
+from database import SessionLocal
+from feature_store import FEATURE_SOURCE
+from predictions import FEATURE_COLUMNS, days_since, feature_matrix, predictions_from_rows, prediction_query
+
+logger = logging.getLogger(__name__)
+
+# The whole index is re-read in the background once it is this old, which
+# picks up writes made by other processes (other API workers, scripts)
+FEATURE_INDEX_MAX_AGE_SECONDS = float(os.getenv("FEATURE_INDEX_MAX_AGE_SECONDS", "60"))
+
+# Largest batch accepted by POST /predictions/score
+MAX_SCORE_BATCH = 1000
+
+# Row attribute holding each overridable model feature
+OVERRIDE_FIELDS = {
+    "total_distance_km": "total_distance_km",
+    "km_since_service": "km_since_service",
+    "days_since_service": "last_maintenance_date",
+    "avg_vibration_last_10": "avg_vibration",
+}
+
+
+def override_value(current: float, value: Union[float, int, str]) -> float:
+    """Resolve one override: a number replaces the value, "+200" / "-50" shift it"""
+    if isinstance(value, str):
+        text = value.strip()
+        number = float(text)
+        return current + number if text[:1] in ("+", "-") else number
+    return float(value)
+
+
+def what_if_row(row, overrides: Dict[str, Union[float, str]], now: datetime):
+    """Copy of a feature row with hypothetical feature values applied.
+
+    days_since_service is derived from the last maintenance date, so an
+    override moves that date instead.
+    """
+    values = row._asdict()
+    for feature, value in overrides.items():
+        field = OVERRIDE_FIELDS[feature]
+        if feature == "days_since_service":
+            days = override_value(days_since(values[field], now), value)
+            values[field] = now - timedelta(days=days)
+        else:
+            values[field] = override_value(values[field] or 0, value)
+    return SimpleNamespace(**values)
+
+
+def feature_values(features) -> Dict[str, float]:
+    """One row of the feature matrix as a readable dict"""
+    return {column: round(value, 3) for column, value in zip(FEATURE_COLUMNS, features.tolist())}
+
+
+def validate_overrides(overrides: Dict[str, Union[float, str]]) -> None:
+    for feature, value in overrides.items():
+        if feature not in OVERRIDE_FIELDS:
+            raise ValueError(f"Unknown feature '{feature}', expected one of {FEATURE_COLUMNS}")
+        try:
+            override_value(0.0, value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid override for '{feature}': {value!r}")
+
+
+class FeatureIndex:
+    """Feature rows of every bike held in memory, keyed by bike_id.
+
+    Serves single-bike and small-batch scoring without a database round trip.
+    Writes in this process mark bikes dirty through the result cache's
+    invalidation listeners, and a dirty bike is re-read (one indexed query
+    for all the requested dirty bikes) the next time it is asked for. The
+    whole index is refreshed on a background thread when it gets older than
+    ``max_age`` seconds.
+    """
+
+    def __init__(self, session_factory=SessionLocal, source: str = FEATURE_SOURCE,
+                 max_age: float = FEATURE_INDEX_MAX_AGE_SECONDS):
+        self.session_factory = session_factory
+        self.source = source
+        self.max_age = max_age
+        self._rows: Dict[int, Any] = {}
+        self._dirty: Set[int] = set()
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self.point_reads = 0
+        self.full_loads = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def bike_ids(self) -> List[int]:
+        return sorted(self._rows)
+
+    def invalidate(self, bike_ids: Optional[Iterable[int]]) -> None:
+        """Mark bikes as changed; None drops the whole index"""
+        if bike_ids is None:
+            self._loaded_at = None
+            return
+        with self._lock:
+            self._dirty.update(bike_ids)
+
+    def _read(self, bike_ids: Optional[List[int]] = None) -> Dict[int, Any]:
+        db = self.session_factory()
+        try:
+            rows = db.execute(prediction_query(self.source, bike_ids)).all()
+        finally:
+            db.close()
+        return {row.bike_id: row for row in rows}
+
+    def refresh(self) -> None:
+        """Re-read every bike"""
+        started = time.monotonic()
+        with self._lock:
+            # Bikes marked dirty from here on are re-read again later
+            self._dirty.clear()
+        self._rows = self._read()
+        self._loaded_at = started
+        self.full_loads += 1
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Feature index refresh failed")
+        finally:
+            self._refreshing = False
+
+    def pending(self, bike_ids: Iterable[int]) -> bool:
+        """True if serving ``bike_ids`` needs a database read first"""
+        if self._loaded_at is None:
+            return True
+        rows, dirty = self._rows, self._dirty
+        return any(bike_id in dirty or bike_id not in rows for bike_id in bike_ids)
+
+    def load(self, bike_ids: Iterable[int]) -> None:
+        """Do the database reads ``pending`` asked for"""
+        if self._loaded_at is None:
+            with self._load_lock:
+                if self._loaded_at is None:
+                    self.refresh()
+        rows = self._rows
+        with self._lock:
+            # Unknown ids are looked up too: the bike may be newer than the index
+            needed = {b for b in bike_ids if b in self._dirty or b not in rows}
+            self._dirty -= needed
+        if not needed:
+            return
+        fresh = self._read(sorted(needed))
+        self.point_reads += 1
+        for bike_id in needed:
+            if bike_id in fresh:
+                rows[bike_id] = fresh[bike_id]
+            else:
+                rows.pop(bike_id, None)
+
+    def maybe_refresh(self) -> None:
+        """Start a background refresh when the index is older than max_age"""
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at < self.max_age:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="feature-index-refresh", daemon=True).start()
+
+    def score(self, bike_ids: List[int], model_server=None,
+              overrides: Optional[Dict[str, Union[float, str]]] = None) -> List[Dict[str, Any]]:
+        """Predictions for the indexed bikes among ``bike_ids``, in request order.
+
+        Call ``load`` first when ``pending`` says so. With ``overrides`` every
+        bike is scored as if its features had those values, and the
+        unmodified result is reported under "baseline".
+        """
+        self.maybe_refresh()
+        rows = self._rows
+        found = [rows[bike_id] for bike_id in dict.fromkeys(bike_ids) if bike_id in rows]
+        now = datetime.now()
+        if overrides:
+            # Baseline and what-if rows are scored in the same model call
+            found = found + [what_if_row(row, overrides, now) for row in found]
+        features = feature_matrix(found, now)
+        # What-if scores are not served predictions, so the drift monitor skips them
+        predictions = predictions_from_rows(found, model_server, features, record=not overrides)
+        for prediction, values in zip(predictions, features):
+            prediction["features"] = feature_values(values)
+        if not overrides:
+            return predictions
+
+        half = len(predictions) // 2
+        baseline, predictions = predictions[:half], predictions[half:]
+        for prediction, base in zip(predictions, baseline):
+            prediction["overrides"] = overrides
+            prediction["baseline"] = {
+                "maintenance_priority": base["maintenance_priority"],
+                "confidence_score": base["confidence_score"],
+                "prediction_source": base["prediction_source"],
+                "features": base["features"],
+            }
+        return predictions
+
+    def stats(self) -> Dict[str, Any]:
+        loaded_at = self._loaded_at
+        return {
+            "bikes": len(self._rows),
+            "dirty": len(self._dirty),
+            "age_seconds": None if loaded_at is None else time.monotonic() - loaded_at,
+            "max_age_seconds": self.max_age,
+            "full_loads": self.full_loads,
+            "point_reads": self.point_reads,
+        }
+
+
+feature_index = FeatureIndex()
+result_cache.add_listener(feature_index.invalidate)
@@ -0,0 +1,320 @@
+import json
+import math
+import os
+from collections import defaultdict, deque
+from datetime import date, datetime, time
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import String, delete, func, select, type_coerce
+from sqlalchemy.orm import Session
+
+import models
+
+# Number of most recent rides kept in the rolling vibration / distance window
+RECENT_RIDES_WINDOW = 10
+
+# "store" reads features from bike_features, "rides" recomputes them from raw rides
+FEATURE_SOURCE = os.getenv("FEATURE_SOURCE", "store")
+
+# Columns compared by verify(); floats are compared with a relative tolerance
+FEATURE_FIELDS = [
+    "km_since_service",
+    "last_maintenance_date",
+    "last_replaced_date",
+    "avg_vibration_last_10",
+    "recent_distance_km",
+    "recent_rides_count",
+    "last_ride_start_time",
+]
+
+
+def to_date(value) -> Optional[date]:
+    """Normalise a maintenance date that may be stored as text or a timestamp"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def after_service(end_time: Optional[datetime], replaced: Optional[date]) -> bool:
+    """True if a ride counts towards km_since_service"""
+    if replaced is None:
+        return True
+    return end_time is not None and end_time > datetime.combine(replaced, time())
+
+
+def features_query():
+    """Fleet features read from bike_features: one row per bike, no ride scan.
+
+    Labels match predictions.fleet_features_query so both can feed the same
+    prediction code.
+    """
+    bike = models.Bike.__table__
+    features = models.BikeFeatures.__table__
+    return (
+        select(
+            bike.c.bike_id,
+            bike.c.status,
+            bike.c.last_serviced_date,
+            bike.c.total_distance_km,
+            features.c.avg_vibration_last_10.label("avg_vibration"),
+            features.c.recent_distance_km,
+            features.c.recent_rides_count,
+            features.c.last_maintenance_date,
+            func.coalesce(
+                features.c.km_since_service, bike.c.total_distance_km
+            ).label("km_since_service"),
+        )
+        .outerjoin(features, features.c.bike_id == bike.c.bike_id)
+        .order_by(bike.c.bike_id)
+    )
+
+
+def _set_window(features: models.BikeFeatures, window: List[List[Optional[float]]]) -> None:
+    """Store a [(vibration, distance), ...] window and its aggregates"""
+    window = window[-RECENT_RIDES_WINDOW:]
+    vibrations = [v for v, _ in window]
+    distances = [d for _, d in window]
+    present = [v for v in vibrations if v is not None]
+    features.recent_vibrations = json.dumps(vibrations)
+    features.recent_distances = json.dumps(distances)
+    features.avg_vibration_last_10 = sum(present) / len(present) if present else None
+    features.recent_distance_km = sum(d for d in distances if d is not None)
+    features.recent_rides_count = len(window)
+
+
+def _get_window(features: models.BikeFeatures) -> List[List[Optional[float]]]:
+    vibrations = json.loads(features.recent_vibrations or "[]")
+    distances = json.loads(features.recent_distances or "[]")
+    return [list(pair) for pair in zip(vibrations, distances)]
+
+
+def _load_window(db: Session, bike_id: int) -> List[List[Optional[float]]]:
+    """Re-read the last rides of one bike (used for out-of-order arrivals)"""
+    ride = models.Ride.__table__
+    rows = db.execute(
+        select(ride.c.avg_vibration, ride.c.distance_km)
+        .where(ride.c.bike_id == bike_id)
+        .order_by(ride.c.start_time.desc(), ride.c.ride_id.desc())
+        .limit(RECENT_RIDES_WINDOW)
+    ).all()
+    return [[r.avg_vibration, r.distance_km] for r in reversed(rows)]
+
+
+def _km_after(db: Session, bike_id: int, replaced: date) -> float:
+    ride = models.Ride.__table__
+    total = db.execute(
+        select(func.sum(ride.c.distance_km)).where(
+            ride.c.bike_id == bike_id,
+            ride.c.end_time > datetime.combine(replaced, time()),
+        )
+    ).scalar()
+    return total or 0.0
+
+
+def _get_or_create(db: Session, bike_ids: Iterable[int]) -> Dict[int, models.BikeFeatures]:
+    bike_ids = set(bike_ids)
+    existing = {
+        f.bike_id: f
+        for f in db.query(models.BikeFeatures).filter(models.BikeFeatures.bike_id.in_(bike_ids))
+    }
+    for bike_id in bike_ids - existing.keys():
+        features = models.BikeFeatures(bike_id=bike_id, km_since_service=0.0)
+        _set_window(features, [])
+        db.add(features)
+        existing[bike_id] = features
+    return existing
+
+
+def apply_rides(db: Session, rides) -> None:
+    """Fold newly inserted rides into their bikes' features.
+
+    ``rides`` must already be flushed: a ride that starts before the newest
+    ride in a bike's window triggers a re-read of that bike's last rides.
+    """
+    by_bike = defaultdict(list)
+    for ride in rides:
+        by_bike[ride.bike_id].append(ride)
+
+    now = datetime.now()
+    store = _get_or_create(db, by_bike)
+    for bike_id, bike_rides in by_bike.items():
+        features = store[bike_id]
+        window = _get_window(features)
+        out_of_order = False
+        for ride in sorted(bike_rides, key=lambda r: (r.start_time, r.ride_id or 0)):
+            if after_service(ride.end_time, features.last_replaced_date):
+                features.km_since_service = (features.km_since_service or 0) + (ride.distance_km or 0)
+            if features.last_ride_start_time is None or ride.start_time >= features.last_ride_start_time:
+                window.append([ride.avg_vibration, ride.distance_km])
+                features.last_ride_start_time = ride.start_time
+            else:
+                out_of_order = True
+        if out_of_order:
+            window = _load_window(db, bike_id)
+        _set_window(features, window)
+        features.updated_at = now
+
+
+def apply_maintenance(db: Session, records) -> None:
+    """Fold newly inserted maintenance records into their bikes' features"""
+    now = datetime.now()
+    store = _get_or_create(db, {r.bike_id for r in records})
+    for record in sorted(records, key=lambda r: to_date(r.maintenance_date) or date.min):
+        features = store[record.bike_id]
+        maintenance_date = to_date(record.maintenance_date)
+        if maintenance_date is None:
+            continue
+        if features.last_maintenance_date is None or maintenance_date > features.last_maintenance_date:
+            features.last_maintenance_date = maintenance_date
+        if record.action == "replaced" and (
+            features.last_replaced_date is None or maintenance_date > features.last_replaced_date
+        ):
+            features.last_replaced_date = maintenance_date
+            # Only this bike's rides after the replacement are summed
+            features.km_since_service = _km_after(db, record.bike_id, maintenance_date)
+        features.updated_at = now
+
+
+def compute_features(db: Session, batch_size: int = 10000) -> Dict[int, dict]:
+    """Recompute every bike's features from raw rides and maintenance records.
+
+    Rides are streamed in (bike_id, start_time) order so memory stays bounded
+    by the number of bikes, not rides. Archived rides are read before the
+    live table.
+    """
+    maintenance = models.MaintenanceRecord.__table__
+    ride = models.Ride.__table__
+
+    computed: Dict[int, dict] = {}
+
+    def blank():
+        return {
+            "km_since_service": 0.0,
+            "last_maintenance_date": None,
+            "last_replaced_date": None,
+            "window": deque(maxlen=RECENT_RIDES_WINDOW),
+            "last_ride_start_time": None,
+        }
+
+    for row in db.execute(
+        select(
+            maintenance.c.bike_id,
+            type_coerce(maintenance.c.maintenance_date, String).label("maintenance_date"),
+            maintenance.c.action,
+        )
+    ):
+        maintenance_date = to_date(row.maintenance_date)
+        if maintenance_date is None:
+            continue
+        entry = computed.setdefault(row.bike_id, blank())
+        if entry["last_maintenance_date"] is None or maintenance_date > entry["last_maintenance_date"]:
+            entry["last_maintenance_date"] = maintenance_date
+        if row.action == "replaced" and (
+            entry["last_replaced_date"] is None or maintenance_date > entry["last_replaced_date"]
+        ):
+            entry["last_replaced_date"] = maintenance_date
+
+    # Archived rides (ride_archive.py) are folded in first; imported here
+    # because ride_archive depends on this module through training_features
+    from ride_archive import archived_ride_summary
+
+    replaced = {bike_id: entry["last_replaced_date"] for bike_id, entry in computed.items()}
+    for bike_id, archived in archived_ride_summary(db, replaced, RECENT_RIDES_WINDOW).items():
+        entry = computed.setdefault(bike_id, blank())
+        entry["km_since_service"] += archived["km_since_service"]
+        entry["window"].extend(archived["window"])
+        entry["last_ride_start_time"] = archived["last_ride_start_time"]
+
+    rides = db.execute(
+        select(
+            ride.c.bike_id,
+            ride.c.start_time,
+            ride.c.end_time,
+            ride.c.distance_km,
+            ride.c.avg_vibration,
+        )
+        .order_by(ride.c.bike_id, ride.c.start_time, ride.c.ride_id)
+        .execution_options(yield_per=batch_size)
+    )
+    for row in rides:
+        entry = computed.setdefault(row.bike_id, blank())
+        if after_service(row.end_time, entry["last_replaced_date"]):
+            entry["km_since_service"] += row.distance_km or 0
+        entry["window"].append([row.avg_vibration, row.distance_km])
+        entry["last_ride_start_time"] = row.start_time
+
+    result = {}
+    for bike_id, entry in computed.items():
+        features = models.BikeFeatures(
+            bike_id=bike_id,
+            km_since_service=entry["km_since_service"],
+            last_maintenance_date=entry["last_maintenance_date"],
+            last_replaced_date=entry["last_replaced_date"],
+            last_ride_start_time=entry["last_ride_start_time"],
+        )
+        _set_window(features, list(entry["window"]))
+        result[bike_id] = {
+            column.name: getattr(features, column.name)
+            for column in models.BikeFeatures.__table__.columns
+        }
+    return result
+
+
+def rebuild(db: Session) -> int:
+    """Replace the whole feature store with a full recomputation"""
+    computed = compute_features(db)
+    now = datetime.now()
+    for row in computed.values():
+        row["updated_at"] = now
+    db.execute(delete(models.BikeFeatures))
+    if computed:
+        db.execute(models.BikeFeatures.__table__.insert(), list(computed.values()))
+    db.commit()
+    return len(computed)
+
+
+def _matches(stored, expected) -> bool:
+    if isinstance(stored, float) or isinstance(expected, float):
+        if stored is None or expected is None:
+            return stored is expected
+        return math.isclose(stored, expected, rel_tol=1e-9, abs_tol=1e-9)
+    return stored == expected
+
+
+def verify(db: Session) -> List[dict]:
+    """Compare the incremental store against a full recomputation.
+
+    Returns one entry per mismatching (bike_id, field); an empty list means the
+    store is consistent.
+    """
+    expected = compute_features(db)
+    stored = {
+        row.bike_id: row
+        for row in db.execute(select(models.BikeFeatures.__table__))
+    }
+
+    mismatches = []
+    for bike_id in sorted(expected.keys() | stored.keys()):
+        if bike_id not in stored or bike_id not in expected:
+            mismatches.append({
+                "bike_id": bike_id,
+                "field": "row",
+                "stored": bike_id in stored,
+                "expected": bike_id in expected,
+            })
+            continue
+        for field in FEATURE_FIELDS:
+            stored_value = getattr(stored[bike_id], field)
+            expected_value = expected[bike_id][field]
+            if not _matches(stored_value, expected_value):
+                mismatches.append({
+                    "bike_id": bike_id,
+                    "field": field,
+                    "stored": stored_value,
+                    "expected": expected_value,
+                })
+    return mismatches
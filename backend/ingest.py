@@ -0,0 +1,285 @@
+import csv
+import io
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, field_validator, model_validator
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+import feature_store
+import rollups
+from cache import result_cache
+from location_index import location_index
+import models
+from database import SessionLocal
+
+# Flush the buffer once it holds this many rides ...
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "5000"))
+# ... or once the oldest buffered ride has waited this long
+INGEST_MAX_DELAY_MS = int(os.getenv("INGEST_MAX_DELAY_MS", "50"))
+
+RIDE_COLUMNS = [
+    "bike_id",
+    "start_time",
+    "end_time",
+    "start_lat",
+    "start_lon",
+    "end_lat",
+    "end_lon",
+    "distance_km",
+    "avg_vibration",
+    "weather_condition",
+    "created_at",
+]
+
+
+class RideIn(BaseModel):
+    bike_id: int
+    start_time: datetime
+    end_time: datetime
+    start_lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    start_lon: Optional[float] = Field(default=None, ge=-180, le=180)
+    end_lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    end_lon: Optional[float] = Field(default=None, ge=-180, le=180)
+    distance_km: float = Field(ge=0)
+    avg_vibration: Optional[float] = Field(default=None, ge=0)
+    weather_condition: Optional[str] = None
+
+    @field_validator("start_time", "end_time")
+    @classmethod
+    def naive_utc(cls, value: datetime) -> datetime:
+        # Stored times are naive; "...Z" / "+02:00" would not compare with them
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    @model_validator(mode="after")
+    def check_times(self):
+        if self.end_time < self.start_time:
+            raise ValueError("end_time must not be before start_time")
+        return self
+
+
+rides_adapter = TypeAdapter(List[RideIn])
+
+
+def prepare_rides(db: Session, payload: List[dict]):
+    """Validate a batch of raw rides and drop rides for unknown bikes.
+
+    The whole batch is validated in one pass and bike ids are checked with a
+    single query. Returns ``(rides, rejected)`` where ``rejected`` holds
+    ``{"index", "error"}`` dicts indexed into ``payload``.
+    """
+    try:
+        rides = rides_adapter.validate_python(payload)
+        indices = list(range(len(payload)))
+        rejected = []
+    except ValidationError:
+        # Fall back to per-row validation to report which rows are invalid
+        rides, indices, rejected = [], [], []
+        for index, item in enumerate(payload):
+            try:
+                rides.append(RideIn.model_validate(item))
+                indices.append(index)
+            except ValidationError as e:
+                rejected.append({"index": index, "error": e.errors(include_url=False)[0]["msg"]})
+
+    bike_ids = {ride.bike_id for ride in rides}
+    known = set(
+        db.execute(
+            select(models.Bike.bike_id).where(models.Bike.bike_id.in_(bike_ids))
+        ).scalars()
+    ) if bike_ids else set()
+
+    accepted = []
+    for index, ride in zip(indices, rides):
+        if ride.bike_id in known:
+            accepted.append(ride)
+        else:
+            rejected.append({"index": index, "error": f"Unknown bike_id {ride.bike_id}"})
+    rejected.sort(key=lambda r: r["index"])
+    return accepted, rejected
+
+
+def _copy_rides(db: Session, rows: List[dict]) -> None:
+    """Stream rows into PostgreSQL with COPY through the psycopg2 cursor"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["" if row[c] is None else row[c] for c in RIDE_COLUMNS])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY rides ({', '.join(RIDE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def write_rides(db: Session, rides: List[RideIn]) -> int:
+    """Insert rides and update bike distances and features in one transaction"""
+    if not rides:
+        return 0
+
+    now = datetime.now()
+    rows = [{**ride.model_dump(), "created_at": now} for ride in rides]
+
+    if db.get_bind().dialect.name == "postgresql":
+        _copy_rides(db, rows)
+    else:
+        db.execute(models.Ride.__table__.insert(), rows)
+
+    distance_by_bike: Dict[int, float] = defaultdict(float)
+    for row in rows:
+        distance_by_bike[row["bike_id"]] += row["distance_km"] or 0
+
+    bikes = models.Bike.__table__
+    db.execute(
+        update(bikes)
+        .where(bikes.c.bike_id == bindparam("b_id"))
+        .values(total_distance_km=func.coalesce(bikes.c.total_distance_km, 0) + bindparam("delta")),
+        [{"b_id": bike_id, "delta": delta} for bike_id, delta in distance_by_bike.items()],
+    )
+
+    feature_store.apply_rides(db, [SimpleNamespace(ride_id=None, **row) for row in rows])
+    rollups.apply_rides(db, rows)
+    db.commit()
+    location_index.apply_rides(rows)
+    result_cache.invalidate_bikes(distance_by_bike, tables=("rides", "bikes"))
+    return len(rows)
+
+
+class MicroBatcher:
+    """Buffers rides from concurrent requests and writes them in large batches.
+
+    A background thread flushes the buffer when it reaches ``max_rows`` or when
+    the oldest buffered ride is ``max_delay_ms`` old. ``submit`` returns a
+    Future resolved with the number of rows written once its rides are
+    committed.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_rows: int = INGEST_BATCH_SIZE,
+                 max_delay_ms: int = INGEST_MAX_DELAY_MS):
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self._pending: List[tuple] = []
+        self._pending_rows = 0
+        self._oldest: Optional[float] = None
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.rows_written = 0
+        self.flushes = 0
+
+    def submit(self, rides: List[RideIn]) -> Future:
+        future: Future = Future()
+        if not rides:
+            future.set_result(0)
+            return future
+        with self._condition:
+            if self._closed:
+                if self._thread is not None and self._thread.is_alive():
+                    raise RuntimeError("Ride batcher is closing")
+                # Closed by an earlier app lifespan; start a new thread
+                self._closed = False
+                self._thread = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ride-batcher", daemon=True)
+                self._thread.start()
+            self._pending.append((rides, future))
+            self._pending_rows += len(rides)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._condition.notify()
+        return future
+
+    def _take(self):
+        """Wait for a flush condition and detach the pending buffer"""
+        with self._condition:
+            while True:
+                if self._pending and (self._closed or self._pending_rows >= self.max_rows):
+                    break
+                if self._pending:
+                    remaining = self._oldest + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                elif self._closed:
+                    return None
+                else:
+                    self._condition.wait()
+            pending = self._pending
+            self._pending, self._pending_rows, self._oldest = [], 0, None
+            return pending
+
+    def _run(self) -> None:
+        while True:
+            pending = self._take()
+            if pending is None:
+                return
+            self._flush(pending)
+
+    def _write(self, rides: List[RideIn]) -> None:
+        db = self.session_factory()
+        try:
+            write_rides(db, rides)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self.rows_written += len(rides)
+        self.flushes += 1
+
+    def _flush(self, pending) -> None:
+        try:
+            self._write([ride for batch, _ in pending for ride in batch])
+        except Exception as e:
+            if len(pending) == 1:
+                pending[0][1].set_exception(e)
+                return
+            # Retry each request's batch on its own, so one bad batch only
+            # fails its own request
+            for batch, future in pending:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(len(batch))
+            return
+        for batch, future in pending:
+            future.set_result(len(batch))
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flush whatever is buffered and stop the background thread; the
+        next ``submit`` starts a new one"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._condition:
+            pending_rows = self._pending_rows
+        return {
+            "rows_written": self.rows_written,
+            "flushes": self.flushes,
+            "pending_rows": pending_rows,
+            "max_rows": self.max_rows,
+            "max_delay_ms": int(self.max_delay * 1000),
+        }
+
+
+ride_batcher = MicroBatcher()
@@ -0,0 +1,156 @@
+import base64
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, Optional
+
+import orjson
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Table, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import not_modified, result_cache, validator_headers
+from database import SessionLocal
+from response_formats import VARY, compress_stream, formatted_response, negotiate_encoding, negotiate_format
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+# Rows fetched per round trip from the server-side cursor when streaming
+STREAM_BATCH_SIZE = 1000
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def encode_cursor(value: Any) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    """The last primary key of the previous page; the listed tables all have integer keys"""
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # bool is an int subclass, but never a key
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value
+
+
+def row_to_dict(row) -> Dict[str, Any]:
+    """Serialize a table row the way the list endpoints always have"""
+    return {
+        key: value.isoformat() if isinstance(value, (date, datetime)) else value
+        for key, value in row._mapping.items()
+    }
+
+
+def list_query(
+    table: Table,
+    after: Optional[Any] = None,
+    bike_id: Optional[int] = None,
+    time_column: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """Filtered query over ``table`` ordered by its primary key (keyset order)"""
+    key = table.primary_key.columns.values()[0]
+    query = select(table).order_by(key)
+    if after is not None:
+        query = query.where(key > after)
+    if bike_id is not None:
+        query = query.where(table.c.bike_id == bike_id)
+    if time_column is not None:
+        column = table.c[time_column]
+        if since is not None:
+            query = query.where(column >= since)
+        if until is not None:
+            query = query.where(column < until)
+    return query
+
+
+def _cursor_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+async def fetch_page(db: AsyncSession, query, limit: int):
+    """Fetch one page and return [column names, column-major values, next_cursor]"""
+    result = await db.execute(query.limit(limit + 1))
+    columns = list(result.keys())
+    rows = result.all()
+    next_cursor = encode_cursor(_cursor_value(rows[limit - 1][0])) if len(rows) > limit else None
+    data = [list(values) for values in zip(*rows[:limit])] or [[] for _ in columns]
+    return [columns, data, next_cursor]
+
+
+def stream_rows(query, fmt: str) -> Iterator[str]:
+    """Yield NDJSON or CSV lines from a server-side cursor.
+
+    Uses its own session since the request-scoped one is closed before a
+    streaming response is sent.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(result.keys())
+            for partition in result.partitions():
+                for row in partition:
+                    writer.writerow(row_to_dict(row).values())
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            # orjson writes dates and times as ISO 8601 itself
+            for partition in result.partitions():
+                yield b"".join(orjson.dumps(row._asdict()) + b"\n" for row in partition)
+    finally:
+        db.close()
+
+
+async def list_response(
+    db: AsyncSession,
+    request: Request,
+    query,
+    limit: int,
+    fmt: Optional[str],
+    table: str,
+    bike_id: Optional[int] = None,
+):
+    """Return a cached page (with next-cursor headers) or a streaming export.
+
+    The page is sent as JSON, MessagePack or Arrow (``format`` or the Accept
+    header) and compressed when the client accepts gzip or brotli.
+    """
+    if fmt in STREAM_FORMATS:
+        encoding = negotiate_encoding(request)
+        headers = {"Vary": VARY, **({"Content-Encoding": encoding} if encoding else {})}
+        return StreamingResponse(
+            compress_stream(stream_rows(query, fmt), encoding), media_type=STREAM_FORMATS[fmt], headers=headers
+        )
+    fmt = negotiate_format(request, fmt, extra=STREAM_FORMATS)
+
+    query_string = str(request.url.query)
+    etag, last_modified = result_cache.list_validators(table, bike_id, f"{query_string}:{fmt}")
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers={**validator_headers(etag, last_modified), "Vary": VARY})
+
+    key = result_cache.page_key(table, bike_id, query_string)
+    page = result_cache.get_page(key)
+    if page is None:
+        page = await fetch_page(db, query, limit)
+        result_cache.store_page(key, page)
+    columns, data, next_cursor = page
+    headers = validator_headers(etag, last_modified)
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    types = [column.type for column in query.selected_columns]
+    return await formatted_response(request, fmt, columns=columns, data=data, types=types, headers=headers)
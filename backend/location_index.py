@@ -0,0 +1,256 @@
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, func, select
+
+import models
+from cache import result_cache
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Side of a grid cell; a query looks at the cells overlapping its circle's
+# bounding box, so cells around the typical search radius work best
+LOCATION_INDEX_CELL_KM = float(os.getenv("LOCATION_INDEX_CELL_KM", "1"))
+# Positions are re-read in the background once this old, which picks up rides
+# written by other processes (other API workers, scripts)
+LOCATION_INDEX_MAX_AGE_SECONDS = float(os.getenv("LOCATION_INDEX_MAX_AGE_SECONDS", "300"))
+
+# Largest radius accepted by GET /predictions/nearby
+MAX_NEARBY_RADIUS_KM = 100
+
+# Mean Earth radius, as used by the haversine formula
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in degrees"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, Optional[float], Optional[float]]:
+    """(min_lat, max_lat, min_lon, max_lon) enclosing every point within
+    ``radius_km``. The longitudes are None when the box spans every
+    longitude (it reaches a pole or crosses the antimeridian).
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    min_lat, max_lat = lat - math.degrees(angle), lat + math.degrees(angle)
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), None, None
+    # Widest longitude offset of a circle on the sphere, reached north of its centre
+    delta = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(lat)))))
+    if lon - delta < -180 or lon + delta >= 180:
+        return min_lat, max_lat, None, None
+    return min_lat, max_lat, lon - delta, lon + delta
+
+
+def last_position_query():
+    """End position of each bike's latest ride that recorded one"""
+    ride = models.Ride.__table__
+    located = and_(ride.c.end_lat.isnot(None), ride.c.end_lon.isnot(None))
+    latest = (
+        select(ride.c.bike_id, func.max(ride.c.start_time).label("start_time"))
+        .where(located)
+        .group_by(ride.c.bike_id)
+        .subquery()
+    )
+    return (
+        select(ride.c.bike_id, ride.c.start_time, ride.c.end_lat, ride.c.end_lon)
+        .join(latest, and_(ride.c.bike_id == latest.c.bike_id, ride.c.start_time == latest.c.start_time))
+        .where(located)
+        # Rides sharing a start time: the last one written wins
+        .order_by(ride.c.ride_id)
+    )
+
+
+class LocationIndex:
+    """Last known position of every bike on a fixed lat/lon grid.
+
+    A bike's position is where its latest ride ended. Rides written by this
+    process are applied as they are committed, and the whole index is
+    re-read on a background thread when it gets older than ``max_age``
+    seconds. ``nearby`` only touches the grid cells overlapping the search
+    circle and checks each bike in them with the haversine distance.
+    """
+
+    def __init__(self, session_factory=SessionLocal, cell_km: float = LOCATION_INDEX_CELL_KM,
+                 max_age: float = LOCATION_INDEX_MAX_AGE_SECONDS):
+        self.session_factory = session_factory
+        self.cell = cell_km / KM_PER_DEGREE
+        self.max_age = max_age
+        # bike_id -> (lat, lon, start time of the ride that put it there)
+        self._positions: Dict[int, Tuple[float, float, datetime]] = {}
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+        self._loaded_at: Optional[float] = None
+        # Rides applied while a refresh reads the database, replayed onto its result
+        self._replay: Optional[List[Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self.full_loads = 0
+        self.rides_applied = 0
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def _key(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell), math.floor(lon / self.cell)
+
+    def _move(self, positions, cells, bike_id: int, lat: float, lon: float, when: datetime) -> None:
+        old = positions.get(bike_id)
+        if old is not None:
+            if old[2] is not None and when is not None and when < old[2]:
+                return
+            key = self._key(old[0], old[1])
+            cell = cells[key]
+            cell.discard(bike_id)
+            if not cell:
+                del cells[key]
+        positions[bike_id] = (lat, lon, when)
+        cells.setdefault(self._key(lat, lon), set()).add(bike_id)
+
+    def refresh(self) -> None:
+        """Re-read every bike's position"""
+        started = time.monotonic()
+        with self._lock:
+            self._replay = []
+        db = self.session_factory()
+        try:
+            rows = db.execute(last_position_query()).all()
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        finally:
+            db.close()
+        positions: Dict[int, Tuple[float, float, datetime]] = {}
+        cells: Dict[Tuple[int, int], Set[int]] = {}
+        for row in rows:
+            self._move(positions, cells, row.bike_id, row.end_lat, row.end_lon, row.start_time)
+        with self._lock:
+            for ride in self._replay:
+                self._move(positions, cells, ride["bike_id"], ride["end_lat"], ride["end_lon"], ride.get("start_time"))
+            self._positions, self._cells, self._replay = positions, cells, None
+        self._loaded_at = started
+        self.full_loads += 1
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Location index refresh failed")
+        finally:
+            self._refreshing = False
+
+    def invalidate(self, bike_ids: Optional[Iterable[int]]) -> None:
+        """Drop the index when every table may have changed; new rides of
+        single bikes arrive through ``apply_rides`` instead"""
+        if bike_ids is None:
+            self._loaded_at = None
+
+    @property
+    def pending(self) -> bool:
+        """True if ``nearby`` needs ``load`` (a database read) first"""
+        return self._loaded_at is None
+
+    def load(self) -> None:
+        with self._load_lock:
+            if self._loaded_at is None:
+                self.refresh()
+
+    def maybe_refresh(self) -> None:
+        """Start a background refresh when the index is older than max_age"""
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at < self.max_age:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="location-index-refresh", daemon=True).start()
+
+    def apply_rides(self, rides: Iterable[Dict[str, Any]]) -> None:
+        """Move bikes to where newly committed rides ended"""
+        located = [ride for ride in rides if ride.get("end_lat") is not None and ride.get("end_lon") is not None]
+        with self._lock:
+            if self._replay is not None:
+                self._replay.extend(located)
+            if self._loaded_at is None:
+                return
+            for ride in located:
+                self._move(self._positions, self._cells, ride["bike_id"], ride["end_lat"], ride["end_lon"],
+                           ride.get("start_time"))
+            self.rides_applied += len(located)
+
+    def _candidate_cells(self, lat: float, lon: float, radius_km: float) -> List[Set[int]]:
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+        row_range = (math.floor(min_lat / self.cell), math.floor(max_lat / self.cell))
+        if min_lon is None:
+            column_range = None
+            box_cells = math.inf
+        else:
+            column_range = (math.floor(min_lon / self.cell), math.floor(max_lon / self.cell))
+            box_cells = (row_range[1] - row_range[0] + 1) * (column_range[1] - column_range[0] + 1)
+        cells = self._cells
+        if box_cells <= len(cells):
+            return [
+                cells[key]
+                for key in ((row, column) for row in range(row_range[0], row_range[1] + 1)
+                            for column in range(column_range[0], column_range[1] + 1))
+                if key in cells
+            ]
+        # A box larger than the occupied part of the grid: walk the occupied cells
+        return [
+            bikes for (row, column), bikes in cells.items()
+            if row_range[0] <= row <= row_range[1]
+            and (column_range is None or column_range[0] <= column <= column_range[1])
+        ]
+
+    def nearby(self, lat: float, lon: float, radius_km: float) -> List[Dict[str, Any]]:
+        """Bikes within ``radius_km`` of a point, nearest first. Call ``load``
+        first when ``pending`` says so."""
+        self.maybe_refresh()
+        found = []
+        with self._lock:
+            positions = self._positions
+            for bikes in self._candidate_cells(lat, lon, radius_km):
+                for bike_id in bikes:
+                    bike_lat, bike_lon, when = positions[bike_id]
+                    distance = haversine_km(lat, lon, bike_lat, bike_lon)
+                    if distance <= radius_km:
+                        found.append((distance, bike_id, bike_lat, bike_lon, when))
+        found.sort()
+        return [
+            {
+                "bike_id": bike_id,
+                "distance_km": round(distance, 3),
+                "lat": bike_lat,
+                "lon": bike_lon,
+                "last_seen_at": when.isoformat() if when is not None else None,
+            }
+            for distance, bike_id, bike_lat, bike_lon, when in found
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        loaded_at = self._loaded_at
+        return {
+            "bikes": len(self._positions),
+            "cells": len(self._cells),
+            "cell_km": round(self.cell * KM_PER_DEGREE, 3),
+            "age_seconds": None if loaded_at is None else time.monotonic() - loaded_at,
+            "max_age_seconds": self.max_age,
+            "full_loads": self.full_loads,
+            "rides_applied": self.rides_applied,
+        }
+
+
+location_index = LocationIndex()
+result_cache.add_listener(location_index.invalidate)
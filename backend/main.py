@@ -1,205 +1,501 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Any, Optional, Union
 from datetime import datetime, date
 import models
-from database import engine, get_db, test_db_connection
+from database import (
+    get_db, get_async_db, dispose_async_engine, test_db_connection, SessionLocal, run_migrations,
+)
+from predictions import prediction_variant, PRIORITY_LEVELS
+from cache import result_cache, not_modified, validator_headers
+from response_formats import formatted_response, negotiate_format
+import feature_store
+import rollups
+import analytics
+from listing import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, list_query, list_response
+from ingest import ride_batcher, prepare_rides, INGEST_BATCH_SIZE
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+from contextlib import asynccontextmanager
+from model_serving import model_server, PREDICTION_MODES, DEFAULT_PREDICTION_MODE
+from feature_index import feature_index, validate_overrides, MAX_SCORE_BATCH
+from location_index import location_index, MAX_NEARBY_RADIUS_KM
+from prediction_scheduler import prediction_scheduler, get_precomputed_predictions_async, PREDICTION_SCHEDULER
+from prediction_stream import prediction_broadcaster
+from drift_monitor import drift_monitor
+from work_queue import work_queue, MAX_PEEK, WORK_QUEUE_SHIFT_MINUTES
+from metrics import metrics, MetricsMiddleware, METRICS_ENABLED
+from pydantic import BaseModel, Field
 import json
+import logging
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
+router = APIRouter()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://localhost:8000", "http://localhost:8080"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    allow_origin_regex=r"http://localhost:\d+",  # Allow any localhost port
-)
+metrics.add_gauge("result_cache_hits", "Result cache hits since start", lambda: {
+    "predictions": result_cache.prediction_hits, "lists": result_cache.list_hits,
+}, label="kind")
+metrics.add_gauge("result_cache_misses", "Result cache misses since start", lambda: {
+    "predictions": result_cache.prediction_misses, "lists": result_cache.list_misses,
+}, label="kind")
+metrics.add_gauge("prediction_scheduler_backlog", "Dirty bikes left in the current scheduler run",
+                  lambda: prediction_scheduler.backlog)
+metrics.add_gauge("prediction_stream_clients", "Connected prediction stream clients",
+                  lambda: prediction_broadcaster.clients)
+metrics.add_gauge("feature_index_bikes", "Bikes held in the in-memory feature index", lambda: len(feature_index))
+metrics.add_gauge("location_index_bikes", "Bikes with a known position in the location index",
+                  lambda: len(location_index))
+metrics.add_gauge("model_feature_psi", "Population stability index of each feature against the training baseline",
+                  drift_monitor.feature_psi, label="feature")
+metrics.add_gauge("model_rolling_quality", "Precision and recall of high-priority scores over the drift window",
+                  lambda: {k: v for k, v in drift_monitor.outcomes().items() if k in ("precision", "recall")},
+                  label="metric")
+metrics.add_gauge("work_queue_jobs", "Unclaimed maintenance jobs in the work queue", work_queue.sizes,
+                  label="component")
+metrics.add_gauge("ingest_pending_rows", "Rides buffered by the ingest micro-batcher",
+                  lambda: ride_batcher.stats()["pending_rows"])
 
-@app.get("/")
+@router.get("/")
 def read_root():
     return {"message": "Bike Predictive Maintenance API"}
 
-@app.get("/health")
-def health_check(db: Session = Depends(get_db)):
+@router.get("/health")
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     """Health check endpoint with database verification"""
     try:
         from sqlalchemy import text
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         return {"status": "healthy", "database": "connected"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
-@app.get("/bikes", response_model=List[Dict[str, Any]])
-def get_bikes(db: Session = Depends(get_db)):
-    """Get all bikes data"""
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Request, query and model timings in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    """Report result cache hits, misses and evictions"""
+    return result_cache.stats()
+
+@router.get("/model")
+def get_model_status():
+    """Report which prediction model is currently being served"""
+    return model_server.status()
+
+@router.get("/model/drift")
+async def get_model_drift():
+    """Rolling precision/recall of the served model against later replacements,
+    feature PSI against its training baseline and the retraining state"""
+    await run_in_threadpool(drift_monitor.poll)
+    return JSONResponse(drift_monitor.report())
+
+@router.get("/bikes", response_model=List[Dict[str, Any]])
+async def get_bikes(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    format: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get bikes, one keyset page at a time (JSON, MessagePack or Arrow) or streamed as NDJSON/CSV"""
     try:
-        bikes = db.query(models.Bike).all()
-        return [
-            {
-                "bike_id": bike.bike_id,
-                "status": bike.status,
-                "purchased_date": bike.purchased_date.isoformat() if bike.purchased_date else None,
-                "last_serviced_date": bike.last_serviced_date.isoformat() if bike.last_serviced_date else None,
-                "total_distance_km": bike.total_distance_km,
-                "created_at": bike.created_at.isoformat() if bike.created_at else None
-            }
-            for bike in bikes
-        ]
+        after = decode_cursor(cursor) if cursor else None
+        query = list_query(models.Bike.__table__, after=after)
+        return await list_response(db, request, query, limit, format, "bikes")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching bikes: {str(e)}")
 
-@app.get("/rides", response_model=List[Dict[str, Any]])
-def get_rides(db: Session = Depends(get_db)):
-    """Get all rides data"""
+@router.get("/rides", response_model=List[Dict[str, Any]])
+async def get_rides(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    bike_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    format: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get rides filtered by bike and start_time range, paged or streamed"""
     try:
-        rides = db.query(models.Ride).all()
-        return [
-            {
-                "ride_id": ride.ride_id,
-                "bike_id": ride.bike_id,
-                "start_time": ride.start_time.isoformat() if ride.start_time else None,
-                "end_time": ride.end_time.isoformat() if ride.end_time else None,
-                "distance_km": ride.distance_km,
-                "avg_vibration": ride.avg_vibration,
-                "weather_condition": ride.weather_condition,
-                "created_at": ride.created_at.isoformat() if ride.created_at else None
-            }
-            for ride in rides
-        ]
+        after = decode_cursor(cursor) if cursor else None
+        query = list_query(
+            models.Ride.__table__, after=after, bike_id=bike_id,
+            time_column="start_time", since=start, until=end,
+        )
+        return await list_response(db, request, query, limit, format, "rides", bike_id)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching rides: {str(e)}")
 
-@app.get("/maintenance", response_model=List[Dict[str, Any]])
-def get_maintenance_records(db: Session = Depends(get_db)):
-    """Get all maintenance records"""
+def prepare_ride_batch(items: List[Dict[str, Any]]):
+    """prepare_rides in its own session, for running in the threadpool"""
+    db = SessionLocal()
     try:
-        records = db.query(models.MaintenanceRecord).all()
-        return [
-            {
-                "record_id": record.record_id,
-                "bike_id": record.bike_id,
-                "maintenance_date": record.maintenance_date.isoformat() if record.maintenance_date else None,
-                "component": record.component,
-                "action": record.action,
-                "associated_ride_id": record.associated_ride_id,
-                "created_at": record.created_at.isoformat() if record.created_at else None
-            }
-            for record in records
-        ]
+        return prepare_rides(db, items)
+    finally:
+        db.close()
+
+@router.post("/rides/batch")
+async def ingest_rides(rides: List[Dict[str, Any]], response: Response, wait: bool = True):
+    """Ingest a batch of completed rides through the micro-batcher"""
+    accepted, rejected = await run_in_threadpool(prepare_ride_batch, rides)
+    future = ride_batcher.submit(accepted)
+    if not wait:
+        response.status_code = 202
+        return {"accepted": len(accepted), "rejected": rejected, "written": None}
+    try:
+        # Awaited on the event loop, so no threadpool thread waits out the flush
+        written = await asyncio.wrap_future(future)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error writing rides: {str(e)}")
+    return {"accepted": len(accepted), "rejected": rejected, "written": written}
+
+@router.post("/rides/stream")
+async def ingest_ride_stream(request: Request):
+    """Ingest newline-delimited JSON rides (application/x-ndjson)"""
+    accepted = 0
+    rejected = []
+    futures = []
+    chunk, chunk_lines = [], []
+
+    async def submit():
+        nonlocal accepted, chunk, chunk_lines
+        rides, errors = await run_in_threadpool(prepare_ride_batch, chunk)
+        rejected.extend({"line": chunk_lines[e["index"]], "error": e["error"]} for e in errors)
+        accepted += len(rides)
+        futures.append(asyncio.wrap_future(ride_batcher.submit(rides)))
+        chunk, chunk_lines = [], []
+
+    def parse(raw, line_number):
+        if not raw.strip():
+            return
+        try:
+            chunk.append(json.loads(raw))
+            chunk_lines.append(line_number)
+        except ValueError as e:
+            rejected.append({"line": line_number, "error": f"Invalid JSON: {e}"})
+
+    line_number = 0
+    buffer = b""
+    async for data in request.stream():
+        *lines, buffer = (buffer + data).split(b"\n")
+        for raw in lines:
+            line_number += 1
+            parse(raw, line_number)
+            if len(chunk) >= INGEST_BATCH_SIZE:
+                await submit()
+    parse(buffer, line_number + 1)
+    if chunk:
+        await submit()
+
+    try:
+        written = sum(await asyncio.gather(*futures))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error writing rides: {str(e)}")
+    rejected.sort(key=lambda r: r["line"])
+    return {"accepted": accepted, "rejected": rejected, "written": written}
+
+@router.get("/rides/ingest-stats")
+def get_ingest_stats():
+    """Report micro-batcher throughput counters"""
+    return ride_batcher.stats()
+
+@router.get("/maintenance", response_model=List[Dict[str, Any]])
+async def get_maintenance_records(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    bike_id: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    format: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get maintenance records filtered by bike and date range, paged or streamed"""
+    try:
+        after = decode_cursor(cursor) if cursor else None
+        query = list_query(
+            models.MaintenanceRecord.__table__, after=after, bike_id=bike_id,
+            time_column="maintenance_date", since=start, until=end,
+        )
+        return await list_response(db, request, query, limit, format, "maintenance", bike_id)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching maintenance records: {str(e)}")
 
-@app.get("/predictions", response_model=List[Dict[str, Any]])
-def get_predictions(db: Session = Depends(get_db)):
-    """Get maintenance predictions based on ride data and maintenance history"""
+def model_for_mode(mode: str):
+    """The model server to score with for a prediction mode (None for thresholds)"""
+    if mode not in PREDICTION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{mode}', expected one of {PREDICTION_MODES}")
+    if mode == "model" and not (model_server.available or model_server.load()):
+        raise HTTPException(
+            status_code=503,
+            detail=f"No model promoted in {model_server.registry.root} and none at {model_server.path}",
+        )
+    return None if mode == "threshold" else model_server
+
+@router.get("/predictions", response_model=List[Dict[str, Any]])
+async def get_predictions(
+    request: Request,
+    mode: str = DEFAULT_PREDICTION_MODE,
+    format: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get maintenance predictions based on ride data and maintenance history.
+
+    Sent as JSON, MessagePack or Arrow (``format`` or the Accept header),
+    compressed when the client accepts gzip or brotli.
+    """
+    server = model_for_mode(mode)
+    fmt = negotiate_format(request, format)
+    if server is not None:
+        server.maybe_reload()
+    variant = prediction_variant(server)
+    etag, last_modified = result_cache.prediction_validators(f"{variant}:{fmt}")
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
     try:
-        # Get all bikes with their rides and maintenance history
-        bikes = db.query(models.Bike).all()
-        
-        if not bikes:
-            return []  # Return empty list instead of error if no bikes
-        
-        predictions = []
-        
-        for bike in bikes:
-            # Get recent rides for this bike
-            recent_rides = db.query(models.Ride).filter(
-                models.Ride.bike_id == bike.bike_id
-            ).order_by(models.Ride.start_time.desc()).limit(10).all()
-            
-            # Calculate prediction metrics with safe defaults
-            total_vibration = 0
-            vibration_count = 0
-            recent_distance = 0
-            
-            for ride in recent_rides:
-                if ride.avg_vibration is not None:
-                    total_vibration += ride.avg_vibration
-                    vibration_count += 1
-                if ride.distance_km is not None:
-                    recent_distance += ride.distance_km
-            
-            avg_vibration = total_vibration / vibration_count if vibration_count > 0 else 0
-            
-            # Safe access to bike attributes
-            total_distance = bike.total_distance_km or 0
-            bike_status = bike.status or "active"
-            
-            # Enhanced prediction logic
-            issues = []
-            confidence = 0.5
-            
-            if avg_vibration > 0.8:
-                priority = "high"
-                issues.extend(["suspension issues", "wheel alignment"])
-                confidence = max(confidence, 0.9)
-            elif avg_vibration > 0.5:
-                priority = "medium"
-                issues.extend(["tire pressure", "general checkup"])
-                confidence = max(confidence, 0.7)
-            
-            if total_distance > 2000:
-                priority = "high"
-                issues.extend(["chain wear", "brake pads", "bearing replacement"])
-                confidence = max(confidence, 0.85)
-            elif total_distance > 1000:
-                priority = "medium" if priority != "high" else "high"
-                issues.extend(["chain lubrication", "brake adjustment"])
-                confidence = max(confidence, 0.65)
-            
-            # If no specific issues found, recommend routine maintenance
-            if not issues:
-                priority = "low"
-                issues = ["routine maintenance"]
-                confidence = 0.5
-            
-            # Remove duplicates
-            issues = list(set(issues))
-            
-            # Safe date formatting
-            last_service = None
-            if bike.last_serviced_date:
-                if isinstance(bike.last_serviced_date, str):
-                    last_service = bike.last_serviced_date
-                else:
-                    last_service = bike.last_serviced_date.isoformat()
-            
-            prediction = {
-                "bike_id": bike.bike_id,
-                "bike_status": bike_status,
-                "total_distance_km": total_distance,
-                "recent_distance_km": recent_distance,
-                "avg_vibration": round(avg_vibration, 2),
-                "maintenance_priority": priority,
-                "predicted_issues": issues,
-                "confidence_score": round(confidence, 2),
-                "recommended_maintenance": f"Check {', '.join(issues)}",
-                "last_service": last_service or "Never",
-                "recent_rides_count": len(recent_rides)
-            }
-            predictions.append(prediction)
-        
-        return predictions
+        # Only bikes without a cached prediction are read, from the table the
+        # scheduler maintains (computed inline when it has no row yet)
+        predictions = await result_cache.aget_predictions(
+            variant, lambda bike_ids: get_precomputed_predictions_async(db, model_server=server, bike_ids=bike_ids)
+        )
+        return await formatted_response(
+            request, fmt, records=predictions, headers=validator_headers(etag, last_modified)
+        )
         
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Prediction error: {error_details}")  # Debug output
+        logger.exception("Prediction error")
         raise HTTPException(status_code=500, detail=f"Error generating predictions: {str(e)}")
     
 
-@app.get("/test-data")
+class ScoreRequest(BaseModel):
+    bike_ids: List[int] = Field(min_length=1, max_length=MAX_SCORE_BATCH)
+    # Feature -> absolute value, or "+200" / "-50" relative to the bike's own
+    overrides: Dict[str, Union[float, str]] = {}
+    mode: str = DEFAULT_PREDICTION_MODE
+
+async def score_bikes(bike_ids: List[int], mode: str, overrides=None) -> List[Dict[str, Any]]:
+    """Score bikes from the in-memory feature index.
+
+    Results hold only JSON-native values, so the endpoints below return them
+    as a JSONResponse and skip FastAPI's (much slower) jsonable_encoder pass.
+    """
+    server = model_for_mode(mode)
+    if feature_index.pending(bike_ids):
+        # Only after writes to these bikes (or on first use) does this hit the database
+        await run_in_threadpool(feature_index.load, bike_ids)
+    return feature_index.score(bike_ids, server, overrides)
+
+@router.get("/predictions/scheduler")
+def get_prediction_scheduler_stats():
+    """Report the last precompute run, its duration and the dirty backlog"""
+    return prediction_scheduler.stats()
+
+@router.get("/predictions/stream")
+async def stream_predictions(request: Request, last_event_id: Optional[int] = None):
+    """Server-sent events with the bikes whose priority, issues or confidence changed.
+
+    Reconnecting clients send Last-Event-ID (EventSource does this itself)
+    and get the events they missed, or a "resync" event when those are gone.
+    """
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+    try:
+        client = prediction_broadcaster.subscribe(last_event_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return StreamingResponse(
+        prediction_broadcaster.events(client),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/predictions/stream/stats")
+def get_prediction_stream_stats():
+    """Report connected stream clients and events published"""
+    return prediction_broadcaster.stats()
+
+@router.get("/predictions/index")
+def get_feature_index_stats():
+    """Report the size and freshness of the in-memory feature index"""
+    return feature_index.stats()
+
+@router.get("/predictions/nearby")
+async def get_nearby_predictions(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(5.0, gt=0, le=MAX_NEARBY_RADIUS_KM, description="Search radius in km"),
+    priority: Optional[str] = Query(None, description="Lowest priority returned: low, medium or high"),
+    limit: Optional[int] = Query(None, ge=1),
+    mode: str = DEFAULT_PREDICTION_MODE,
+):
+    """Predictions for the bikes last seen within ``radius`` km of a point, nearest first.
+
+    Positions come from the in-memory location index and predictions from
+    the feature index, so no rides are read to answer.
+    """
+    if priority is not None and priority not in PRIORITY_LEVELS:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown priority '{priority}', expected one of {list(PRIORITY_LEVELS)}"
+        )
+    model_for_mode(mode)
+    if location_index.pending:
+        await run_in_threadpool(location_index.load)
+    nearby = location_index.nearby(lat, lon, radius)
+    if not nearby:
+        return JSONResponse([])
+    scored = {p["bike_id"]: p for p in await score_bikes([bike["bike_id"] for bike in nearby], mode)}
+    lowest = PRIORITY_LEVELS.index(priority) if priority else 0
+    result = []
+    for bike in nearby:
+        prediction = scored.get(bike["bike_id"])
+        if prediction is None or PRIORITY_LEVELS.index(prediction["maintenance_priority"]) < lowest:
+            continue
+        result.append({**prediction, **bike})
+        if limit is not None and len(result) >= limit:
+            break
+    return JSONResponse(result)
+
+@router.get("/predictions/nearby/stats")
+def get_location_index_stats():
+    """Report the size and freshness of the in-memory location index"""
+    return location_index.stats()
+
+@router.get("/predictions/{bike_id}")
+async def get_bike_prediction(bike_id: int, mode: str = DEFAULT_PREDICTION_MODE):
+    """Maintenance prediction for one bike"""
+    predictions = await score_bikes([bike_id], mode)
+    if not predictions:
+        raise HTTPException(status_code=404, detail=f"Bike {bike_id} not found")
+    return JSONResponse(predictions[0])
+
+@router.post("/predictions/score")
+async def score_predictions(request: ScoreRequest):
+    """Score a batch of bikes, optionally with hypothetical feature values (what-if)"""
+    try:
+        validate_overrides(request.overrides)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    predictions = await score_bikes(request.bike_ids, request.mode, request.overrides)
+    found = {p["bike_id"] for p in predictions}
+    return JSONResponse({
+        "predictions": predictions,
+        "not_found": [bike_id for bike_id in dict.fromkeys(request.bike_ids) if bike_id not in found],
+    })
+
+class ClaimRequest(BaseModel):
+    mechanic: str = Field(min_length=1)
+    # Minutes of work the mechanic can take on, including jobs already claimed
+    capacity_minutes: int = Field(WORK_QUEUE_SHIFT_MINUTES, gt=0, le=24 * 60)
+    components: Optional[List[str]] = None
+    limit: Optional[int] = Field(None, ge=1)
+
+class JobRequest(BaseModel):
+    mechanic: str = Field(min_length=1)
+
+@router.get("/work-queue")
+def peek_work_queue(component: Optional[str] = None, limit: int = Query(20, ge=1, le=MAX_PEEK)):
+    """The most urgent unclaimed maintenance jobs, without claiming them"""
+    try:
+        return JSONResponse(work_queue.peek(component, limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/work-queue/stats")
+def get_work_queue_stats():
+    """Report queued jobs per component and the freshness of the queue"""
+    return work_queue.stats()
+
+@router.get("/work-queue/claims")
+def get_work_queue_claims(mechanic: Optional[str] = None):
+    """Open claims, for every mechanic or one"""
+    return JSONResponse(work_queue.claims(mechanic))
+
+@router.post("/work-queue/claim")
+def claim_work_queue_jobs(request: ClaimRequest):
+    """Claim the most urgent jobs fitting in a mechanic's remaining capacity"""
+    try:
+        return JSONResponse(work_queue.claim(
+            request.mechanic, request.capacity_minutes, request.components, request.limit,
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/work-queue/jobs/{bike_id}/{component}/complete")
+def complete_work_queue_job(bike_id: int, component: str, request: JobRequest):
+    """Close a claimed job: records the replacement and resets the bike's features"""
+    try:
+        return JSONResponse(work_queue.complete(bike_id, component, request.mechanic))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/work-queue/jobs/{bike_id}/{component}/release")
+def release_work_queue_job(bike_id: int, component: str, request: JobRequest):
+    """Hand a claimed job back to the queue"""
+    try:
+        work_queue.release(bike_id, component, request.mechanic)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"released": True, "bike_id": bike_id, "component": component}
+
+@router.get("/analytics/km-per-day")
+async def get_km_per_day(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    bike_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Fleet (or one bike's) rides and distance per day, from the daily rollups"""
+    return JSONResponse(await analytics.km_per_day(db, start, end, bike_id))
+
+@router.get("/analytics/component-failures")
+async def get_component_failures(
+    start: Optional[date] = None, end: Optional[date] = None, db: AsyncSession = Depends(get_async_db)
+):
+    """Replacements per component and per 1000 fleet km"""
+    return JSONResponse(await analytics.component_failures(db, start, end))
+
+@router.get("/analytics/vibration-by-weather")
+async def get_vibration_by_weather(
+    start: Optional[date] = None, end: Optional[date] = None, db: AsyncSession = Depends(get_async_db)
+):
+    """Average ride vibration statistics and histogram per weather condition"""
+    return JSONResponse(await analytics.vibration_by_weather(db, start, end))
+
+@router.get("/analytics/replacement-intervals")
+async def get_replacement_intervals(
+    start: Optional[date] = None, end: Optional[date] = None, db: AsyncSession = Depends(get_async_db)
+):
+    """Mean km ridden between replacements of the same component"""
+    return JSONResponse(await analytics.replacement_intervals(db, start, end))
+
+@router.get("/test-data")
 def create_test_data(db: Session = Depends(get_db)):
     """Create test data for development"""
     try:
         # Clear existing data
+        db.query(models.Prediction).delete()
+        db.query(models.WorkQueueClaim).delete()
+        rollups.clear(db)
+        db.query(models.BikeFeatures).delete()
         db.query(models.MaintenanceRecord).delete()
         db.query(models.Ride).delete()
         db.query(models.Bike).delete()
@@ -262,7 +558,11 @@ def create_test_data(db: Session = Depends(get_db)):
         ]
         
         db.add_all(test_rides)
+        db.flush()
+        feature_store.apply_rides(db, test_rides)
+        rollups.apply_rides(db, test_rides)
         db.commit()
+        result_cache.invalidate_all()
         
         return {
             "message": "Test data created successfully",
@@ -274,7 +574,63 @@ def create_test_data(db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error creating test data: {str(e)}")
 
+_preloaded = False
+
+def preload() -> None:
+    """Get the process ready to serve: migrate the schema, load the model and
+    fill the in-memory feature and location indexes.
+
+    The lifespan hook calls this on startup; scripts/serve.py calls it
+    once in the parent before forking, so the workers share these pages
+    copy-on-write instead of each loading them.
+    """
+    global _preloaded
+    if _preloaded:
+        return
+    # Create or upgrade database tables
+    run_migrations()
+    # Thresholds are used when no model is promoted
+    model_server.load()
+    feature_index.refresh()
+    location_index.refresh()
+    _preloaded = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    preload()
+    if app.state.start_scheduler:
+        prediction_scheduler.start()
+    try:
+        yield
+    finally:
+        prediction_scheduler.stop(timeout=10)
+        await prediction_broadcaster.close()
+        ride_batcher.close(timeout=10)
+        await dispose_async_engine()
+
+def create_app(start_scheduler: bool = PREDICTION_SCHEDULER == "thread") -> FastAPI:
+    """Build the API; nothing touches the database until its lifespan starts"""
+    app = FastAPI(lifespan=lifespan)
+    app.state.start_scheduler = start_scheduler
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000", "http://localhost:8000", "http://localhost:8080"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        allow_origin_regex=r"http://localhost:\d+",  # Allow any localhost port
+    )
+    # Outermost, so the latency includes CORS handling
+    if METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
+    app.include_router(router)
+    return app
+
+# For "uvicorn main:app"; scripts/serve.py builds one per forked worker
+app = create_app()
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     # Test database connection
     test_db_connection()
     
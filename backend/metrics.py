@@ -0,0 +1,284 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Set to false to skip the middleware and query hooks entirely
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Requests slower than this are logged with their query breakdown (0 = off)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+# Statements listed per slow request
+SLOW_REQUEST_TOP_QUERIES = 5
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERIES_PER_REQUEST_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "COPY"}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in items)
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and three additions"""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def totals(self) -> Tuple[float, int]:
+        """Sum and count of every observation across all labels"""
+        with self._lock:
+            return (sum(entry[1] for entry in self._values.values()),
+                    sum(entry[2] for entry in self._values.values()))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Gauge:
+    """Read from a callback when /metrics is scraped; the callback returns a
+    number or a {label value: number} dict"""
+
+    def __init__(self, name: str, help: str, read: Callable[[], Any], label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.label = label
+
+    def render(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if isinstance(value, dict):
+            lines.extend(
+                f"{self.name}{_labels((self.label,), (key,))} {_number(v)}"
+                for key, v in sorted(value.items()) if v is not None
+            )
+        elif value is not None:
+            lines.append(f"{self.name} {_number(value)}")
+        return lines
+
+
+class RequestStats:
+    """Queries issued while serving one request"""
+
+    __slots__ = ("queries", "query_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        # statement -> [count, seconds], only kept when the slow log is on
+        self.statements: Optional[Dict[str, list]] = {} if SLOW_REQUEST_MS > 0 else None
+
+
+# Set by the middleware; copied into the threadpool and SQLAlchemy's
+# greenlets, so queries from sync and async endpoints are both attributed
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+class Metrics:
+    def __init__(self):
+        self.requests = Counter(
+            "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+        )
+        self.request_duration = Histogram(
+            "http_request_duration_seconds", "HTTP request latency", ("method", "route")
+        )
+        self.request_queries = Histogram(
+            "http_request_db_queries", "Database queries issued per HTTP request", ("route",),
+            QUERIES_PER_REQUEST_BUCKETS,
+        )
+        self.request_query_duration = Histogram(
+            "http_request_db_query_seconds", "Database time per HTTP request", ("route",)
+        )
+        self.queries = Histogram(
+            "db_query_duration_seconds", "Database statement latency", ("operation",), QUERY_BUCKETS
+        )
+        self.inference = Histogram(
+            "model_inference_duration_seconds", "Model scoring latency per call", ("engine",), QUERY_BUCKETS
+        )
+        self.inference_rows = Counter("model_inference_rows_total", "Rows scored by the model", ("engine",))
+        self.in_progress = 0
+        self.gauges: List[Gauge] = [
+            Gauge("http_requests_in_progress", "HTTP requests being served", lambda: self.in_progress)
+        ]
+        self.slow_requests = 0
+
+    def add_gauge(self, name: str, help: str, read: Callable[[], Any], label: Optional[str] = None) -> None:
+        self.gauges.append(Gauge(name, help, read, label))
+
+    def record_query(self, statement: str, seconds: float) -> None:
+        words = statement[:16].split(None, 1)
+        operation = words[0].upper() if words else ""
+        self.queries.observe(seconds, (operation if operation in SQL_OPERATIONS else "OTHER",))
+        stats = _current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += seconds
+            if stats.statements is not None:
+                entry = stats.statements.setdefault(statement, [0, 0.0])
+                entry[0] += 1
+                entry[1] += seconds
+
+    def observe_inference(self, engine: str, predict: Callable, features):
+        """Call ``predict(features)`` and record its latency"""
+        start = time.perf_counter()
+        result = predict(features)
+        self.inference.observe(time.perf_counter() - start, (engine,))
+        self.inference_rows.inc((engine,), len(features))
+        return result
+
+    def record_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+        self.requests.inc((method, route, str(status)))
+        self.request_duration.observe(seconds, (method, route))
+        self.request_queries.observe(stats.queries, (route,))
+        self.request_query_duration.observe(stats.query_seconds, (route,))
+        if SLOW_REQUEST_MS > 0 and seconds * 1000 >= SLOW_REQUEST_MS:
+            self.slow_requests += 1
+            self.log_slow_request(method, route, status, seconds, stats)
+
+    @staticmethod
+    def log_slow_request(method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+        lines = [f"Slow request {method} {route} -> {status}: {seconds * 1000:.1f} ms, "
+                 f"{stats.queries} queries in {stats.query_seconds * 1000:.1f} ms"]
+        top = sorted((stats.statements or {}).items(), key=lambda item: item[1][1], reverse=True)
+        for statement, (count, query_seconds) in top[:SLOW_REQUEST_TOP_QUERIES]:
+            lines.append(f"    {count:>4}x {query_seconds * 1000:>8.1f} ms  {' '.join(statement.split())[:160]}")
+        logger.warning("\n".join(lines))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in (self.requests, self.request_duration, self.request_queries, self.request_query_duration,
+                       self.queries, self.inference, self.inference_rows, *self.gauges):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement run on a (sync) engine; pass ``async_engine.sync_engine`` for async ones"""
+    if not METRICS_ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        metrics.record_query(statement, time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and query counts per route.
+
+    The route label is the path template (``/predictions/{bike_id}``), so
+    the number of series does not grow with the ids in requests.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        metrics.in_progress += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            seconds = time.perf_counter() - start
+            metrics.in_progress -= 1
+            _current_request.reset(token)
+            route = scope.get("route")
+            metrics.record_request(
+                scope["method"], getattr(route, "path", "unmatched"), status[0], seconds, stats
+            )
@@ -0,0 +1,57 @@
+"""Baseline schema as originally created by models.Base.metadata.create_all
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-09-25
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "bikes",
+        sa.Column("bike_id", sa.Integer(), primary_key=True),
+        sa.Column("status", sa.String()),
+        sa.Column("purchased_date", sa.Date()),
+        sa.Column("last_serviced_date", sa.Date()),
+        sa.Column("total_distance_km", sa.Float()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_bikes_bike_id", "bikes", ["bike_id"])
+
+    op.create_table(
+        "rides",
+        sa.Column("ride_id", sa.Integer(), primary_key=True),
+        sa.Column("bike_id", sa.Integer()),
+        sa.Column("start_time", sa.DateTime()),
+        sa.Column("end_time", sa.DateTime()),
+        sa.Column("distance_km", sa.Float()),
+        sa.Column("avg_vibration", sa.Float()),
+        sa.Column("weather_condition", sa.String()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_rides_ride_id", "rides", ["ride_id"])
+
+    op.create_table(
+        "maintenance_records",
+        sa.Column("record_id", sa.Integer(), primary_key=True),
+        sa.Column("bike_id", sa.Integer()),
+        sa.Column("maintenance_date", sa.Date()),
+        sa.Column("component", sa.String()),
+        sa.Column("action", sa.String()),
+        sa.Column("associated_ride_id", sa.Integer()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_maintenance_records_record_id", "maintenance_records", ["record_id"])
+
+
+def downgrade():
+    op.drop_table("maintenance_records")
+    op.drop_table("rides")
+    op.drop_table("bikes")
@@ -0,0 +1,142 @@
+"""Feature store table, ride coordinates, foreign keys and hot-path indexes
+
+Databases created before migrations existed (by create_all or the old
+scripts/create_database.py) are stamped at 0001 and brought up to date
+here, so every step checks what is already present.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# Columns every table must end up with (old create_database.py lacked created_at,
+# create_all lacked the ride coordinates)
+REQUIRED_COLUMNS = {
+    "bikes": [("created_at", sa.DateTime())],
+    "rides": [
+        ("start_lat", sa.Float()),
+        ("start_lon", sa.Float()),
+        ("end_lat", sa.Float()),
+        ("end_lon", sa.Float()),
+        ("created_at", sa.DateTime()),
+    ],
+    "maintenance_records": [("created_at", sa.DateTime())],
+}
+
+# Date columns the old schema declared as TEXT
+DATE_COLUMNS = {
+    "bikes": [("purchased_date", sa.Date()), ("last_serviced_date", sa.Date())],
+    "rides": [("start_time", sa.DateTime()), ("end_time", sa.DateTime())],
+    "maintenance_records": [("maintenance_date", sa.Date())],
+}
+
+FOREIGN_KEYS = {
+    "rides": [("fk_rides_bike_id", "bikes", ["bike_id"], ["bike_id"])],
+    "maintenance_records": [
+        ("fk_maintenance_records_bike_id", "bikes", ["bike_id"], ["bike_id"]),
+        ("fk_maintenance_records_associated_ride_id", "rides", ["associated_ride_id"], ["ride_id"]),
+    ],
+}
+
+# Single-column indexes superseded by the composite ones below
+OBSOLETE_INDEXES = {
+    "rides": ["ix_rides_bike_id"],
+    "maintenance_records": ["ix_maintenance_records_bike_id"],
+}
+
+INDEXES = {
+    "rides": [
+        ("ix_rides_bike_id_start_time", ["bike_id", sa.text("start_time DESC")]),
+        ("ix_rides_bike_id_end_time", ["bike_id", "end_time"]),
+        ("ix_rides_start_time", ["start_time"]),
+    ],
+    "maintenance_records": [
+        ("ix_maintenance_records_bike_id_action_date", ["bike_id", "action", "maintenance_date"]),
+        ("ix_maintenance_records_maintenance_date", ["maintenance_date"]),
+    ],
+}
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    is_sqlite = bind.dialect.name == "sqlite"
+
+    if not inspector.has_table("bike_features"):
+        op.create_table(
+            "bike_features",
+            sa.Column("bike_id", sa.Integer(), sa.ForeignKey("bikes.bike_id"), primary_key=True),
+            sa.Column("km_since_service", sa.Float()),
+            sa.Column("last_maintenance_date", sa.Date()),
+            sa.Column("last_replaced_date", sa.Date()),
+            sa.Column("recent_vibrations", sa.Text()),
+            sa.Column("recent_distances", sa.Text()),
+            sa.Column("avg_vibration_last_10", sa.Float()),
+            sa.Column("recent_distance_km", sa.Float()),
+            sa.Column("recent_rides_count", sa.Integer()),
+            sa.Column("last_ride_start_time", sa.DateTime()),
+            sa.Column("updated_at", sa.DateTime()),
+        )
+        op.create_index("ix_bike_features_bike_id", "bike_features", ["bike_id"])
+
+    for table in ("bikes", "rides", "maintenance_records"):
+        columns = {c["name"]: c for c in inspector.get_columns(table)}
+        foreign_keys = {tuple(fk["constrained_columns"]) for fk in inspector.get_foreign_keys(table)}
+        indexes = {i["name"] for i in inspector.get_indexes(table)}
+
+        with op.batch_alter_table(table) as batch:
+            for name, type_ in REQUIRED_COLUMNS.get(table, []):
+                if name not in columns:
+                    batch.add_column(sa.Column(name, type_))
+
+            # SQLite keeps whatever was stored; only PostgreSQL needs a real cast
+            if not is_sqlite:
+                for name, type_ in DATE_COLUMNS.get(table, []):
+                    if name in columns and isinstance(columns[name]["type"], sa.String):
+                        batch.alter_column(
+                            name,
+                            type_=type_,
+                            postgresql_using=f"{name}::{type_.compile(dialect=bind.dialect)}",
+                        )
+
+            for name, referent, local, remote in FOREIGN_KEYS.get(table, []):
+                if tuple(local) not in foreign_keys:
+                    batch.create_foreign_key(name, referent, local, remote)
+
+        for name in OBSOLETE_INDEXES.get(table, []):
+            if name in indexes:
+                op.drop_index(name, table_name=table)
+        for name, columns_ in INDEXES.get(table, []):
+            if name not in indexes:
+                op.create_index(name, table, columns_)
+
+    if is_sqlite:
+        # Rows loaded through pandas stored full timestamps in DATE columns
+        for table, columns_ in DATE_COLUMNS.items():
+            for name, type_ in columns_:
+                if isinstance(type_, sa.Date):
+                    op.execute(
+                        f"UPDATE {table} SET {name} = substr({name}, 1, 10) "
+                        f"WHERE length({name}) > 10"
+                    )
+
+
+def downgrade():
+    for table, indexes in INDEXES.items():
+        for name, _ in indexes:
+            op.drop_index(name, table_name=table)
+    for table, foreign_keys in FOREIGN_KEYS.items():
+        with op.batch_alter_table(table) as batch:
+            for name, *_ in foreign_keys:
+                batch.drop_constraint(name, type_="foreignkey")
+    with op.batch_alter_table("rides") as batch:
+        for name in ("start_lat", "start_lon", "end_lat", "end_lon"):
+            batch.drop_column(name)
+    op.drop_table("bike_features")
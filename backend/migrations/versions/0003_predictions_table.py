@@ -0,0 +1,31 @@
+"""Precomputed predictions table
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table("predictions"):
+        return
+    op.create_table(
+        "predictions",
+        sa.Column("bike_id", sa.Integer(), sa.ForeignKey("bikes.bike_id"), primary_key=True),
+        sa.Column("variant", sa.String()),
+        sa.Column("maintenance_priority", sa.String()),
+        sa.Column("confidence_score", sa.Float()),
+        sa.Column("payload", sa.Text()),
+        sa.Column("computed_at", sa.DateTime()),
+    )
+
+
+def downgrade():
+    op.drop_table("predictions")
@@ -0,0 +1,53 @@
+"""Daily ride and maintenance rollup tables for the analytics endpoints
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+VIBRATION_BUCKETS = 7
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("ride_rollups_daily"):
+        op.create_table(
+            "ride_rollups_daily",
+            sa.Column("day", sa.Date(), primary_key=True),
+            sa.Column("bike_id", sa.Integer(), sa.ForeignKey("bikes.bike_id"), primary_key=True),
+            sa.Column("weather_condition", sa.String(), primary_key=True),
+            sa.Column("rides", sa.Integer()),
+            sa.Column("distance_km", sa.Float()),
+            sa.Column("vibration_count", sa.Integer()),
+            sa.Column("vibration_sum", sa.Float()),
+            sa.Column("vibration_sq_sum", sa.Float()),
+            sa.Column("vibration_min", sa.Float()),
+            sa.Column("vibration_max", sa.Float()),
+            *[sa.Column(f"vibration_bucket_{i}", sa.Integer()) for i in range(VIBRATION_BUCKETS)],
+        )
+        op.create_index("ix_ride_rollups_daily_bike_id_day", "ride_rollups_daily", ["bike_id", "day"])
+
+    if not inspector.has_table("maintenance_rollups_daily"):
+        op.create_table(
+            "maintenance_rollups_daily",
+            sa.Column("day", sa.Date(), primary_key=True),
+            sa.Column("bike_id", sa.Integer(), sa.ForeignKey("bikes.bike_id"), primary_key=True),
+            sa.Column("component", sa.String(), primary_key=True),
+            sa.Column("action", sa.String(), primary_key=True),
+            sa.Column("records", sa.Integer()),
+            sa.Column("intervals", sa.Integer()),
+            sa.Column("interval_km_sum", sa.Float()),
+        )
+
+
+def downgrade():
+    op.drop_table("maintenance_rollups_daily")
+    op.drop_index("ix_ride_rollups_daily_bike_id_day", table_name="ride_rollups_daily")
+    op.drop_table("ride_rollups_daily")
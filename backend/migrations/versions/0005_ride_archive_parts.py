@@ -0,0 +1,38 @@
+"""Catalog of archived ride Parquet files
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table("ride_archive_parts"):
+        return
+    op.create_table(
+        "ride_archive_parts",
+        sa.Column("path", sa.String(), primary_key=True),
+        sa.Column("month", sa.String()),
+        sa.Column("shard", sa.Integer()),
+        sa.Column("rides", sa.Integer()),
+        sa.Column("min_bike_id", sa.Integer()),
+        sa.Column("max_bike_id", sa.Integer()),
+        sa.Column("min_start_time", sa.DateTime()),
+        sa.Column("max_start_time", sa.DateTime()),
+        sa.Column("max_end_time", sa.DateTime()),
+        sa.Column("bytes", sa.Integer()),
+        sa.Column("archived_at", sa.DateTime()),
+    )
+    op.create_index("ix_ride_archive_parts_month_shard", "ride_archive_parts", ["month", "shard"])
+
+
+def downgrade():
+    op.drop_index("ix_ride_archive_parts_month_shard", table_name="ride_archive_parts")
+    op.drop_table("ride_archive_parts")
@@ -0,0 +1,34 @@
+"""Claimed maintenance work queue jobs
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table("work_queue_claims"):
+        return
+    op.create_table(
+        "work_queue_claims",
+        sa.Column("bike_id", sa.Integer(), sa.ForeignKey("bikes.bike_id"), primary_key=True),
+        sa.Column("component", sa.String(), primary_key=True),
+        sa.Column("mechanic", sa.String()),
+        sa.Column("score", sa.Float()),
+        sa.Column("minutes", sa.Integer()),
+        sa.Column("claimed_at", sa.DateTime()),
+        sa.Column("expires_at", sa.DateTime()),
+    )
+    op.create_index("ix_work_queue_claims_mechanic", "work_queue_claims", ["mechanic"])
+
+
+def downgrade():
+    op.drop_index("ix_work_queue_claims_mechanic", table_name="work_queue_claims")
+    op.drop_table("work_queue_claims")
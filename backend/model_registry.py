@@ -0,0 +1,163 @@
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Root of the registry; by default model_registry/ in the backend directory,
+# whatever the working directory (a relative MODEL_REGISTRY_DIR is taken as is)
+MODEL_REGISTRY_DIR = os.getenv(
+    "MODEL_REGISTRY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_registry")
+)
+
+MODEL_FILE = "model.ubj"
+SCHEMA_FILE = "schema.json"
+METRICS_FILE = "metrics.json"
+# Training feature distributions the drift monitor compares live traffic with
+BASELINE_FILE = "feature_baseline.json"
+# Holds the name of the promoted version; replaced atomically by promote()
+CURRENT_FILE = "CURRENT"
+HISTORY_FILE = "history.json"
+
+
+class ModelRegistry:
+    """Versioned model directories plus a pointer to the promoted one.
+
+    Each version lives in ``versions/<version>/`` with the booster in native
+    XGBoost UBJSON (loadable by any xgboost release that reads the format,
+    no pickle involved), the feature schema and the training metrics.
+    Versions are written to a temporary directory and renamed into place, and
+    ``promote`` swaps the CURRENT file with ``os.replace``, so readers always
+    see either the old or the new version.
+    """
+
+    def __init__(self, root: str = MODEL_REGISTRY_DIR):
+        self.root = root
+
+    @property
+    def versions_dir(self) -> str:
+        return os.path.join(self.root, "versions")
+
+    @property
+    def current_path(self) -> str:
+        return os.path.join(self.root, CURRENT_FILE)
+
+    def version_dir(self, version: str) -> str:
+        return os.path.join(self.versions_dir, version)
+
+    def versions(self) -> List[str]:
+        """Registered versions, oldest first"""
+        try:
+            names = os.listdir(self.versions_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(n for n in names if not n.startswith("."))
+
+    def register(self, booster, feature_columns: List[str], metrics: Optional[Dict[str, Any]] = None,
+                 extra_files: Optional[Dict[str, Any]] = None) -> str:
+        """Store a booster with its schema and metrics; returns the new version.
+
+        ``extra_files`` maps file names to JSON-serialisable content written
+        next to the model (e.g. a search leaderboard).
+        """
+        import xgboost as xgb
+
+        version = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        os.makedirs(self.versions_dir, exist_ok=True)
+        staging = os.path.join(self.versions_dir, f".tmp-{version}")
+        os.makedirs(staging)
+        try:
+            booster.save_model(os.path.join(staging, MODEL_FILE))
+            schema = {
+                "features": list(feature_columns),
+                "dtype": "float32",
+                "objective": json.loads(booster.save_config())["learner"]["objective"]["name"],
+                "num_boosted_rounds": booster.num_boosted_rounds(),
+                "xgboost_version": xgb.__version__,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            files = {SCHEMA_FILE: schema, METRICS_FILE: metrics or {}, **(extra_files or {})}
+            for name, content in files.items():
+                with open(os.path.join(staging, name), "w") as f:
+                    json.dump(content, f, indent=2, default=str)
+            os.rename(staging, self.version_dir(version))
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return version
+
+    def current(self) -> Optional[str]:
+        try:
+            with open(self.current_path) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def pointer_mtime(self) -> Optional[int]:
+        """Cheap change check for the promoted version (None if nothing is promoted)"""
+        try:
+            return os.stat(self.current_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def history(self) -> List[str]:
+        try:
+            with open(os.path.join(self.root, HISTORY_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def promote(self, version: str) -> None:
+        """Point CURRENT at ``version`` atomically"""
+        if not os.path.exists(os.path.join(self.version_dir(version), MODEL_FILE)):
+            raise ValueError(f"Unknown model version '{version}'")
+        history = self.history()
+        if not history or history[-1] != version:
+            history.append(version)
+        self._write(HISTORY_FILE, json.dumps(history, indent=2))
+        self._write(CURRENT_FILE, version + "\n")
+
+    def rollback(self) -> str:
+        """Promote the version that was current before the present one"""
+        history = self.history()
+        if len(history) < 2:
+            raise ValueError("No earlier promoted version to roll back to")
+        previous = history[-2]
+        self._write(HISTORY_FILE, json.dumps(history[:-1], indent=2))
+        self._write(CURRENT_FILE, previous + "\n")
+        return previous
+
+    def _write(self, name: str, content: str) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, name)
+        tmp = f"{path}.{uuid.uuid4().hex[:6]}.tmp"
+        with open(tmp, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def schema(self, version: str) -> Dict[str, Any]:
+        with open(os.path.join(self.version_dir(version), SCHEMA_FILE)) as f:
+            return json.load(f)
+
+    def metrics(self, version: str) -> Dict[str, Any]:
+        with open(os.path.join(self.version_dir(version), METRICS_FILE)) as f:
+            return json.load(f)
+
+    def baseline(self, version: str) -> Optional[Dict[str, Any]]:
+        """The version's training feature baseline (None for versions trained without one)"""
+        try:
+            with open(os.path.join(self.version_dir(version), BASELINE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load(self, version: str) -> Tuple[Any, Dict[str, Any]]:
+        """Load a version's booster and schema"""
+        import xgboost as xgb
+
+        booster = xgb.Booster()
+        booster.load_model(os.path.join(self.version_dir(version), MODEL_FILE))
+        return booster, self.schema(version)
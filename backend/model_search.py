@@ -0,0 +1,149 @@
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import xgboost as xgb
+
+# Default search space; n_estimators is an upper bound under early stopping
+PARAM_GRID = {
+    "n_estimators": [200, 500, 1000],
+    "max_depth": [3, 6, 9],
+    "learning_rate": [0.03, 0.1, 0.3],
+}
+EARLY_STOPPING_ROUNDS = 30
+EVAL_METRIC = "logloss"
+
+# Per-process fold matrices, built once by _init_worker and shared by every
+# trial that process runs
+_folds: List[tuple] = []
+_nthread = 1
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def time_series_folds(dates: np.ndarray, n_splits: int = 3, gap_days: int = 0):
+    """Expanding-window folds over snapshot dates.
+
+    The distinct days are cut into ``n_splits + 1`` consecutive blocks; fold
+    k trains on blocks 0..k and validates on block k + 1. ``gap_days`` are
+    dropped from the end of each training window, because labels look that
+    far ahead and would otherwise overlap the validation period.
+    Returns a list of (train_index, valid_index) arrays.
+    """
+    days = np.unique(dates)
+    blocks = np.array_split(days, n_splits + 1)
+    folds = []
+    for k in range(n_splits):
+        valid_days = blocks[k + 1]
+        train_end = valid_days[0] - np.timedelta64(gap_days, "D")
+        train_index = np.flatnonzero(dates < train_end)
+        valid_index = np.flatnonzero(np.isin(dates, valid_days))
+        if len(train_index) and len(valid_index):
+            folds.append((train_index, valid_index))
+    return folds
+
+
+def param_grid(grid: Dict[str, list] = PARAM_GRID) -> List[dict]:
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def _init_worker(X, y, folds, nthread):
+    global _folds, _nthread
+    _nthread = nthread
+    _folds = []
+    for train_index, valid_index in folds:
+        # QuantileDMatrix sketches the histogram cuts once; the validation
+        # matrix reuses them via ref=
+        dtrain = xgb.QuantileDMatrix(X[train_index], y[train_index], nthread=nthread)
+        dvalid = xgb.QuantileDMatrix(X[valid_index], y[valid_index], ref=dtrain, nthread=nthread)
+        _folds.append((dtrain, dvalid))
+
+
+def _run_trial(params: dict, early_stopping_rounds: int) -> dict:
+    start = time.perf_counter()
+    booster_params = {
+        "objective": "binary:logistic",
+        "eval_metric": EVAL_METRIC,
+        "tree_method": "hist",
+        "max_depth": params["max_depth"],
+        "learning_rate": params["learning_rate"],
+        "nthread": _nthread,
+    }
+    scores, rounds = [], []
+    for dtrain, dvalid in _folds:
+        booster = xgb.train(
+            booster_params,
+            dtrain,
+            num_boost_round=params["n_estimators"],
+            evals=[(dvalid, "valid")],
+            early_stopping_rounds=early_stopping_rounds,
+            verbose_eval=False,
+        )
+        scores.append(booster.best_score)
+        rounds.append(booster.best_iteration + 1)
+    return {
+        "params": params,
+        "score": float(np.mean(scores)),
+        "fold_scores": [float(s) for s in scores],
+        "best_rounds": rounds,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def search(X: np.ndarray, y: np.ndarray, folds, grid: Dict[str, list] = PARAM_GRID,
+           workers: Optional[int] = None, early_stopping_rounds: int = EARLY_STOPPING_ROUNDS) -> List[dict]:
+    """Cross-validate every parameter combination in a process pool.
+
+    Returns the leaderboard: one entry per trial, best (lowest mean
+    validation logloss) first.
+    """
+    trials = param_grid(grid)
+    cores = available_cores()
+    workers = min(workers or cores, len(trials))
+    # Split the cores between processes instead of oversubscribing them
+    nthread = max(1, cores // workers)
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    y = np.asarray(y, dtype=np.float32)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(X, y, folds, nthread)
+    ) as pool:
+        futures = [pool.submit(_run_trial, params, early_stopping_rounds) for params in trials]
+        leaderboard = []
+        for future in futures:
+            result = future.result()
+            leaderboard.append(result)
+            print(f"{result['params']} -> {EVAL_METRIC} {result['score']:.4f} "
+                  f"({result['seconds']:.1f}s, rounds {result['best_rounds']})", flush=True)
+    leaderboard.sort(key=lambda r: r["score"])
+    for rank, result in enumerate(leaderboard, 1):
+        result["rank"] = rank
+    return leaderboard
+
+
+def best_model(leaderboard: List[dict], X: np.ndarray, y: np.ndarray) -> xgb.XGBClassifier:
+    """Refit the winning parameters on all the data.
+
+    The number of trees is the mean early-stopping round across folds, so
+    the final fit needs no held-out set.
+    """
+    best = leaderboard[0]
+    model = xgb.XGBClassifier(
+        objective="binary:logistic",
+        eval_metric=EVAL_METRIC,
+        tree_method="hist",
+        n_estimators=int(round(np.mean(best["best_rounds"]))),
+        max_depth=best["params"]["max_depth"],
+        learning_rate=best["params"]["learning_rate"],
+        n_jobs=available_cores(),
+    )
+    model.fit(X, y)
+    return model
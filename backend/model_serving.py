@@ -0,0 +1,269 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+
+from metrics import metrics
+from model_registry import ModelRegistry
+from predictions import FEATURE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Legacy pickle written by older versions of scripts/train_model.py, used
+# when nothing has been promoted in the registry
+DEFAULT_MODEL_PATH = os.getenv("MODEL_PATH", "prod_model/xgboost_model.joblib")
+
+# "auto" uses the model when one is loaded, "model" requires it and
+# "threshold" always falls back to the rule-based priorities
+PREDICTION_MODES = ("auto", "model", "threshold")
+DEFAULT_PREDICTION_MODE = os.getenv("PREDICTION_MODE", "auto")
+
+
+# After a failed load the same artifact is tried again only after this many
+# seconds (a new pointer or file is tried at once)
+MODEL_RETRY_SECONDS = float(os.getenv("MODEL_RETRY_SECONDS", "60"))
+
+# Batches needing at most this many node visits (rows x trees x depth) are
+# scored with TreeEnsemble: XGBoost's predict has a fixed cost of a few
+# hundred microseconds, which dominates for a handful of rows
+SMALL_BATCH_NODE_VISITS = int(os.getenv("SMALL_BATCH_NODE_VISITS", "32000"))
+
+
+class TreeEnsemble:
+    """A binary:logistic gbtree booster evaluated with numpy.
+
+    The nodes of every tree are concatenated into flat arrays, with leaves
+    pointing at themselves, so a batch walks all trees at once in ``depth``
+    vectorised steps. Splits follow XGBoost: go left when ``x < threshold``,
+    or by ``default_left`` when x is missing.
+    """
+
+    def __init__(self, booster):
+        learner = json.loads(booster.save_raw("json"))["learner"]
+        if learner["objective"]["name"] != "binary:logistic" or learner["gradient_booster"]["name"] != "gbtree":
+            raise ValueError("only binary:logistic gbtree boosters are supported")
+        trees = learner["gradient_booster"]["model"]["trees"]
+        if any(tree["categories"] for tree in trees):
+            raise ValueError("categorical splits are not supported")
+
+        left, right, feature, threshold, default_left, value, roots = [], [], [], [], [], [], []
+        self.depth = 0
+        offset = 0
+        for tree in trees:
+            children = np.array(tree["left_children"])
+            is_leaf = children == -1
+            nodes = np.arange(len(children)) + offset
+            conditions = np.array(tree["split_conditions"], dtype=np.float32)
+            left.append(np.where(is_leaf, nodes, children + offset))
+            right.append(np.where(is_leaf, nodes, np.array(tree["right_children"]) + offset))
+            feature.append(np.where(is_leaf, 0, tree["split_indices"]))
+            threshold.append(conditions)
+            default_left.append(np.array(tree["default_left"], dtype=bool))
+            # A leaf's split_condition holds its value
+            value.append(np.where(is_leaf, conditions, 0))
+            roots.append(offset)
+            self.depth = max(self.depth, self._tree_depth(tree["left_children"], tree["right_children"]))
+            offset += len(children)
+        self.left = np.concatenate(left)
+        self.right = np.concatenate(right)
+        self.feature = np.concatenate(feature)
+        self.threshold = np.concatenate(threshold)
+        self.default_left = np.concatenate(default_left)
+        self.value = np.concatenate(value).astype(np.float32)
+        self.roots = np.array(roots, dtype=np.intp)
+        base_score = float(learner["learner_model_param"]["base_score"].strip("[]"))
+        self.base_margin = np.float32(np.log(base_score / (1 - base_score)))
+        # Largest batch that TreeEnsemble scores faster than XGBoost
+        self.max_rows = SMALL_BATCH_NODE_VISITS // max(len(trees) * self.depth, 1)
+
+    @staticmethod
+    def _tree_depth(left, right) -> int:
+        depth, level = 0, [0]
+        while True:
+            level = [child for node in level for child in (left[node], right[node]) if child != -1]
+            if not level:
+                return depth
+            depth += 1
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        n_rows, n_features = features.shape
+        flat = features.ravel()
+        missing = np.isnan(flat).any()
+        row_offsets = (np.arange(n_rows) * n_features)[:, None]
+        node = np.broadcast_to(self.roots, (n_rows, len(self.roots)))
+        for _ in range(self.depth):
+            x = flat.take(row_offsets + self.feature.take(node))
+            go_left = x < self.threshold.take(node)
+            if missing:
+                go_left |= np.isnan(x) & self.default_left.take(node)
+            node = np.where(go_left, self.left.take(node), self.right.take(node))
+        margin = self.value.take(node).sum(axis=1, dtype=np.float32) + self.base_margin
+        return 1 / (1 + np.exp(-margin))
+
+
+class LoadedModel(NamedTuple):
+    predict: Callable[[np.ndarray], np.ndarray]
+    version: str
+    source: str
+    stamp: tuple
+
+
+class ModelServer:
+    """Holds the trained classifier in memory and swaps it when it changes.
+
+    The promoted registry version is preferred over the legacy joblib file.
+    Every call to ``predict_proba`` does a cheap ``os.stat`` of the registry
+    pointer (or the joblib file); when it moved, the new model is loaded on
+    a background thread while requests keep using the current one, and the
+    swap is a single reference assignment.
+    """
+
+    def __init__(self, path: str = DEFAULT_MODEL_PATH, registry: Optional[ModelRegistry] = None):
+        self.path = path
+        self.registry = registry or ModelRegistry()
+        self._loaded: Optional[LoadedModel] = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._reloading = False
+        # (stamp, monotonic time) of the last failed load
+        self._failed: Optional[tuple] = None
+
+    @property
+    def available(self) -> bool:
+        return self._loaded is not None
+
+    @property
+    def version(self) -> Optional[str]:
+        loaded = self._loaded
+        return loaded.version if loaded else None
+
+    @property
+    def loaded_mtime(self) -> Optional[int]:
+        """Modification time (ns) of the pointer or file the model was loaded from"""
+        loaded = self._loaded
+        return loaded.stamp[1] if loaded else None
+
+    def _current_stamp(self) -> Optional[tuple]:
+        mtime = self.registry.pointer_mtime()
+        if mtime is not None:
+            return ("registry", mtime)
+        try:
+            # Nanoseconds, like the registry pointer
+            return ("joblib", os.stat(self.path).st_mtime_ns)
+        except OSError:
+            return None
+
+    def _load_registry(self, stamp) -> LoadedModel:
+        version = self.registry.current()
+        booster, schema = self.registry.load(version)
+        if schema["features"] != FEATURE_COLUMNS:
+            raise ValueError(f"feature schema {schema['features']} does not match {FEATURE_COLUMNS}")
+
+        try:
+            ensemble = TreeEnsemble(booster)
+        except ValueError as e:
+            logger.warning("Small batches will use XGBoost predict: %s", e)
+            ensemble = None
+
+        def predict(features):
+            if ensemble is not None and len(features) <= ensemble.max_rows:
+                return metrics.observe_inference("tree_ensemble", ensemble.predict, features)
+            # binary:logistic boosters return the positive class probability
+            return metrics.observe_inference("xgboost", booster.inplace_predict, features)
+
+        return LoadedModel(predict, version, self.registry.version_dir(version), stamp)
+
+    def _load_joblib(self, stamp) -> LoadedModel:
+        import joblib  # heavy import, only needed for legacy pickles
+
+        # Numpy buffers inside the pickle are memory-mapped, not copied
+        model = joblib.load(self.path, mmap_mode="r")
+        return LoadedModel(
+            lambda features: metrics.observe_inference("joblib", model.predict_proba, features)[:, 1],
+            f"joblib:{stamp[1]}", self.path, stamp,
+        )
+
+    def load(self) -> bool:
+        """Load the current model, keeping the previous one on failure"""
+        stamp = self._current_stamp()
+        if stamp is None:
+            return False
+        loaded = self._loaded
+        if loaded is not None and loaded.stamp == stamp:
+            return True
+        if self._backing_off(stamp):
+            return loaded is not None
+        with self._lock:
+            if self._loaded is not None and self._loaded.stamp == stamp:
+                return True
+            if self._backing_off(stamp):
+                return self._loaded is not None
+            try:
+                if stamp[0] == "registry":
+                    loaded = self._load_registry(stamp)
+                else:
+                    loaded = self._load_joblib(stamp)
+            except Exception:
+                self._failed = (stamp, time.monotonic())
+                logger.exception("Failed to load model (%s), retrying in %gs or when it changes",
+                                 stamp[0], MODEL_RETRY_SECONDS)
+                return False
+            self._failed = None
+            self._loaded = loaded
+            logger.info("Loaded prediction model %s from %s", loaded.version, loaded.source)
+            return True
+
+    def _backing_off(self, stamp: tuple) -> bool:
+        """True while ``stamp`` is the artifact that last failed to load"""
+        failed = self._failed
+        return failed is not None and failed[0] == stamp and time.monotonic() - failed[1] < MODEL_RETRY_SECONDS
+
+    def _background_load(self) -> None:
+        try:
+            self.load()
+        finally:
+            self._reloading = False
+
+    def maybe_reload(self) -> None:
+        """Start loading the new model if the pointer or file has changed"""
+        stamp = self._current_stamp()
+        loaded = self._loaded
+        if stamp is None or (loaded is not None and loaded.stamp == stamp) or self._backing_off(stamp):
+            return
+        if loaded is None:
+            # Nothing to serve in the meantime, so load in this request
+            self.load()
+            return
+        with self._reload_lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._background_load, name="model-reload", daemon=True).start()
+
+    def predict_proba(self, features: np.ndarray) -> Optional[np.ndarray]:
+        """Score a whole feature matrix at once; None if no model is loaded"""
+        self.maybe_reload()
+        loaded = self._loaded
+        if loaded is None:
+            return None
+        return loaded.predict(features)
+
+    def status(self):
+        loaded = self._loaded
+        return {
+            "loaded": loaded is not None,
+            "version": loaded.version if loaded else None,
+            "source": loaded.source if loaded else None,
+            "promoted_version": self.registry.current(),
+            "registry": self.registry.root,
+            "path": self.path,
+            "loaded_mtime": self.loaded_mtime,
+        }
+
+
+model_server = ModelServer()
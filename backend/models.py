@@ -1,5 +1,4 @@
-
-from sqlalchemy import Column, Integer, String, Float, DateTime, Date
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, Text, ForeignKey, Index
 from database import Base
 
 class Bike(Base):
@@ -16,21 +15,143 @@ class Ride(Base):
     __tablename__ = "rides"
     
     ride_id = Column(Integer, primary_key=True, index=True)
-    bike_id = Column(Integer)
-    start_time = Column(DateTime)
+    bike_id = Column(Integer, ForeignKey("bikes.bike_id"))
+    start_time = Column(DateTime, index=True)
     end_time = Column(DateTime)
+    start_lat = Column(Float)
+    start_lon = Column(Float)
+    end_lat = Column(Float)
+    end_lon = Column(Float)
     distance_km = Column(Float)
     avg_vibration = Column(Float)
     weather_condition = Column(String)
     created_at = Column(DateTime)
 
+    __table_args__ = (
+        # Last-N rides per bike (predictions, feature store window)
+        Index("ix_rides_bike_id_start_time", "bike_id", start_time.desc()),
+        # Distance since the last replacement per bike
+        Index("ix_rides_bike_id_end_time", "bike_id", "end_time"),
+    )
+
 class MaintenanceRecord(Base):
     __tablename__ = "maintenance_records"
     
     record_id = Column(Integer, primary_key=True, index=True)
-    bike_id = Column(Integer)
-    maintenance_date = Column(Date)
+    bike_id = Column(Integer, ForeignKey("bikes.bike_id"))
+    maintenance_date = Column(Date, index=True)
     component = Column(String)
     action = Column(String)
-    associated_ride_id = Column(Integer)
-    created_at = Column(DateTime)
\ No newline at end of file
+    associated_ride_id = Column(Integer, ForeignKey("rides.ride_id"))
+    created_at = Column(DateTime)
+
+    __table_args__ = (
+        # Last service / last replacement per bike
+        Index("ix_maintenance_records_bike_id_action_date", "bike_id", "action", "maintenance_date"),
+    )
+
+# Per-bike prediction features, maintained incrementally by feature_store.py
+class BikeFeatures(Base):
+    __tablename__ = "bike_features"
+
+    bike_id = Column(Integer, ForeignKey("bikes.bike_id"), primary_key=True, index=True)
+    km_since_service = Column(Float)
+    last_maintenance_date = Column(Date)
+    last_replaced_date = Column(Date)
+    recent_vibrations = Column(Text)  # JSON list of the last 10 rides, oldest first
+    recent_distances = Column(Text)  # JSON list aligned with recent_vibrations
+    avg_vibration_last_10 = Column(Float)
+    recent_distance_km = Column(Float)
+    recent_rides_count = Column(Integer)
+    last_ride_start_time = Column(DateTime)
+    updated_at = Column(DateTime)
+
+# Precomputed predictions, written by prediction_scheduler.py
+class Prediction(Base):
+    __tablename__ = "predictions"
+
+    bike_id = Column(Integer, ForeignKey("bikes.bike_id"), primary_key=True)
+    variant = Column(String)  # predictions.prediction_variant() of the producer
+    maintenance_priority = Column(String)
+    confidence_score = Column(Float)
+    payload = Column(Text)  # The full prediction as JSON
+    computed_at = Column(DateTime)
+
+# Daily ride aggregates per bike and weather, maintained by rollups.py
+class RideRollup(Base):
+    __tablename__ = "ride_rollups_daily"
+
+    day = Column(Date, primary_key=True)  # Day the ride started
+    bike_id = Column(Integer, ForeignKey("bikes.bike_id"), primary_key=True)
+    weather_condition = Column(String, primary_key=True)  # "unknown" when the ride had none
+    rides = Column(Integer)
+    distance_km = Column(Float)
+    vibration_count = Column(Integer)  # Rides with an avg_vibration
+    vibration_sum = Column(Float)
+    vibration_sq_sum = Column(Float)
+    vibration_min = Column(Float)
+    vibration_max = Column(Float)
+    # Ride counts per bucket of rollups.VIBRATION_BUCKET_EDGES
+    vibration_bucket_0 = Column(Integer)
+    vibration_bucket_1 = Column(Integer)
+    vibration_bucket_2 = Column(Integer)
+    vibration_bucket_3 = Column(Integer)
+    vibration_bucket_4 = Column(Integer)
+    vibration_bucket_5 = Column(Integer)
+    vibration_bucket_6 = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_ride_rollups_daily_bike_id_day", "bike_id", "day"),
+    )
+
+# Daily maintenance aggregates per bike, component and action
+class MaintenanceRollup(Base):
+    __tablename__ = "maintenance_rollups_daily"
+
+    day = Column(Date, primary_key=True)
+    bike_id = Column(Integer, ForeignKey("bikes.bike_id"), primary_key=True)
+    component = Column(String, primary_key=True)  # "unknown" when the record had none
+    action = Column(String, primary_key=True)
+    records = Column(Integer)
+    # Replacements preceded by an earlier replacement of the same component on
+    # the same bike, and the km ridden in between
+    intervals = Column(Integer)
+    interval_km_sum = Column(Float)
+
+# Parquet files holding rides moved out of the rides table by ride_archive.py;
+# a file is only read once its row is committed
+class RideArchivePart(Base):
+    __tablename__ = "ride_archive_parts"
+
+    path = Column(String, primary_key=True)  # Relative to RIDE_ARCHIVE_DIR
+    month = Column(String)  # YYYY-MM of the rides' start_time
+    shard = Column(Integer)  # bike_id % ride_archive.ARCHIVE_SHARDS
+    rides = Column(Integer)
+    min_bike_id = Column(Integer)
+    max_bike_id = Column(Integer)
+    min_start_time = Column(DateTime)
+    max_start_time = Column(DateTime)
+    max_end_time = Column(DateTime)
+    bytes = Column(Integer)
+    archived_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_ride_archive_parts_month_shard", "month", "shard"),
+    )
+
+# Maintenance jobs handed out by work_queue.py; the primary key keeps two
+# mechanics (or API workers) from claiming the same job
+class WorkQueueClaim(Base):
+    __tablename__ = "work_queue_claims"
+
+    bike_id = Column(Integer, ForeignKey("bikes.bike_id"), primary_key=True)
+    component = Column(String, primary_key=True)  # One of work_queue.COMPONENTS
+    mechanic = Column(String)
+    score = Column(Float)  # Queue score when claimed
+    minutes = Column(Integer)  # Estimated job duration
+    claimed_at = Column(DateTime)
+    expires_at = Column(DateTime)  # The job goes back to the queue after this
+
+    __table_args__ = (
+        Index("ix_work_queue_claims_mechanic", "mechanic"),
+    )
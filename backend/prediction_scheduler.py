@@ -0,0 +1,246 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+from cache import result_cache
+from database import SessionLocal
+from drift_monitor import drift_monitor
+from feature_store import FEATURE_SOURCE
+from model_serving import model_server
+from predictions import get_fleet_predictions_async, prediction_query, prediction_variant, predictions_from_rows
+
+logger = logging.getLogger(__name__)
+
+# Seconds between scheduler runs
+PREDICTION_REFRESH_SECONDS = float(os.getenv("PREDICTION_REFRESH_SECONDS", "30"))
+# Bikes scored and committed per batch
+PREDICTION_BATCH_SIZE = int(os.getenv("PREDICTION_BATCH_SIZE", "1000"))
+# days_since_service grows without any write, so every row is recomputed at
+# least this often
+PREDICTION_MAX_AGE_SECONDS = float(os.getenv("PREDICTION_MAX_AGE_SECONDS", "3600"))
+# "thread" runs the scheduler inside the API process; set "off" when
+# scripts/run_prediction_scheduler.py runs it as a separate process
+PREDICTION_SCHEDULER = os.getenv("PREDICTION_SCHEDULER", "thread")
+
+
+def dirty_query(variant: str, stale_before: datetime):
+    """Bikes whose stored prediction is missing, from another variant, older
+    than their features or older than ``stale_before``"""
+    bike = models.Bike.__table__
+    features = models.BikeFeatures.__table__
+    prediction = models.Prediction.__table__
+    return (
+        select(bike.c.bike_id)
+        .select_from(
+            bike.outerjoin(features, features.c.bike_id == bike.c.bike_id)
+            .outerjoin(prediction, prediction.c.bike_id == bike.c.bike_id)
+        )
+        .where(
+            or_(
+                prediction.c.bike_id.is_(None),
+                prediction.c.variant != variant,
+                prediction.c.computed_at < stale_before,
+                prediction.c.computed_at < features.c.updated_at,
+            )
+        )
+        .order_by(bike.c.bike_id)
+    )
+
+
+def store_predictions(db: Session, predictions: List[Dict[str, Any]], variant: str, computed_at: datetime) -> None:
+    """Replace the stored predictions of these bikes"""
+    if not predictions:
+        return
+    table = models.Prediction.__table__
+    db.execute(delete(table).where(table.c.bike_id.in_([p["bike_id"] for p in predictions])))
+    db.execute(
+        table.insert(),
+        [
+            {
+                "bike_id": p["bike_id"],
+                "variant": variant,
+                "maintenance_priority": p["maintenance_priority"],
+                "confidence_score": p["confidence_score"],
+                "payload": json.dumps(p),
+                "computed_at": computed_at,
+            }
+            for p in predictions
+        ],
+    )
+
+
+async def get_precomputed_predictions_async(
+    db: AsyncSession,
+    model_server=None,
+    source: str = FEATURE_SOURCE,
+    bike_ids: Optional[List[int]] = None,
+) -> List[Dict[str, Any]]:
+    """Fleet predictions read from the predictions table.
+
+    Bikes without a usable stored prediction are computed inline as before:
+    new bikes, rows from another variant (e.g. a freshly promoted model) and
+    rows older than the bike's features, so a write is visible immediately
+    and the scheduler only has to catch up with it.
+    """
+    bike = models.Bike.__table__
+    features = models.BikeFeatures.__table__
+    prediction = models.Prediction.__table__
+    query = (
+        select(bike.c.bike_id, prediction.c.payload)
+        .outerjoin(features, features.c.bike_id == bike.c.bike_id)
+        .outerjoin(
+            prediction,
+            (prediction.c.bike_id == bike.c.bike_id)
+            & (prediction.c.variant == prediction_variant(model_server, source))
+            & or_(features.c.updated_at.is_(None), prediction.c.computed_at >= features.c.updated_at),
+        )
+        .order_by(bike.c.bike_id)
+    )
+    if bike_ids is not None:
+        query = query.where(bike.c.bike_id.in_(bike_ids))
+    rows = (await db.execute(query)).all()
+
+    missing = [bike_id for bike_id, payload in rows if payload is None]
+    computed = {}
+    if missing:
+        computed = {
+            p["bike_id"]: p
+            for p in await get_fleet_predictions_async(db, model_server, source, bike_ids=missing)
+        }
+    return [
+        json.loads(payload) if payload is not None else computed[bike_id]
+        for bike_id, payload in rows
+        if payload is not None or bike_id in computed
+    ]
+
+
+class PredictionScheduler:
+    """Recomputes stored predictions for changed bikes on a fixed cadence.
+
+    Each run finds the dirty bikes with one query (see ``dirty_query``),
+    scores them ``batch_size`` at a time, and commits each batch before
+    dropping those bikes from the result cache. Because dirtiness is read
+    from the database, writes from any process are picked up.
+    """
+
+    def __init__(self, session_factory=SessionLocal, model_server=None, source: str = FEATURE_SOURCE,
+                 interval: float = PREDICTION_REFRESH_SECONDS, batch_size: int = PREDICTION_BATCH_SIZE,
+                 max_age: float = PREDICTION_MAX_AGE_SECONDS, drift_monitor=None):
+        self.session_factory = session_factory
+        self.model_server = model_server
+        self.source = source
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.drift_monitor = drift_monitor
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.backlog = 0
+        self.runs = 0
+        self.bikes_processed = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+
+    def run_once(self) -> Dict[str, Any]:
+        """Recompute every dirty bike; returns a summary of the run"""
+        started = time.perf_counter()
+        started_at = datetime.now()
+        if self.model_server is not None:
+            self.model_server.maybe_reload()
+        variant = prediction_variant(self.model_server, self.source)
+        processed = batches = 0
+        db = self.session_factory()
+        try:
+            stale_before = started_at - timedelta(seconds=self.max_age)
+            dirty = db.execute(dirty_query(variant, stale_before)).scalars().all()
+            self.backlog = len(dirty)
+            for i in range(0, len(dirty), self.batch_size):
+                if self._stop.is_set():
+                    break
+                bike_ids = dirty[i:i + self.batch_size]
+                # Stamped before the read, so a feature update that lands
+                # while the batch is scored still leaves the bike dirty
+                computed_at = datetime.now()
+                rows = db.execute(prediction_query(self.source, bike_ids)).all()
+                store_predictions(db, predictions_from_rows(rows, self.model_server), variant, computed_at)
+                db.commit()
+                result_cache.invalidate_predictions(bike_ids)
+                processed += len(bike_ids)
+                batches += 1
+                self.backlog -= len(bike_ids)
+        finally:
+            db.close()
+
+        breaches = None
+        if self.drift_monitor is not None:
+            # Resolve new replacements and retrain on drift, from the one process running the scheduler
+            try:
+                breaches = self.drift_monitor.poll(retrain=True)
+            except Exception:
+                logger.exception("Drift monitor poll failed")
+
+        self.runs += 1
+        self.bikes_processed += processed
+        self.last_run = {
+            "started_at": started_at.isoformat(timespec="seconds"),
+            "duration_seconds": round(time.perf_counter() - started, 4),
+            "dirty_bikes": processed + self.backlog,
+            "processed": processed,
+            "batches": batches,
+            "variant": variant,
+            "drift_breaches": breaches,
+        }
+        return self.last_run
+
+    def run_forever(self) -> None:
+        """Run now and then every ``interval`` seconds until stop() is called"""
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("Prediction scheduler run failed")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name="prediction-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return
+            self._thread = None
+        # Allow run_once() / start() again
+        self._stop.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._thread is not None,
+            "interval_seconds": self.interval,
+            "batch_size": self.batch_size,
+            "max_age_seconds": self.max_age,
+            "backlog": self.backlog,
+            "runs": self.runs,
+            "bikes_processed": self.bikes_processed,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+        }
+
+
+prediction_scheduler = PredictionScheduler(model_server=model_server, drift_monitor=drift_monitor)
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+import models
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# How often the shared producer looks for recomputed predictions
+STREAM_POLL_SECONDS = float(os.getenv("STREAM_POLL_SECONDS", "1"))
+# Events buffered per client; a client that falls this far behind gets a
+# single "resync" event instead of the backlog
+STREAM_CLIENT_QUEUE_SIZE = int(os.getenv("STREAM_CLIENT_QUEUE_SIZE", "64"))
+STREAM_MAX_CLIENTS = int(os.getenv("STREAM_MAX_CLIENTS", "10000"))
+# Comment lines keep idle connections open through proxies
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", "15"))
+# Past events kept for clients reconnecting with Last-Event-ID
+STREAM_REPLAY_EVENTS = 256
+# Above this many changed bikes, clients are told to refetch /predictions
+STREAM_MAX_CHANGES_PER_EVENT = 1000
+# Rows are stamped before they are scored and committed afterwards, so every
+# poll re-reads this far behind the newest computed_at it has seen
+STREAM_COMMIT_LAG = timedelta(seconds=60)
+
+# Prediction fields whose change is pushed to clients
+DELTA_FIELDS = ("maintenance_priority", "predicted_issues", "confidence_score")
+
+
+def sse_message(event: str, data: Any, event_id: Optional[int] = None) -> bytes:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+KEEPALIVE = b": keepalive\n\n"
+
+
+class StreamClient:
+    def __init__(self, maxsize: int):
+        self.queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue(maxsize)
+
+    def offer(self, message: Optional[bytes]) -> bool:
+        """Queue a message without waiting; False if the client had fallen behind"""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+        # Drop the backlog: the client refetches the full list instead
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(sse_message("resync", {"reason": "client too slow"}))
+        if message is None:
+            self.queue.put_nowait(None)
+        return False
+
+
+class PredictionBroadcaster:
+    """Pushes prediction changes from one shared producer to every client.
+
+    A single task per process polls the predictions table that the
+    scheduler maintains and diffs each recomputed bike against the last
+    values it saw, so the work does not grow with the number of clients.
+    Each delta event is encoded once and offered to every client's bounded
+    queue without waiting; a client whose queue is full loses its backlog
+    and gets one "resync" event telling it to refetch /predictions.
+    """
+
+    def __init__(self, poll_seconds: float = STREAM_POLL_SECONDS, queue_size: int = STREAM_CLIENT_QUEUE_SIZE,
+                 max_clients: int = STREAM_MAX_CLIENTS, session_factory=AsyncSessionLocal):
+        self.poll_seconds = poll_seconds
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self.session_factory = session_factory
+        self._clients: Set[StreamClient] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._replay: Deque[Tuple[int, bytes]] = deque(maxlen=STREAM_REPLAY_EVENTS)
+        self._seq = 0
+        # bike_id -> (computed_at, values of DELTA_FIELDS)
+        self._known: Dict[int, Tuple[datetime, tuple]] = {}
+        self._watermark: Optional[datetime] = None
+        self.events_published = 0
+        self.resyncs = 0
+        self.polls = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> StreamClient:
+        """Register a client; replays events after ``last_event_id`` when still buffered"""
+        if len(self._clients) >= self.max_clients:
+            raise RuntimeError("Too many stream clients")
+        client = StreamClient(self.queue_size)
+        if last_event_id is not None:
+            with self._lock:
+                replay = [(seq, message) for seq, message in self._replay if seq > last_event_id]
+                oldest = self._replay[0][0] if self._replay else self._seq + 1
+            if last_event_id < oldest - 1 or last_event_id > self._seq:
+                # Too old for the buffer, or from before a server restart
+                client.offer(sse_message("resync", {"reason": "missed events"}))
+            else:
+                for _, message in replay:
+                    client.offer(message)
+        self._clients.add(client)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return client
+
+    def unsubscribe(self, client: StreamClient) -> None:
+        self._clients.discard(client)
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        """Encode one event and offer it to every client (event loop only)"""
+        with self._lock:
+            self._seq += 1
+            message = sse_message(event, {**data, "seq": self._seq}, self._seq)
+            self._replay.append((self._seq, message))
+        self.events_published += 1
+        for client in list(self._clients):
+            if not client.offer(message):
+                self.resyncs += 1
+
+    async def poll(self) -> List[Dict[str, Any]]:
+        """Read recomputed predictions and return the bikes whose delta fields changed"""
+        table = models.Prediction.__table__
+        query = select(table.c.bike_id, table.c.payload, table.c.computed_at)
+        if self._watermark is not None:
+            query = query.where(table.c.computed_at > self._watermark - STREAM_COMMIT_LAG)
+        async with self.session_factory() as db:
+            rows = (await db.execute(query)).all()
+        self.polls += 1
+
+        first = self._watermark is None
+        changes = []
+        for bike_id, payload, computed_at in rows:
+            known = self._known.get(bike_id)
+            if known is not None and known[0] == computed_at:
+                continue
+            if self._watermark is None or computed_at > self._watermark:
+                self._watermark = computed_at
+            prediction = json.loads(payload)
+            values = tuple(
+                tuple(v) if isinstance(v, list) else v for v in (prediction.get(f) for f in DELTA_FIELDS)
+            )
+            self._known[bike_id] = (computed_at, values)
+            # The first poll only records the current state
+            if first or (known is not None and known[1] == values):
+                continue
+            change = {"bike_id": bike_id, **{f: prediction.get(f) for f in DELTA_FIELDS}}
+            change["previous_priority"] = known[1][0] if known is not None else None
+            changes.append(change)
+        return changes
+
+    async def _run(self) -> None:
+        while self._clients:
+            try:
+                changes = await self.poll()
+                self.last_error = None
+            except Exception as e:
+                changes = []
+                self.last_error = str(e)
+                logger.exception("Prediction stream poll failed")
+            if len(changes) > STREAM_MAX_CHANGES_PER_EVENT:
+                self.publish("resync", {"reason": f"{len(changes)} bikes changed"})
+            elif changes:
+                self.publish("priorities", {"changes": changes})
+            await asyncio.sleep(self.poll_seconds)
+
+    async def events(self, client: StreamClient, keepalive: float = STREAM_KEEPALIVE_SECONDS):
+        """Server-sent event bytes for one client, ending when it unsubscribes or close() is called"""
+        try:
+            yield sse_message("ready", {"seq": self._seq, "poll_seconds": self.poll_seconds})
+            while True:
+                try:
+                    message = await asyncio.wait_for(client.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    message = KEEPALIVE
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(client)
+
+    async def close(self) -> None:
+        """End every stream (e.g. on shutdown) and stop the producer"""
+        for client in list(self._clients):
+            client.offer(None)
+        self._clients.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._clients),
+            "max_clients": self.max_clients,
+            "queue_size": self.queue_size,
+            "poll_seconds": self.poll_seconds,
+            "polls": self.polls,
+            "events_published": self.events_published,
+            "last_event_id": self._seq,
+            "resyncs": self.resyncs,
+            "tracked_bikes": len(self._known),
+            "last_error": self.last_error,
+        }
+
+
+prediction_broadcaster = PredictionBroadcaster()
@@ -0,0 +1,307 @@
+from sqlalchemy import String, case, func, or_, select, type_coerce
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.concurrency import run_in_threadpool
+from typing import Callable, List, Dict, Any, Optional
+from datetime import datetime, time
+import numpy as np
+import models
+from feature_store import FEATURE_SOURCE, RECENT_RIDES_WINDOW, features_query
+
+# Feature order expected by the model trained in scripts/train_model.py
+FEATURE_COLUMNS = [
+    "total_distance_km",
+    "km_since_service",
+    "days_since_service",
+    "avg_vibration_last_10",
+]
+
+# Value used for days_since_service when a bike was never serviced
+NEVER_SERVICED_DAYS = 999.0
+
+# Failure probability cut-offs used to map model scores to priorities
+HIGH_RISK_PROBABILITY = 0.7
+MEDIUM_RISK_PROBABILITY = 0.4
+
+# Maintenance priorities, least urgent first
+PRIORITY_LEVELS = ("low", "medium", "high")
+
+# Called as listener(bike_ids, features, probabilities, model_version) after
+# every batch scored by the model (see drift_monitor.py)
+_score_listeners: List[Callable] = []
+
+
+def add_score_listener(listener: Callable) -> None:
+    _score_listeners.append(listener)
+
+
+def fleet_features_query(window: int = RECENT_RIDES_WINDOW):
+    """Build one set-based query returning the features of every bike.
+
+    Rides are ranked per bike with ROW_NUMBER() so the last ``window`` rides of
+    the whole fleet are aggregated in a single round trip instead of one
+    query per bike. Maintenance history is aggregated in the same statement
+    to provide the service-related model features.
+    """
+    ride = models.Ride.__table__
+    bike = models.Bike.__table__
+    maintenance = models.MaintenanceRecord.__table__
+
+    ranked = select(
+        ride.c.bike_id,
+        ride.c.distance_km,
+        ride.c.avg_vibration,
+        func.row_number().over(
+            partition_by=ride.c.bike_id,
+            order_by=(ride.c.start_time.desc(), ride.c.ride_id.desc()),
+        ).label("rn"),
+    ).subquery("ranked_rides")
+
+    # AVG/SUM skip NULLs, matching the per-ride None checks of the old loop
+    recent = (
+        select(
+            ranked.c.bike_id,
+            func.avg(ranked.c.avg_vibration).label("avg_vibration"),
+            func.sum(ranked.c.distance_km).label("recent_distance_km"),
+            func.count().label("recent_rides_count"),
+        )
+        .where(ranked.c.rn <= window)
+        .group_by(ranked.c.bike_id)
+        .subquery("recent_rides")
+    )
+
+    service = (
+        select(
+            maintenance.c.bike_id,
+            # Read back as text: rows loaded through pandas may hold timestamps
+            type_coerce(
+                func.max(maintenance.c.maintenance_date), String
+            ).label("last_maintenance_date"),
+            func.max(
+                case((maintenance.c.action == "replaced", maintenance.c.maintenance_date))
+            ).label("last_replaced_date"),
+        )
+        .group_by(maintenance.c.bike_id)
+        .subquery("service")
+    )
+
+    # Distance ridden since the last replacement (all rides if never replaced)
+    since_service = (
+        select(
+            ride.c.bike_id,
+            func.sum(ride.c.distance_km).label("km_since_service"),
+        )
+        .select_from(ride.outerjoin(service, service.c.bike_id == ride.c.bike_id))
+        .where(
+            or_(
+                service.c.last_replaced_date.is_(None),
+                ride.c.end_time > service.c.last_replaced_date,
+            )
+        )
+        .group_by(ride.c.bike_id)
+        .subquery("since_service")
+    )
+
+    return (
+        select(
+            bike.c.bike_id,
+            bike.c.status,
+            bike.c.last_serviced_date,
+            bike.c.total_distance_km,
+            recent.c.avg_vibration,
+            recent.c.recent_distance_km,
+            recent.c.recent_rides_count,
+            service.c.last_maintenance_date,
+            case(
+                (
+                    service.c.last_replaced_date.is_(None),
+                    func.coalesce(since_service.c.km_since_service, bike.c.total_distance_km),
+                ),
+                else_=func.coalesce(since_service.c.km_since_service, 0),
+            ).label("km_since_service"),
+        )
+        .outerjoin(recent, recent.c.bike_id == bike.c.bike_id)
+        .outerjoin(service, service.c.bike_id == bike.c.bike_id)
+        .outerjoin(since_service, since_service.c.bike_id == bike.c.bike_id)
+        .order_by(bike.c.bike_id)
+    )
+
+
+def days_since(value, now: Optional[datetime] = None) -> float:
+    """Fractional days between a maintenance date and now (999 if never)"""
+    if value is None:
+        return NEVER_SERVICED_DAYS
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, time())
+    now = now or datetime.now()
+    return (now - value).total_seconds() / 86400
+
+
+def feature_matrix(rows, now: Optional[datetime] = None) -> np.ndarray:
+    """Stack the model features of every row into one (n_bikes, 4) matrix"""
+    now = now or datetime.now()
+    matrix = np.empty((len(rows), len(FEATURE_COLUMNS)), dtype=np.float32)
+    for i, row in enumerate(rows):
+        matrix[i, 0] = row.total_distance_km or 0
+        matrix[i, 1] = row.km_since_service or 0
+        matrix[i, 2] = days_since(row.last_maintenance_date, now)
+        matrix[i, 3] = row.avg_vibration or 0
+    return matrix
+
+
+def build_prediction(row) -> Dict[str, Any]:
+    """Apply the threshold rules to one row of fleet features"""
+    avg_vibration = row.avg_vibration or 0
+    recent_distance = row.recent_distance_km or 0
+
+    # Safe access to bike attributes
+    total_distance = row.total_distance_km or 0
+    bike_status = row.status or "active"
+
+    issues = []
+    confidence = 0.5
+    priority = "low"
+
+    if avg_vibration > 0.8:
+        priority = "high"
+        issues.extend(["suspension issues", "wheel alignment"])
+        confidence = max(confidence, 0.9)
+    elif avg_vibration > 0.5:
+        priority = "medium"
+        issues.extend(["tire pressure", "general checkup"])
+        confidence = max(confidence, 0.7)
+
+    if total_distance > 2000:
+        priority = "high"
+        issues.extend(["chain wear", "brake pads", "bearing replacement"])
+        confidence = max(confidence, 0.85)
+    elif total_distance > 1000:
+        priority = "medium" if priority != "high" else "high"
+        issues.extend(["chain lubrication", "brake adjustment"])
+        confidence = max(confidence, 0.65)
+
+    # If no specific issues found, recommend routine maintenance
+    if not issues:
+        priority = "low"
+        issues = ["routine maintenance"]
+        confidence = 0.5
+
+    # Remove duplicates while keeping a stable order
+    issues = list(dict.fromkeys(issues))
+
+    # Safe date formatting
+    last_service = None
+    if row.last_serviced_date:
+        if isinstance(row.last_serviced_date, str):
+            last_service = row.last_serviced_date
+        else:
+            last_service = row.last_serviced_date.isoformat()
+
+    return {
+        "bike_id": row.bike_id,
+        "bike_status": bike_status,
+        "total_distance_km": total_distance,
+        "recent_distance_km": recent_distance,
+        "avg_vibration": round(avg_vibration, 2),
+        "maintenance_priority": priority,
+        "predicted_issues": issues,
+        "confidence_score": round(confidence, 2),
+        "recommended_maintenance": f"Check {', '.join(issues)}",
+        "last_service": last_service or "Never",
+        "recent_rides_count": row.recent_rides_count or 0,
+    }
+
+
+def prediction_variant(model_server=None, source: str = FEATURE_SOURCE) -> str:
+    """Identify what produced a prediction, for cache keys and ETags"""
+    if model_server is not None and model_server.available:
+        return f"{source}:model:{model_server.version}"
+    return f"{source}:threshold"
+
+
+def apply_model_score(prediction: Dict[str, Any], probability: float) -> Dict[str, Any]:
+    """Replace the rule-based priority and confidence with a model score"""
+    if probability >= HIGH_RISK_PROBABILITY:
+        priority = "high"
+    elif probability >= MEDIUM_RISK_PROBABILITY:
+        priority = "medium"
+    else:
+        priority = "low"
+    prediction["maintenance_priority"] = priority
+    prediction["confidence_score"] = round(probability, 2)
+    prediction["prediction_source"] = "model"
+    return prediction
+
+
+def prediction_query(source: str = FEATURE_SOURCE, bike_ids: Optional[List[int]] = None):
+    """Feature query for the fleet, or for ``bike_ids`` only"""
+    query = fleet_features_query() if source == "rides" else features_query()
+    if bike_ids is not None:
+        query = query.where(models.Bike.__table__.c.bike_id.in_(bike_ids))
+    return query
+
+
+def predictions_from_rows(rows, model_server=None, features: Optional[np.ndarray] = None,
+                          record: bool = True) -> List[Dict[str, Any]]:
+    """Turn feature rows into predictions, scoring them in one batch.
+
+    ``features`` is the rows' feature_matrix, when the caller already has it.
+    Model scores are passed to the score listeners unless ``record`` is
+    false (hypothetical what-if rows).
+    """
+    predictions = [build_prediction(row) for row in rows]
+
+    probabilities = None
+    if model_server is not None and rows:
+        if features is None:
+            features = feature_matrix(rows)
+        probabilities = model_server.predict_proba(features)
+
+    if probabilities is None:
+        for prediction in predictions:
+            prediction["prediction_source"] = "threshold"
+        return predictions
+
+    if record:
+        bike_ids = [row.bike_id for row in rows]
+        for listener in _score_listeners:
+            listener(bike_ids, features, probabilities, model_server.version)
+
+    for prediction, probability in zip(predictions, probabilities):
+        apply_model_score(prediction, float(probability))
+    return predictions
+
+
+def get_fleet_predictions(
+    db: Session,
+    model_server=None,
+    source: str = FEATURE_SOURCE,
+    bike_ids: Optional[List[int]] = None,
+) -> List[Dict[str, Any]]:
+    """Compute predictions for the whole fleet with a single query.
+
+    Features are read from the incrementally maintained ``bike_features``
+    store by default, or recomputed from raw rides when ``source`` is
+    ``"rides"``. When ``model_server`` has a model loaded the fleet is scored
+    with one batched ``predict_proba`` call; otherwise the threshold rules
+    are used. ``bike_ids`` restricts the result to those bikes.
+    """
+    rows = db.execute(prediction_query(source, bike_ids)).all()
+    return predictions_from_rows(rows, model_server)
+
+
+async def get_fleet_predictions_async(
+    db: AsyncSession,
+    model_server=None,
+    source: str = FEATURE_SOURCE,
+    bike_ids: Optional[List[int]] = None,
+) -> List[Dict[str, Any]]:
+    """Async counterpart of get_fleet_predictions.
+
+    The query runs on the event loop; scoring is CPU-bound and runs in the
+    threadpool so it does not block other requests.
+    """
+    rows = (await db.execute(prediction_query(source, bike_ids))).all()
+    return await run_in_threadpool(predictions_from_rows, rows, model_server)
@@ -0,0 +1,202 @@
+import gzip
+import io
+import os
+import zlib
+from datetime import date, datetime
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import msgpack
+import orjson
+from fastapi import HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer
+
+try:
+    import brotli  # in requirements.txt; "br" is only negotiated when it is installed
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+# Fast settings: the API compresses on every request, it is not archiving
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "1"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+# Payloads with more rows than this are encoded on the threadpool, not the event loop
+INLINE_ENCODE_ROWS = 1000
+
+# Body formats negotiated from ?format= or the Accept header
+FORMATS = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+MEDIA_TYPES = {
+    **{media_type: fmt for fmt, media_type in FORMATS.items()},
+    "application/x-msgpack": "msgpack",
+    "application/vnd.apache.arrow.file": "arrow",
+}
+VARY = "Accept, Accept-Encoding"
+
+
+def _preferences(header: Optional[str]) -> List[tuple]:
+    """(value, q) pairs of an Accept-style header, best first, q=0 dropped"""
+    preferences = []
+    for position, item in enumerate((header or "").split(",")):
+        value, *params = [part.strip() for part in item.split(";")]
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, number = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            preferences.append((-q, position, value.lower()))
+    return [(value, -q) for q, _, value in sorted(preferences)]
+
+
+def negotiate_format(request: Request, fmt: Optional[str], extra: Iterable[str] = ()) -> str:
+    """The body format: ``?format=`` wins, then the best supported Accept entry, then JSON"""
+    if fmt is not None:
+        if fmt not in FORMATS and fmt not in extra:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown format '{fmt}', expected one of {[*FORMATS, *extra]}"
+            )
+        return fmt
+    for media_type, _ in _preferences(request.headers.get("accept")):
+        if media_type in MEDIA_TYPES:
+            return MEDIA_TYPES[media_type]
+        if media_type in ("*/*", "application/*"):
+            break
+    return "json"
+
+
+def negotiate_encoding(request: Request) -> Optional[str]:
+    """"br" or "gzip" when the client accepts it, preferring its higher q"""
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    for encoding, _ in _preferences(request.headers.get("accept-encoding")):
+        if encoding in supported:
+            return encoding
+        if encoding == "*":
+            return supported[0]
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def compress_stream(chunks: Iterable, encoding: Optional[str]) -> Iterator[bytes]:
+    """Compress a streamed body chunk by chunk"""
+    if encoding is None:
+        yield from chunks
+        return
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+        process, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = process(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def _msgpack_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def arrow_type(column_type):
+    """Arrow type for a SQLAlchemy column type"""
+    import pyarrow as pa  # slow to import; only loaded once Arrow is asked for
+
+    if isinstance(column_type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column_type, Date):
+        return pa.date32()
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    if isinstance(column_type, Float):
+        return pa.float64()
+    return pa.string()
+
+
+def encode_columns(columns: Sequence[str], data: Sequence[list], fmt: str, types: Sequence = ()) -> bytes:
+    """Encode a column-major page.
+
+    JSON keeps the list-of-objects shape the endpoints always returned.
+    MessagePack is a map of column name to values and Arrow an IPC stream
+    with one record batch, so neither builds a dict per row. Dates and
+    times may arrive as objects or ISO strings (pages read back from Redis).
+    """
+    if fmt == "json":
+        return orjson.dumps([dict(zip(columns, row)) for row in zip(*data)])
+    if fmt == "msgpack":
+        return msgpack.packb(dict(zip(columns, data)), default=_msgpack_default)
+
+    import pyarrow as pa
+
+    arrays = []
+    for index, values in enumerate(data):
+        array = pa.array(values)
+        if index < len(types):
+            array = array.cast(arrow_type(types[index]))
+        arrays.append(array)
+    return _arrow_ipc(pa.table(arrays, names=list(columns)))
+
+
+def encode_records(records: List[Dict[str, Any]], fmt: str) -> bytes:
+    """Encode a list of dicts (predictions); Arrow maps nested values to list/struct columns"""
+    if fmt == "json":
+        return orjson.dumps(records)
+    if fmt == "msgpack":
+        return msgpack.packb(records, default=_msgpack_default)
+
+    import pyarrow as pa
+
+    return _arrow_ipc(pa.Table.from_pylist(records))
+
+
+def _arrow_ipc(table) -> bytes:
+    import pyarrow as pa
+
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+async def formatted_response(request: Request, fmt: str, *, records: Optional[List[Dict[str, Any]]] = None,
+                             columns: Sequence[str] = (), data: Sequence[list] = (), types: Sequence = (),
+                             headers: Optional[Dict[str, str]] = None) -> Response:
+    """Response with ``records`` (or a column-major page) in ``fmt``, compressed
+    when the client accepts it. Skips FastAPI's response validation."""
+    if records is not None:
+        rows = len(records)
+        encode = partial(encode_records, records, fmt)
+    else:
+        rows = len(data[0]) if data else 0
+        encode = partial(encode_columns, columns, data, fmt, types)
+    offload = rows > INLINE_ENCODE_ROWS
+    body = await run_in_threadpool(encode) if offload else encode()
+
+    headers = {**(headers or {}), "Vary": VARY}
+    encoding = negotiate_encoding(request)
+    if encoding is not None and len(body) >= RESPONSE_COMPRESS_MIN_BYTES:
+        body = await run_in_threadpool(compress, body, encoding) if offload else compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=FORMATS[fmt], headers=headers)
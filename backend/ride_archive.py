@@ -0,0 +1,322 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.engine import Engine
+
+import models
+from training_features import CHUNK_SIZE, read_chunks
+
+# Root directory of the Parquet files; by default data/ride_archive/ in the
+# backend directory. The catalog stores paths relative to it, so a relative
+# RIDE_ARCHIVE_DIR is also taken from the backend directory, whatever the
+# working directory
+RIDE_ARCHIVE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.getenv("RIDE_ARCHIVE_DIR", os.path.join("data", "ride_archive"))
+)
+# Rides that started more than this many days ago are moved out of the
+# rides table by scripts/archive_rides.py
+RIDE_ARCHIVE_AFTER_DAYS = int(os.getenv("RIDE_ARCHIVE_AFTER_DAYS", "365"))
+RIDE_ARCHIVE_COMPRESSION = os.getenv("RIDE_ARCHIVE_COMPRESSION", "zstd")
+# Files are partitioned by month and bike_id % ARCHIVE_SHARDS; part of the
+# on-disk layout, so not configurable
+ARCHIVE_SHARDS = 16
+# Rows per Parquet row group; min/max statistics are kept per group, so
+# bike_id and start_time filters skip whole groups
+ROW_GROUP_SIZE = 64_000
+# Ride ids deleted per statement
+DELETE_BATCH_SIZE = 5_000
+
+RIDE_COLUMNS = [
+    "ride_id", "bike_id", "start_time", "end_time", "start_lat", "start_lon", "end_lat", "end_lon",
+    "distance_km", "avg_vibration", "weather_condition", "created_at",
+]
+SCHEMA = pa.schema([
+    ("ride_id", pa.int64()),
+    ("bike_id", pa.int64()),
+    ("start_time", pa.timestamp("us")),
+    ("end_time", pa.timestamp("us")),
+    ("start_lat", pa.float64()),
+    ("start_lon", pa.float64()),
+    ("end_lat", pa.float64()),
+    ("end_lon", pa.float64()),
+    ("distance_km", pa.float64()),
+    ("avg_vibration", pa.float64()),
+    ("weather_condition", pa.string()),
+    ("created_at", pa.timestamp("us")),
+])
+PARTITIONING = ds.partitioning(pa.schema([("month", pa.string()), ("shard", pa.int32())]), flavor="hive")
+TIME_COLUMNS = ("start_time", "end_time", "created_at")
+
+
+def _rows(bind, query) -> list:
+    """Run a query on an Engine, Connection or Session"""
+    if isinstance(bind, Engine):
+        with bind.connect() as conn:
+            return conn.execute(query).all()
+    return bind.execute(query).all()
+
+
+def _month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(value: datetime) -> datetime:
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def archived_parts(bind, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   first_bike_id: Optional[int] = None, last_bike_id: Optional[int] = None) -> List[str]:
+    """Paths of committed archive files that can hold matching rides"""
+    part = models.RideArchivePart.__table__
+    query = select(part.c.path).order_by(part.c.month, part.c.shard, part.c.min_start_time)
+    if since is not None:
+        query = query.where(part.c.max_start_time >= since)
+    if until is not None:
+        query = query.where(part.c.min_start_time <= until)
+    if first_bike_id is not None:
+        query = query.where(part.c.max_bike_id >= first_bike_id)
+    if last_bike_id is not None:
+        query = query.where(part.c.min_bike_id <= last_bike_id)
+    if first_bike_id is not None and last_bike_id is not None and last_bike_id - first_bike_id < ARCHIVE_SHARDS:
+        query = query.where(part.c.shard.in_({b % ARCHIVE_SHARDS for b in range(first_bike_id, last_bike_id + 1)}))
+    return [path for (path,) in _rows(bind, query)]
+
+
+def read_archived(bind, columns: Sequence[str] = RIDE_COLUMNS, since: Optional[datetime] = None,
+                  until: Optional[datetime] = None, first_bike_id: Optional[int] = None,
+                  last_bike_id: Optional[int] = None, batch_size: int = CHUNK_SIZE,
+                  archive_dir: str = RIDE_ARCHIVE_DIR) -> Iterator[pd.DataFrame]:
+    """Archived rides with since <= start_time <= until and bike ids in range.
+
+    Files are pruned through the catalog, then the filter is pushed down to
+    Parquet so row groups outside the range are never decoded. Yields
+    DataFrames of at most ``batch_size`` rows in no particular order.
+    """
+    paths = archived_parts(bind, since, until, first_bike_id, last_bike_id)
+    if not paths:
+        return
+    dataset = ds.dataset(
+        [os.path.join(archive_dir, path) for path in paths], schema=SCHEMA, format="parquet",
+        partitioning=PARTITIONING, partition_base_dir=archive_dir,
+    )
+    conditions = []
+    if since is not None:
+        conditions.append(ds.field("start_time") >= pa.scalar(since, pa.timestamp("us")))
+    if until is not None:
+        conditions.append(ds.field("start_time") <= pa.scalar(until, pa.timestamp("us")))
+    if first_bike_id is not None:
+        conditions.append(ds.field("bike_id") >= first_bike_id)
+    if last_bike_id is not None:
+        conditions.append(ds.field("bike_id") <= last_bike_id)
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    for batch in dataset.to_batches(columns=list(columns), filter=expression, batch_size=batch_size):
+        if batch.num_rows:
+            frame = batch.to_pandas()
+            for column in TIME_COLUMNS:
+                if column in frame:
+                    frame[column] = frame[column].astype("datetime64[ns]")
+            yield frame
+
+
+def read_rides(engine, columns: Sequence[str] = RIDE_COLUMNS, since: Optional[datetime] = None,
+               until: Optional[datetime] = None, first_bike_id: Optional[int] = None,
+               last_bike_id: Optional[int] = None, chunksize: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Archived and live rides together, as DataFrames of at most ``chunksize`` rows.
+
+    Archived chunks come first, then the rides table; within each, chunks
+    are in no guaranteed order. start_time bounds are inclusive.
+    """
+    yield from read_archived(engine, columns, since, until, first_bike_id, last_bike_id, chunksize)
+
+    ride = models.Ride.__table__
+    query = select(*[ride.c[column] for column in columns])
+    if since is not None:
+        query = query.where(ride.c.start_time >= since)
+    if until is not None:
+        query = query.where(ride.c.start_time <= until)
+    if first_bike_id is not None:
+        query = query.where(ride.c.bike_id >= first_bike_id)
+    if last_bike_id is not None:
+        query = query.where(ride.c.bike_id <= last_bike_id)
+    for chunk in read_chunks(engine, query, chunksize):
+        # SQLite hands back text, PostgreSQL datetimes; both parse the same
+        for column in TIME_COLUMNS:
+            if column in chunk:
+                chunk[column] = pd.to_datetime(chunk[column], format="ISO8601").astype("datetime64[ns]")
+        yield chunk
+
+
+def archive_span(bind) -> tuple:
+    """(earliest, latest) archived start_time; (None, None) when nothing is archived"""
+    part = models.RideArchivePart.__table__
+    first, last = _rows(bind, select(func.min(part.c.min_start_time), func.max(part.c.max_start_time)))[0]
+    return first, last
+
+
+def archived_ride_summary(bind, replaced_dates: Dict[int, Any], window: int) -> Dict[int, Dict[str, Any]]:
+    """Per bike with archived rides: km of those ending after its last
+    replacement, its last ``window`` archived rides as [vibration, distance]
+    (oldest first) and its latest archived start_time"""
+    replaced = pd.Series(
+        {bike_id: pd.Timestamp(day) for bike_id, day in replaced_dates.items() if day is not None},
+        dtype="datetime64[ns]",
+    )
+    km = pd.Series(dtype="float64")
+    recent = None
+    columns = ["ride_id", "bike_id", "start_time", "end_time", "distance_km", "avg_vibration"]
+    for chunk in read_archived(bind, columns):
+        cutoff = chunk["bike_id"].map(replaced)
+        after = cutoff.isna() | (chunk["end_time"] > cutoff)
+        km = km.add(chunk["distance_km"].fillna(0).where(after, 0).groupby(chunk["bike_id"]).sum(), fill_value=0)
+        rows = chunk[["bike_id", "start_time", "ride_id", "avg_vibration", "distance_km"]]
+        if recent is not None:
+            rows = pd.concat([recent, rows], ignore_index=True)
+        recent = rows.sort_values(["bike_id", "start_time", "ride_id"]).groupby("bike_id").tail(window)
+    if recent is None:
+        return {}
+
+    summary = {}
+    recent = recent.astype({"avg_vibration": object, "distance_km": object})
+    recent = recent.where(recent.notna(), None)
+    for bike_id, rows in recent.groupby("bike_id"):
+        summary[int(bike_id)] = {
+            "km_since_service": float(km.get(bike_id, 0.0)),
+            "window": rows[["avg_vibration", "distance_km"]].values.tolist(),
+            "last_ride_start_time": rows["start_time"].iloc[-1].to_pydatetime(),
+        }
+    return summary
+
+
+def _write_parts(frame: pd.DataFrame, month: str, archive_dir: str, run: str) -> List[Dict[str, Any]]:
+    """Write one month of rides as one file per bike shard; returns catalog rows"""
+    parts = []
+    frame = frame.assign(shard=frame["bike_id"] % ARCHIVE_SHARDS)
+    for shard, rows in frame.groupby("shard", sort=True):
+        rows = rows.drop(columns="shard").sort_values(["bike_id", "start_time", "ride_id"])
+        path = os.path.join(f"month={month}", f"shard={int(shard):02d}", f"part-{run}.parquet")
+        full_path = os.path.join(archive_dir, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        table = pa.Table.from_pandas(rows, schema=SCHEMA, preserve_index=False)
+        pq.write_table(table, full_path, compression=RIDE_ARCHIVE_COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+        parts.append({
+            "path": path,
+            "month": month,
+            "shard": int(shard),
+            "rides": len(rows),
+            "min_bike_id": int(rows["bike_id"].min()),
+            "max_bike_id": int(rows["bike_id"].max()),
+            "min_start_time": rows["start_time"].min().to_pydatetime(),
+            "max_start_time": rows["start_time"].max().to_pydatetime(),
+            "max_end_time": rows["end_time"].max().to_pydatetime() if rows["end_time"].notna().any() else None,
+            "bytes": os.path.getsize(full_path),
+        })
+    return parts
+
+
+def remove_orphans(engine, archive_dir: str = RIDE_ARCHIVE_DIR) -> int:
+    """Delete files left by archive runs that failed before committing"""
+    if not os.path.isdir(archive_dir):
+        return 0
+    known = set(archived_parts(engine))
+    removed = 0
+    for directory, _, names in os.walk(archive_dir):
+        for name in names:
+            path = os.path.relpath(os.path.join(directory, name), archive_dir)
+            if name.endswith(".parquet") and path not in known:
+                os.remove(os.path.join(directory, name))
+                removed += 1
+    return removed
+
+
+def archive_rides(engine, before: Optional[datetime] = None, archive_dir: str = RIDE_ARCHIVE_DIR,
+                  dry_run: bool = False) -> Dict[str, Any]:
+    """Move rides that started before ``before`` into Parquet, a month at a time.
+
+    Each month's files are written first and then, in one transaction, the
+    rides are deleted and the files registered in ride_archive_parts, so a
+    failure at any point leaves every ride readable exactly once. Rides
+    referenced by a maintenance record stay in the table (foreign key).
+    Rollups, bike totals and the feature store already include the moved
+    rides and are left as they are.
+    """
+    before = before or datetime.combine(datetime.now().date(), datetime.min.time()) - timedelta(
+        days=RIDE_ARCHIVE_AFTER_DAYS
+    )
+    ride = models.Ride.__table__
+    maintenance = models.MaintenanceRecord.__table__
+    catalog = models.RideArchivePart.__table__
+    referenced = exists().where(maintenance.c.associated_ride_id == ride.c.ride_id)
+    summary = {"before": before.isoformat(), "months": 0, "rides": 0, "files": 0, "bytes": 0}
+    if not dry_run:
+        summary["orphans_removed"] = remove_orphans(engine, archive_dir)
+
+    with engine.connect() as conn:
+        first = conn.execute(select(func.min(ride.c.start_time)).where(ride.c.start_time < before)).scalar()
+    if first is None:
+        return summary
+
+    run = f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+    month_start = _month_start(pd.Timestamp(first).to_pydatetime())
+    while month_start < before:
+        month_end = min(_next_month(month_start), before)
+        query = (
+            select(*[ride.c[column] for column in RIDE_COLUMNS])
+            .where(ride.c.start_time >= month_start, ride.c.start_time < month_end, ~referenced)
+        )
+        chunks = list(read_chunks(engine, query))
+        month = f"{month_start:%Y-%m}"
+        month_start = _next_month(month_start)
+        if not chunks:
+            continue
+        frame = pd.concat(chunks, ignore_index=True)
+        for column in TIME_COLUMNS:
+            frame[column] = pd.to_datetime(frame[column], format="ISO8601")
+        summary["months"] += 1
+        summary["rides"] += len(frame)
+        if dry_run:
+            continue
+
+        parts = _write_parts(frame, month, archive_dir, run)
+        try:
+            with engine.begin() as conn:
+                ride_ids = frame["ride_id"].tolist()
+                for i in range(0, len(ride_ids), DELETE_BATCH_SIZE):
+                    conn.execute(delete(ride).where(ride.c.ride_id.in_(ride_ids[i:i + DELETE_BATCH_SIZE])))
+                archived_at = datetime.now()
+                conn.execute(catalog.insert(), [{**part, "archived_at": archived_at} for part in parts])
+        except Exception:
+            for part in parts:
+                os.remove(os.path.join(archive_dir, part["path"]))
+            raise
+        summary["files"] += len(parts)
+        summary["bytes"] += sum(part["bytes"] for part in parts)
+        print(f"Archived {len(frame)} rides from {month} into {len(parts)} files", flush=True)
+    return summary
+
+
+def stats(engine) -> Dict[str, Any]:
+    catalog = models.RideArchivePart.__table__
+    ride = models.Ride.__table__
+    files, rides, size, first, last = _rows(engine, select(
+        func.count(), func.sum(catalog.c.rides), func.sum(catalog.c.bytes),
+        func.min(catalog.c.min_start_time), func.max(catalog.c.max_start_time),
+    ))[0]
+    hot = _rows(engine, select(func.count()).select_from(ride))[0][0]
+    return {
+        "archive_dir": RIDE_ARCHIVE_DIR,
+        "files": files,
+        "archived_rides": rides or 0,
+        "archived_bytes": size or 0,
+        "first_start_time": str(first) if first is not None else None,
+        "last_start_time": str(last) if last is not None else None,
+        "live_rides": hot,
+    }
@@ -0,0 +1,353 @@
+import math
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Date, and_, bindparam, case, cast, delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+import models
+
+# Upper edges of the vibration histogram buckets (the last bucket is open);
+# 0.5 and 0.8 are the thresholds used by predictions.build_prediction
+VIBRATION_BUCKET_EDGES = [0.5, 0.8, 1.0, 2.0, 5.0, 10.0]
+BUCKET_COLUMNS = [f"vibration_bucket_{i}" for i in range(len(VIBRATION_BUCKET_EDGES) + 1)]
+
+# Stored instead of NULL, which primary key columns cannot hold
+UNKNOWN = "unknown"
+
+RIDE_SUM_COLUMNS = ["rides", "distance_km", "vibration_count", "vibration_sum", "vibration_sq_sum"] + BUCKET_COLUMNS
+RIDE_KEY_COLUMNS = ["day", "bike_id", "weather_condition"]
+
+
+def day_of(column, dialect: str):
+    """SQL expression for the calendar day of a DATE/TIMESTAMP column"""
+    # CAST(... AS DATE) on SQLite yields a number, date() the ISO day
+    return func.date(column) if dialect == "sqlite" else cast(column, Date)
+
+
+def dialect_insert_for(db: Session):
+    """The dialect name and its insert() supporting ON CONFLICT"""
+    dialect = db.get_bind().dialect.name
+    # database.check_dialect() admits only PostgreSQL and SQLite
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect, dialect_insert
+
+
+def ride_rollup_rows(rides) -> List[Dict[str, Any]]:
+    """Aggregate ride objects (attributes or dicts) into rollup rows"""
+    rows: Dict[tuple, Dict[str, Any]] = {}
+    for ride in rides:
+        get = ride.get if isinstance(ride, dict) else lambda name: getattr(ride, name, None)
+        start_time = get("start_time")
+        if start_time is None:
+            continue
+        key = (start_time.date(), get("bike_id"), get("weather_condition") or UNKNOWN)
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = dict(zip(RIDE_KEY_COLUMNS, key), vibration_min=None, vibration_max=None,
+                                   **{column: 0 for column in RIDE_SUM_COLUMNS})
+        row["rides"] += 1
+        row["distance_km"] += get("distance_km") or 0
+        vibration = get("avg_vibration")
+        if vibration is not None:
+            row["vibration_count"] += 1
+            row["vibration_sum"] += vibration
+            row["vibration_sq_sum"] += vibration * vibration
+            row["vibration_min"] = vibration if row["vibration_min"] is None else min(row["vibration_min"], vibration)
+            row["vibration_max"] = vibration if row["vibration_max"] is None else max(row["vibration_max"], vibration)
+            row[BUCKET_COLUMNS[bisect_right(VIBRATION_BUCKET_EDGES, vibration)]] += 1
+    return list(rows.values())
+
+
+def apply_rides(db: Session, rides) -> None:
+    """Add newly inserted rides to the daily rollups with one upsert.
+
+    Runs in the caller's transaction, next to feature_store.apply_rides.
+    """
+    upsert_ride_rollups(db, ride_rollup_rows(rides))
+
+
+def upsert_ride_rollups(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Add rollup rows to the stored ones, inserting missing keys"""
+    if not rows:
+        return
+    dialect, dialect_insert = dialect_insert_for(db)
+    table = models.RideRollup.__table__
+    least, greatest = (func.min, func.max) if dialect == "sqlite" else (func.least, func.greatest)
+    statement = dialect_insert(table)
+    excluded = statement.excluded
+    updates = {column: table.c[column] + excluded[column] for column in RIDE_SUM_COLUMNS}
+    for column, pick in (("vibration_min", least), ("vibration_max", greatest)):
+        # NULL-safe: keep whichever side has a value
+        updates[column] = pick(
+            func.coalesce(table.c[column], excluded[column]), func.coalesce(excluded[column], table.c[column])
+        )
+    db.execute(statement.on_conflict_do_update(index_elements=RIDE_KEY_COLUMNS, set_=updates), rows)
+
+
+def ride_rollup_query(dialect: str, start: Optional[date] = None, end: Optional[date] = None):
+    """SELECT producing ride rollup rows for rides starting in [start, end]"""
+    ride = models.Ride.__table__
+    vibration = ride.c.avg_vibration
+    has_vibration = vibration.isnot(None)
+    buckets = []
+    lower = None
+    for i, column in enumerate(BUCKET_COLUMNS):
+        upper = VIBRATION_BUCKET_EDGES[i] if i < len(VIBRATION_BUCKET_EDGES) else None
+        condition = [has_vibration]
+        if lower is not None:
+            condition.append(vibration >= lower)
+        if upper is not None:
+            condition.append(vibration < upper)
+        buckets.append(func.sum(case((and_(*condition), 1), else_=0)).label(column))
+        lower = upper
+
+    day = day_of(ride.c.start_time, dialect)
+    weather = func.coalesce(ride.c.weather_condition, UNKNOWN)
+    query = select(
+        day.label("day"),
+        ride.c.bike_id,
+        weather.label("weather_condition"),
+        func.count().label("rides"),
+        func.coalesce(func.sum(ride.c.distance_km), 0).label("distance_km"),
+        func.count(vibration).label("vibration_count"),
+        func.coalesce(func.sum(vibration), 0).label("vibration_sum"),
+        func.coalesce(func.sum(vibration * vibration), 0).label("vibration_sq_sum"),
+        func.min(vibration).label("vibration_min"),
+        func.max(vibration).label("vibration_max"),
+        *buckets,
+    ).where(ride.c.start_time.isnot(None))
+    if start is not None:
+        query = query.where(ride.c.start_time >= datetime.combine(start, time()))
+    if end is not None:
+        query = query.where(ride.c.start_time < datetime.combine(end + timedelta(days=1), time()))
+    return query.group_by(day, ride.c.bike_id, weather)
+
+
+def _replacement_history():
+    """Maintenance records with the date of the previous replacement of the
+    same component on the same bike (NULL for non-replacements)"""
+    maintenance = models.MaintenanceRecord.__table__
+    component = func.coalesce(maintenance.c.component, UNKNOWN)
+    return select(
+        maintenance.c.bike_id,
+        maintenance.c.maintenance_date,
+        component.label("component"),
+        func.coalesce(maintenance.c.action, UNKNOWN).label("action"),
+        case(
+            (
+                maintenance.c.action == "replaced",
+                func.lag(maintenance.c.maintenance_date).over(
+                    partition_by=(maintenance.c.bike_id, component, maintenance.c.action),
+                    order_by=(maintenance.c.maintenance_date, maintenance.c.record_id),
+                ),
+            ),
+        ).label("previous_replaced"),
+    ).where(maintenance.c.maintenance_date.isnot(None)).subquery("records")
+
+
+def maintenance_rollup_query(dialect: str, start: Optional[date] = None, end: Optional[date] = None):
+    """SELECT producing maintenance rollup rows for records dated in [start, end].
+
+    For each replacement the previous replacement of the same component on
+    the same bike is found with LAG() over the whole history, and the km in
+    between are the bike's rides that ended after the earlier replacement
+    day and by the later one (the feature store's km_since_service rule).
+    """
+    ride = models.Ride.__table__
+    records = _replacement_history()
+
+    interval_km = (
+        select(func.coalesce(func.sum(ride.c.distance_km), 0))
+        .where(
+            ride.c.bike_id == records.c.bike_id,
+            ride.c.end_time > records.c.previous_replaced,
+            ride.c.end_time <= records.c.maintenance_date,
+        )
+        .scalar_subquery()
+    )
+    day = day_of(records.c.maintenance_date, dialect)
+    query = select(
+        day.label("day"),
+        records.c.bike_id,
+        records.c.component,
+        records.c.action,
+        func.count().label("records"),
+        func.count(records.c.previous_replaced).label("intervals"),
+        func.coalesce(
+            func.sum(case((records.c.previous_replaced.isnot(None), interval_km))), literal(0.0)
+        ).label("interval_km_sum"),
+    )
+    if start is not None:
+        query = query.where(records.c.maintenance_date >= start)
+    if end is not None:
+        query = query.where(records.c.maintenance_date <= end)
+    return query.group_by(day, records.c.bike_id, records.c.component, records.c.action)
+
+
+def _archived_ride_rollups(db: Session, start: Optional[date], end: Optional[date]):
+    """Rollup rows of archived rides starting in [start, end], one list per chunk"""
+    import numpy as np
+    from ride_archive import read_archived
+
+    since = datetime.combine(start, time()) if start is not None else None
+    until = datetime.combine(end, time.max) if end is not None else None
+    columns = ["bike_id", "start_time", "distance_km", "avg_vibration", "weather_condition"]
+    for chunk in read_archived(db, columns, since, until):
+        vibration = chunk["avg_vibration"]
+        has_vibration = vibration.notna()
+        frame = chunk.assign(
+            day=chunk["start_time"].dt.date,
+            weather_condition=chunk["weather_condition"].fillna(UNKNOWN),
+            rides=1,
+            distance_km=chunk["distance_km"].fillna(0),
+            vibration_count=has_vibration.astype(int),
+            vibration_sum=vibration.fillna(0),
+            vibration_sq_sum=(vibration * vibration).fillna(0),
+            vibration_min=vibration,
+            vibration_max=vibration,
+        )
+        bucket = np.searchsorted(VIBRATION_BUCKET_EDGES, vibration.fillna(0), side="right")
+        for i, column in enumerate(BUCKET_COLUMNS):
+            frame[column] = ((bucket == i) & has_vibration).astype(int)
+        aggregates = {column: "sum" for column in RIDE_SUM_COLUMNS}
+        aggregates.update(vibration_min="min", vibration_max="max")
+        grouped = frame.groupby(RIDE_KEY_COLUMNS, as_index=False).agg(aggregates)
+        grouped = grouped.astype({"vibration_min": object, "vibration_max": object})
+        yield grouped.where(grouped.notna(), None).to_dict("records")
+
+
+def _add_archived_interval_km(db: Session, start: Optional[date], end: Optional[date]) -> None:
+    """Add the km of archived rides to the replacement intervals in [start, end]"""
+    import pandas as pd
+    from ride_archive import archived_parts, read_archived
+
+    if not archived_parts(db):
+        return
+    records = _replacement_history()
+    query = select(
+        records.c.bike_id, records.c.maintenance_date, records.c.component, records.c.previous_replaced,
+    ).where(records.c.previous_replaced.isnot(None))
+    if start is not None:
+        query = query.where(records.c.maintenance_date >= start)
+    if end is not None:
+        query = query.where(records.c.maintenance_date <= end)
+    intervals = pd.DataFrame(db.execute(query).all(), columns=["bike_id", "day", "component", "previous"])
+    if intervals.empty:
+        return
+    intervals["until"] = pd.to_datetime(intervals["day"]).astype("datetime64[ns]")
+    intervals["after"] = pd.to_datetime(intervals["previous"]).astype("datetime64[ns]")
+    intervals = intervals.sort_values("until")
+
+    parts = []
+    columns = ["bike_id", "end_time", "distance_km"]
+    for chunk in read_archived(db, columns, first_bike_id=int(intervals["bike_id"].min()),
+                               last_bike_id=int(intervals["bike_id"].max())):
+        rides = chunk.dropna(subset=["end_time"]).sort_values("end_time")
+        for _, component_intervals in intervals.groupby("component"):
+            # Intervals of one component on one bike are contiguous, so the
+            # first replacement at or after the ride's end is the only candidate
+            matched = pd.merge_asof(
+                rides, component_intervals, left_on="end_time", right_on="until", by="bike_id", direction="forward",
+            )
+            matched = matched[matched["until"].notna() & (matched["end_time"] > matched["after"])]
+            parts.append(matched.groupby(["bike_id", "day", "component"])["distance_km"].sum())
+    if not parts:
+        return
+    added = pd.concat(parts).groupby(level=[0, 1, 2]).sum()
+    if added.empty:
+        # No archived ride falls in any of the intervals
+        return
+    table = models.MaintenanceRollup.__table__
+    db.execute(
+        table.update()
+        .where(
+            table.c.day == bindparam("b_day"),
+            table.c.bike_id == bindparam("b_bike_id"),
+            table.c.component == bindparam("b_component"),
+            table.c.action == "replaced",
+        )
+        .values(interval_km_sum=table.c.interval_km_sum + bindparam("b_km")),
+        [
+            {"b_bike_id": int(bike_id), "b_day": day, "b_component": component, "b_km": float(km)}
+            for (bike_id, day, component), km in added.items()
+        ],
+    )
+
+
+def rebuild(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> Dict[str, int]:
+    """Recompute the rollups for days in [start, end] (all days by default).
+
+    Each table is cleared for the range and refilled with one
+    INSERT ... SELECT over the live tables; archived rides are then read
+    from Parquet and added on top.
+    """
+    counts = {}
+    for model in (models.RideRollup, models.MaintenanceRollup):
+        table = model.__table__
+        condition = _day_range(table, start, end)
+        if model is models.RideRollup:
+            _refill(db, table, ride_rollup_query(db.get_bind().dialect.name, start, end), condition)
+            # Archived rides are no longer in the rides table
+            for rows in _archived_ride_rollups(db, start, end):
+                upsert_ride_rollups(db, rows)
+        else:
+            _refill_maintenance(db, start, end)
+        counts[table.name] = db.execute(select(func.count()).select_from(table).where(*condition)).scalar()
+    db.commit()
+    return counts
+
+
+def _day_range(table, start: Optional[date], end: Optional[date]) -> list:
+    condition = []
+    if start is not None:
+        condition.append(table.c.day >= start)
+    if end is not None:
+        condition.append(table.c.day <= end)
+    return condition
+
+
+def _refill(db: Session, table, query, condition) -> None:
+    db.execute(delete(table).where(*condition))
+    columns = [c.name for c in query.selected_columns]
+    db.execute(insert(table).from_select(columns, query))
+
+
+def _refill_maintenance(db: Session, start: Optional[date], end: Optional[date]) -> None:
+    table = models.MaintenanceRollup.__table__
+    query = maintenance_rollup_query(db.get_bind().dialect.name, start, end)
+    _refill(db, table, query, _day_range(table, start, end))
+    _add_archived_interval_km(db, start, end)
+
+
+def apply_maintenance(db: Session, records) -> None:
+    """Fold newly inserted maintenance records into the rollups.
+
+    A day holds a handful of records, so the days they fall on are
+    recomputed rather than patched: a replacement's interval depends on
+    the bike's earlier replacements and the rides in between.
+    """
+    for day in sorted({r.maintenance_date for r in records if r.maintenance_date is not None}):
+        _refill_maintenance(db, day, day)
+
+
+def clear(db: Session) -> None:
+    db.execute(delete(models.RideRollup.__table__))
+    db.execute(delete(models.MaintenanceRollup.__table__))
+
+
+def bucket_labels() -> List[str]:
+    edges = [0.0] + VIBRATION_BUCKET_EDGES
+    labels = [f"{lower:g}-{upper:g}" for lower, upper in zip(edges, edges[1:])]
+    return labels + [f">={VIBRATION_BUCKET_EDGES[-1]:g}"]
+
+
+def stddev(count: int, total: float, sq_total: float) -> Optional[float]:
+    if not count:
+        return None
+    mean = total / count
+    return math.sqrt(max(sq_total / count - mean * mean, 0.0))
@@ -0,0 +1,52 @@
+"""Move old rides out of the rides table into the Parquet archive.
+
+    python scripts/archive_rides.py                        # older than RIDE_ARCHIVE_AFTER_DAYS
+    python scripts/archive_rides.py --older-than-days 180
+    python scripts/archive_rides.py --before 2025-01-01 --dry-run
+    python scripts/archive_rides.py --stats
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ride_archive  # noqa: E402
+from cache import result_cache  # noqa: E402
+from database import engine, run_migrations  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--before", type=datetime.fromisoformat, help="Archive rides that started before this")
+    parser.add_argument("--older-than-days", type=int, default=ride_archive.RIDE_ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--dry-run", action="store_true", help="Only count the rides that would move")
+    parser.add_argument("--stats", action="store_true", help="Print archive statistics and exit")
+    args = parser.parse_args()
+
+    run_migrations()
+    if args.stats:
+        print(json.dumps(ride_archive.stats(engine), indent=2))
+        return
+
+    before = args.before or datetime.combine(datetime.now().date(), datetime.min.time()) - timedelta(
+        days=args.older_than_days
+    )
+    started = time.perf_counter()
+    summary = ride_archive.archive_rides(engine, before, dry_run=args.dry_run)
+    if args.dry_run:
+        print(f"Would archive {summary['rides']} rides from {summary['months']} months before {before}")
+        return
+    # Shared cache backends (Redis) must not keep serving moved rides
+    result_cache.invalidate_all()
+    print(f"✅ Archived {summary['rides']} rides from {summary['months']} months into {summary['files']} files "
+          f"({summary['bytes'] / 1e6:.1f} MB) in {time.perf_counter() - started:.1f}s")
+    if summary.get("orphans_removed"):
+        print(f"Removed {summary['orphans_removed']} files left by failed runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Compare sync and async request handling under concurrent load.
+
+Starts two uvicorn servers against DATABASE_URL: one whose handlers are
+plain ``def`` functions using the blocking session (run in the threadpool),
+one whose handlers are ``async def`` using the asyncio engine. Each is hit
+with 50-500 concurrent clients and the throughput and latency are reported.
+
+    python scripts/benchmark_concurrency.py --concurrency 50 100 250 500
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ENDPOINTS = ["/predictions", "/bikes"]
+
+
+def build_app(mode):
+    from fastapi import Depends, FastAPI
+
+    from database import get_async_db, get_db
+    from listing import list_query
+    import models
+    from predictions import get_fleet_predictions, get_fleet_predictions_async
+
+    app = FastAPI()
+
+    if mode == "sync":
+        @app.get("/predictions")
+        def predictions(db=Depends(get_db)):
+            return get_fleet_predictions(db)
+
+        @app.get("/bikes")
+        def bikes(db=Depends(get_db)):
+            rows = db.execute(list_query(models.Bike.__table__).limit(100)).all()
+            return [dict(row._mapping) for row in rows]
+    else:
+        @app.get("/predictions")
+        async def predictions(db=Depends(get_async_db)):
+            return await get_fleet_predictions_async(db)
+
+        @app.get("/bikes")
+        async def bikes(db=Depends(get_async_db)):
+            rows = (await db.execute(list_query(models.Bike.__table__).limit(100))).all()
+            return [dict(row._mapping) for row in rows]
+
+    return app
+
+
+def serve(mode, port):
+    import uvicorn
+
+    uvicorn.run(build_app(mode), host="127.0.0.1", port=port, log_level="warning")
+
+
+async def wait_until_up(client, url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get(url)
+            return
+        except Exception:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+async def run_load(base_url, path, concurrency, requests_per_client):
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies, errors = [], 0
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        await wait_until_up(client, "/bikes")
+
+        async def worker():
+            nonlocal errors
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    response.raise_for_status()
+                except Exception:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    if not latencies:
+        return {"rps": 0.0, "p50": 0.0, "p99": 0.0, "errors": errors}
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 100, 250, 500])
+    parser.add_argument("--requests-per-client", type=int, default=5)
+    parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS)
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--serve", choices=["sync", "async"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    print(f"{'mode':>6} {'endpoint':>13} {'clients':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for offset, mode in enumerate(["sync", "async"]):
+        port = args.port + offset
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(port)]
+        )
+        try:
+            for path in args.endpoints:
+                for concurrency in args.concurrency:
+                    result = asyncio.run(
+                        run_load(f"http://127.0.0.1:{port}", path, concurrency, args.requests_per_client)
+                    )
+                    print(
+                        f"{mode:>6} {path:>13} {concurrency:>8} {result['rps']:>9.1f} "
+                        f"{result['p50']:>9.1f} {result['p99']:>9.1f} {result['errors']:>7}"
+                    )
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
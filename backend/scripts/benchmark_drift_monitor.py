@@ -0,0 +1,201 @@
+"""Check the drift monitor's outcome counting and PSI, and time its hooks.
+
+A simulated fleet is scored every day for --days days with an in-memory
+SQLite database holding the replacements, in five groups of bikes:
+
+  * hit          flagged on day 0, replaced on day 10
+  * false alarm  flagged on day 0, never replaced
+  * miss         never flagged, replaced on day 10
+  * late         flagged on day 0, replaced on day 40: a false alarm once
+                 the horizon passes, then a missed failure
+  * restarted    flagged every day, replaced on day 45: the first flag
+                 expires (false alarm), the renewed one is a hit
+
+The rolling counts must match those groups, the feature histograms must
+match the latest features of every bike binned from scratch, and
+replacements written before the first poll or with another action must be
+ignored. The exit status is 1 on any mismatch. Last, record() and poll()
+are timed and the monitor's memory per bike is measured.
+
+    python scripts/benchmark_drift_monitor.py --bikes 1000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models  # noqa: E402
+from database import Base  # noqa: E402
+from drift_monitor import DriftMonitor, feature_baseline  # noqa: E402
+from model_registry import BASELINE_FILE, ModelRegistry  # noqa: E402
+from predictions import FEATURE_COLUMNS  # noqa: E402
+
+VERSION = "simulated"
+GROUPS = ["hit", "false alarm", "miss", "late", "restarted"]
+START = date(2026, 1, 1).toordinal()
+
+
+class SimulatedMonitor(DriftMonitor):
+    """A monitor whose days come from the simulation"""
+
+    day = START
+
+    def today(self) -> int:
+        return self.day
+
+
+def fleet_features(rng, bikes: int, shift: float = 0.0) -> np.ndarray:
+    features = np.empty((bikes, len(FEATURE_COLUMNS)), dtype=np.float32)
+    features[:, 0] = rng.gamma(2, 800 * (1 + shift), bikes)
+    features[:, 1] = rng.gamma(2, 300, bikes)
+    features[:, 2] = rng.uniform(0, 400 + 200 * shift, bikes)
+    features[:, 3] = rng.normal(0.5 + shift, 0.2, bikes)
+    return features
+
+
+def make_monitor(registry_dir: str, baseline, session_factory) -> SimulatedMonitor:
+    registry = ModelRegistry(registry_dir)
+    os.makedirs(registry.version_dir(VERSION), exist_ok=True)
+    with open(os.path.join(registry.version_dir(VERSION), BASELINE_FILE), "w") as f:
+        json.dump(baseline, f)
+    return SimulatedMonitor(session_factory=session_factory, registry=registry, window_days=90, retrain_command="")
+
+
+def replace(session_factory, bike_ids, day: int, action: str = "replaced") -> None:
+    with session_factory() as db:
+        db.execute(models.MaintenanceRecord.__table__.insert(), [
+            {"bike_id": int(b), "maintenance_date": date.fromordinal(day), "component": "chain", "action": action}
+            for b in bike_ids
+        ])
+        db.commit()
+
+
+def check_outcomes(args, registry_dir: str) -> int:
+    rng = np.random.default_rng(args.seed)
+    memory = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(memory, tables=[models.MaintenanceRecord.__table__])
+    session_factory = sessionmaker(bind=memory)
+    monitor = make_monitor(registry_dir, feature_baseline(fleet_features(rng, 20000)), session_factory)
+
+    bike_ids = np.arange(1, args.bikes * len(GROUPS) + 1)
+    group = {name: bike_ids[i * args.bikes:(i + 1) * args.bikes] for i, name in enumerate(GROUPS)}
+    # Written before the monitor's first poll: not counted
+    replace(session_factory, bike_ids, START - 1)
+    monitor.poll()
+
+    latest = None
+    for day in range(START, START + args.days):
+        monitor.day = day
+        features = fleet_features(rng, len(bike_ids), shift=(day - START) / args.days)
+        flagged = np.isin(bike_ids, group["restarted"])
+        if day == START:
+            flagged |= np.isin(bike_ids, np.concatenate([group["hit"], group["false alarm"], group["late"]]))
+        monitor.record(bike_ids.tolist(), features, np.where(flagged, 0.9, 0.1), VERSION)
+        latest = features
+        if day == START + 10:
+            replace(session_factory, np.concatenate([group["hit"], group["miss"]]), day)
+            replace(session_factory, group["false alarm"], day, action="inspected")
+        if day == START + 40:
+            replace(session_factory, group["late"], day)
+        if day == START + 45:
+            replace(session_factory, group["restarted"], day)
+        monitor.poll()
+
+    n = args.bikes
+    expected = {"hits": 2 * n, "false_alarms": 3 * n, "missed_failures": 2 * n}
+    outcomes = monitor.outcomes()
+    failures = 0
+    for name, value in expected.items():
+        if outcomes[name] != value:
+            print(f"❌ {name}: {outcomes[name]}, expected {value}")
+            failures += 1
+    print(f"outcomes after {args.days} days: precision {outcomes['precision']:.3f}, recall {outcomes['recall']:.3f}")
+
+    # The histograms must equal the latest features binned from scratch
+    for i, (name, edges, counts) in enumerate(zip(FEATURE_COLUMNS, monitor._edges, monitor._counts)):
+        scratch = np.bincount(np.searchsorted(edges, latest[:, i], side="right"), minlength=len(edges) + 1)
+        if scratch.tolist() != counts:
+            print(f"❌ {name} histogram differs from a recount")
+            failures += 1
+    print(f"feature PSI after drifting: {monitor.feature_psi()}")
+    print(f"breaches: {monitor.report()['breaches']}")
+    return failures
+
+
+def benchmark(args, registry_dir: str) -> None:
+    rng = np.random.default_rng(args.seed)
+    memory = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(memory, tables=[models.MaintenanceRecord.__table__])
+    session_factory = sessionmaker(bind=memory)
+    monitor = make_monitor(registry_dir, feature_baseline(fleet_features(rng, 20000)), session_factory)
+    monitor.poll()
+
+    bikes = args.benchmark_bikes
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for start in range(0, bikes, 1000):
+        ids = list(range(start + 1, min(start + 1000, bikes) + 1))
+        monitor.record(ids, fleet_features(rng, len(ids)), rng.uniform(0, 1, len(ids)), VERSION)
+    per_bike = (tracemalloc.get_traced_memory()[0] - before) / bikes
+    tracemalloc.stop()
+    print(f"\nstate for {bikes} bikes: {per_bike:.0f} bytes per bike")
+
+    print(f"{'call':<32} {'p50 ms':>8} {'max ms':>8}")
+    for batch in (1, 1000):
+        samples = []
+        for _ in range(200):
+            ids = rng.integers(1, bikes + 1, batch).tolist()
+            features, probabilities = fleet_features(rng, batch), rng.uniform(0, 1, batch)
+            started = time.perf_counter()
+            monitor.record(ids, features, probabilities, VERSION)
+            samples.append(time.perf_counter() - started)
+        ms = np.array(samples) * 1000
+        print(f"{f'record() batch of {batch}':<32} {np.percentile(ms, 50):>8.3f} {ms.max():>8.3f}")
+
+    samples = []
+    for _ in range(20):
+        started = time.perf_counter()
+        monitor.poll()
+        samples.append(time.perf_counter() - started)
+    ms = np.array(samples) * 1000
+    print(f"{'poll() nothing new':<32} {np.percentile(ms, 50):>8.3f} {ms.max():>8.3f}")
+    replace(session_factory, rng.integers(1, bikes + 1, 10000), monitor.today())
+    started = time.perf_counter()
+    monitor.poll()
+    print(f"{'poll() 10000 new replacements':<32} {(time.perf_counter() - started) * 1000:>8.3f}")
+    monitor.day = monitor.today() + 1
+    started = time.perf_counter()
+    monitor.poll()
+    print(f"{'poll() first of a new day':<32} {(time.perf_counter() - started) * 1000:>8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bikes", type=int, default=1000, help="Bikes per simulated group")
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--benchmark-bikes", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as registry_dir:
+        failures = check_outcomes(args, registry_dir)
+        benchmark(args, registry_dir)
+    if failures:
+        print(f"❌ {failures} checks failed")
+        sys.exit(1)
+    print("✅ Drift monitor outcomes and histograms match the simulation")
+
+
+if __name__ == "__main__":
+    main()
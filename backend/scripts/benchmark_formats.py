@@ -0,0 +1,142 @@
+"""Bytes and milliseconds per 100k rows for each response format and encoding.
+
+Rides, maintenance records and predictions are read from DATABASE_URL and
+encoded the way the endpoints do it. Smaller tables are repeated up to
+--rows so every figure is per the same number of rows. Compared paths:
+
+  * fastapi json   the previous path: a dict per row with isoformat()ed
+                   dates, response_model validation, jsonable_encoder and
+                   json.dumps
+  * json           orjson over the column-major page
+  * msgpack        a map of column name to values
+  * arrow          an Arrow IPC stream with one record batch
+
+Each body is also gzip- and (when installed) brotli-compressed at the levels
+the API uses. Last, GET /rides?limit=10000 is timed through the ASGI test
+client per format.
+
+    DATABASE_URL=sqlite:///./bike_maintenance.db python scripts/benchmark_formats.py --rows 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from listing import row_to_dict  # noqa: E402
+from model_serving import model_server  # noqa: E402
+from predictions import get_fleet_predictions  # noqa: E402
+from response_formats import brotli, compress, encode_columns, encode_records  # noqa: E402
+
+FORMATS = ["json", "msgpack", "arrow"]
+ENCODINGS = [None, "gzip"] + (["br"] if brotli is not None else [])
+response_adapter = TypeAdapter(List[Dict[str, Any]])
+
+
+def best_of(call, repeat: int):
+    """Fastest of ``repeat`` runs in seconds, and the last result"""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = call()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def fastapi_json(rows) -> bytes:
+    items = [row_to_dict(row) for row in rows]
+    items = jsonable_encoder(response_adapter.validate_python(items))
+    return json.dumps(items, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def repeat_to(items: list, rows: int) -> list:
+    return (items * (rows // max(len(items), 1) + 1))[:rows]
+
+
+def report(dataset: str, name: str, rows: int, seconds: float, body: bytes, repeat: int) -> None:
+    scale = 100000 / rows
+    cells = [f"{len(body) * scale / 1e6:>9.2f} MB {seconds * scale * 1000:>8.1f} ms"]
+    for encoding in ENCODINGS[1:]:
+        compress_seconds, compressed = best_of(lambda: compress(body, encoding), repeat)
+        cells.append(f"{len(compressed) * scale / 1e6:>7.2f} MB {(seconds + compress_seconds) * scale * 1000:>7.1f} ms")
+    print(f"{dataset:<12} {name:<14} " + "   ".join(cells))
+
+
+def table_rows(db, table, rows: int):
+    result = db.execute(select(table).order_by(table.primary_key.columns.values()[0]).limit(rows))
+    columns = list(result.keys())
+    fetched = repeat_to(result.all(), rows)
+    data = [list(values) for values in zip(*fetched)] or [[] for _ in columns]
+    return fetched, columns, data, [column.type for column in table.columns]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="Rows encoded per dataset")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the fastest is kept")
+    parser.add_argument("--requests", type=int, default=20, help="HTTP requests per format")
+    args = parser.parse_args()
+
+    model_server.load()
+    header = "   ".join([f"{'raw bytes':>12} {'encode':>11}"] + [f"{e:>10} {'+compress':>10}" for e in ENCODINGS[1:]])
+    print(f"{'per 100k rows':<27} {header}")
+    db = SessionLocal()
+    try:
+        for dataset, table in (("rides", models.Ride.__table__), ("maintenance", models.MaintenanceRecord.__table__)):
+            rows, columns, data, types = table_rows(db, table, args.rows)
+            if not rows:
+                continue
+            seconds, body = best_of(lambda: fastapi_json(rows), args.repeat)
+            report(dataset, "fastapi json", len(rows), seconds, body, args.repeat)
+            for fmt in FORMATS:
+                seconds, body = best_of(lambda: encode_columns(columns, data, fmt, types), args.repeat)
+                report(dataset, fmt, len(rows), seconds, body, args.repeat)
+
+        predictions = repeat_to(get_fleet_predictions(db, model_server=model_server), args.rows)
+    finally:
+        db.close()
+    if predictions:
+        seconds, body = best_of(lambda: json.dumps(
+            jsonable_encoder(response_adapter.validate_python(predictions)), ensure_ascii=False, separators=(",", ":")
+        ).encode(), args.repeat)
+        report("predictions", "fastapi json", len(predictions), seconds, body, args.repeat)
+        for fmt in FORMATS:
+            seconds, body = best_of(lambda: encode_records(predictions, fmt), args.repeat)
+            report("predictions", fmt, len(predictions), seconds, body, args.repeat)
+
+    # The test client runs the app's startup (migrations, model, indexes)
+    from fastapi.testclient import TestClient
+    from cache import result_cache
+    import main as api
+
+    print(f"\n{'GET /rides?limit=10000':<27} {'p50 ms':>8} {'max ms':>8} {'bytes':>10}")
+    with TestClient(api.app) as client:
+        for fmt in FORMATS:
+            for encoding in ENCODINGS:
+                samples, size = [], 0
+                for _ in range(args.requests):
+                    result_cache.invalidate_all()
+                    start = time.perf_counter()
+                    response = client.get(
+                        "/rides", params={"limit": 10000, "format": fmt},
+                        headers={"Accept-Encoding": encoding or "identity"},
+                    )
+                    samples.append(time.perf_counter() - start)
+                    size = int(response.headers.get("content-length", len(response.content)))
+                ms = np.array(samples) * 1000
+                name = f"{fmt}" + (f" + {encoding}" if encoding else "")
+                print(f"{name:<27} {np.percentile(ms, 50):>8.1f} {ms.max():>8.1f} {size:>10}")
+
+
+if __name__ == "__main__":
+    main()
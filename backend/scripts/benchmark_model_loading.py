@@ -0,0 +1,97 @@
+"""Compare model startup cost for the joblib pickle and native UBJSON formats.
+
+Trains a classifier on random data, saves it both ways, then loads each in
+fresh interpreter processes (imports included, as at API startup) and
+reports file size, load time and time to the first prediction.
+
+    python scripts/benchmark_model_loading.py --trees 100 500 2000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from predictions import FEATURE_COLUMNS  # noqa: E402
+
+# Run in a child process so every measurement pays the real import cost.
+# Unpickling the classifier also pulls in xgboost.sklearn and scikit-learn.
+LOADERS = {
+    "joblib": (
+        "import joblib",
+        "model = joblib.load(PATH, mmap_mode='r')\n"
+        "predict = lambda X: model.predict_proba(X)[:, 1]",
+    ),
+    "ubj": (
+        "import xgboost as xgb",
+        "model = xgb.Booster()\n"
+        "model.load_model(PATH)\n"
+        "predict = model.inplace_predict",
+    ),
+}
+
+CHILD = """
+import time
+start = time.perf_counter()
+import numpy as np
+{imports}
+imported = time.perf_counter()
+PATH = {path!r}
+{load}
+loaded = time.perf_counter()
+predict(np.zeros((1, {n_features}), dtype=np.float32))
+print(imported - start, loaded - imported, time.perf_counter() - start)
+"""
+
+
+def train(trees, depth):
+    import xgboost as xgb
+
+    rng = np.random.default_rng(0)
+    X = rng.random((20000, len(FEATURE_COLUMNS)), dtype=np.float32)
+    y = (X[:, 0] + rng.normal(0, 0.3, len(X)) > 0.5).astype(int)
+    model = xgb.XGBClassifier(n_estimators=trees, max_depth=depth, tree_method="hist")
+    model.fit(X, y)
+    return model
+
+
+def measure(fmt, path, runs):
+    """Median (import, load, total to first prediction) seconds over ``runs`` cold starts"""
+    imports, load = LOADERS[fmt]
+    code = CHILD.format(imports=imports, load=load, path=path, n_features=len(FEATURE_COLUMNS))
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        samples.append([float(v) for v in out.stdout.split()])
+    return np.median(np.array(samples), axis=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trees", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--runs", type=int, default=5, help="Cold loads per format (median reported)")
+    args = parser.parse_args()
+
+    import joblib
+
+    print(f"{'trees':>6} {'format':>7} {'size KB':>9} {'import ms':>10} {'load ms':>9} {'first pred ms':>14}")
+    for trees in args.trees:
+        model = train(trees, args.depth)
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {"joblib": os.path.join(tmp, "model.joblib"), "ubj": os.path.join(tmp, "model.ubj")}
+            joblib.dump(model, paths["joblib"])
+            model.get_booster().save_model(paths["ubj"])
+            for fmt, path in paths.items():
+                imported, load, first = measure(fmt, path, args.runs)
+                size = os.path.getsize(path) / 1024
+                print(f"{trees:>6} {fmt:>7} {size:>9.0f} {imported * 1000:>10.1f} "
+                      f"{load * 1000:>9.1f} {first * 1000:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
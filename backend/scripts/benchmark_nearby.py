@@ -0,0 +1,173 @@
+"""Check the location index against a brute-force haversine scan and time it.
+
+Two fleets are queried with random circles:
+
+  * database   bike positions from DATABASE_URL, compared with the last
+               ride of every bike found by sorting the rides table in pandas
+  * synthetic  bikes scattered over the whole globe in an in-memory SQLite
+               database, so the poles and the antimeridian are covered
+
+Each query's bikes and distances must match the brute-force result; the
+exit status is 1 on any mismatch. Latency is reported for the index, the
+brute-force scan and GET /predictions/nearby through the ASGI test client.
+
+    DATABASE_URL=sqlite:///./bike_maintenance.db python scripts/benchmark_nearby.py --queries 2000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models  # noqa: E402
+from database import Base, engine  # noqa: E402
+from location_index import EARTH_RADIUS_KM, LocationIndex  # noqa: E402
+
+RADII_KM = [0.1, 0.5, 1, 2, 5, 10, 25, 100]
+# Distances this close to the radius may fall on either side between float implementations
+BOUNDARY_KM = 1e-6
+
+
+def report(name, samples):
+    ms = np.array(samples) * 1000
+    print(f"{name:<28} {np.percentile(ms, 50):>8.3f} {np.percentile(ms, 99):>8.3f} {ms.max():>8.3f}")
+
+
+def last_positions(bind) -> pd.DataFrame:
+    """End position of each bike's latest located ride, without the index's SQL"""
+    ride = models.Ride.__table__
+    rides = pd.read_sql(
+        select(ride.c.ride_id, ride.c.bike_id, ride.c.start_time, ride.c.end_lat, ride.c.end_lon), bind
+    ).dropna(subset=["end_lat", "end_lon"])
+    rides = rides.sort_values(["bike_id", "start_time", "ride_id"])
+    return rides.groupby("bike_id").tail(1).set_index("bike_id")[["end_lat", "end_lon"]]
+
+
+def brute_force(positions: pd.DataFrame, lat: float, lon: float, radius_km: float) -> pd.Series:
+    """Distance of every bike within radius_km, by bike_id"""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(positions["end_lat"].to_numpy()), np.radians(positions["end_lon"].to_numpy())
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distance = pd.Series(2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a))), index=positions.index)
+    return distance[distance <= radius_km]
+
+
+def check(name, index: LocationIndex, positions: pd.DataFrame, queries) -> int:
+    """Compare every query with the brute-force scan; returns the number of mismatching queries"""
+    index_samples, scan_samples, mismatches, found = [], [], 0, 0
+    for lat, lon, radius in queries:
+        start = time.perf_counter()
+        nearby = index.nearby(lat, lon, radius)
+        index_samples.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        expected = brute_force(positions, lat, lon, radius)
+        scan_samples.append(time.perf_counter() - start)
+
+        got = {bike["bike_id"]: bike["distance_km"] for bike in nearby}
+        found += len(got)
+        distances = [bike["distance_km"] for bike in nearby]
+        missing = set(expected.index) - set(got)
+        extra = set(got) - set(expected.index)
+        bad = [b for b in missing if radius - expected[b] > BOUNDARY_KM]
+        bad += [b for b in extra if got[b] - radius > BOUNDARY_KM + 0.0005]
+        bad += [b for b in set(got) & set(expected.index) if abs(got[b] - expected[b]) > 0.0005]
+        if bad or distances != sorted(distances):
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"❌ {name}: ({lat:.5f}, {lon:.5f}) r={radius} km differs for bikes {sorted(bad)[:10]}")
+    print(f"{name}: {len(queries)} queries, {found / len(queries):.1f} bikes per query on average")
+    report(f"{name} index", index_samples)
+    report(f"{name} brute force", scan_samples)
+    return mismatches
+
+
+def synthetic_index(bikes: int, rng):
+    """A location index over bikes scattered uniformly over the globe"""
+    memory = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(memory, tables=[models.Bike.__table__, models.Ride.__table__])
+    lat = np.degrees(np.arcsin(rng.uniform(-1, 1, bikes)))
+    lon = rng.uniform(-180, 180, bikes)
+    # A few bikes exactly at the poles and on the antimeridian
+    lat[:4], lon[4:8] = [90, -90, 89.9999, -89.9999], [-180, 179.9999, -179.9999, 180 - 1e-9]
+    now = datetime(2026, 1, 1)
+    with memory.begin() as conn:
+        conn.execute(models.Bike.__table__.insert(), [{"bike_id": i + 1} for i in range(bikes)])
+        conn.execute(models.Ride.__table__.insert(), [
+            # An older ride elsewhere, which the index must not pick
+            {"bike_id": i + 1, "start_time": now - timedelta(days=1), "end_lat": 0.0, "end_lon": 0.0}
+            for i in range(bikes)
+        ] + [
+            {"bike_id": i + 1, "start_time": now, "end_lat": float(lat[i]), "end_lon": float(lon[i])}
+            for i in range(bikes)
+        ])
+    index = LocationIndex(session_factory=sessionmaker(bind=memory))
+    index.load()
+    return index, last_positions(memory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=1000, help="Random circles per fleet")
+    parser.add_argument("--synthetic-bikes", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    index = LocationIndex()
+    start = time.perf_counter()
+    index.load()
+    print(f"Indexed {len(index)} bike positions in {(time.perf_counter() - start) * 1000:.0f} ms")
+    start = time.perf_counter()
+    positions = last_positions(engine)
+    print(f"Brute-force positions read in {(time.perf_counter() - start) * 1000:.0f} ms")
+    mismatches = 0
+    print(f"{'scenario (ms per call)':<28} {'p50':>8} {'p99':>8} {'max':>8}")
+    if len(positions):
+        lats, lons = positions["end_lat"], positions["end_lon"]
+        queries = [
+            (float(rng.uniform(lats.min() - 0.05, lats.max() + 0.05)),
+             float(rng.uniform(lons.min() - 0.05, lons.max() + 0.05)), float(rng.choice(RADII_KM)))
+            for _ in range(args.queries)
+        ]
+        mismatches += check("database", index, positions, queries)
+
+    synthetic, synthetic_positions = synthetic_index(args.synthetic_bikes, rng)
+    queries = [
+        (float(np.degrees(np.arcsin(rng.uniform(-1, 1)))), float(rng.uniform(-180, 180)),
+         float(rng.choice(RADII_KM + [500, 5000])))
+        for _ in range(args.queries)
+    ]
+    queries += [(90, 0, 50), (-90, 0, 50), (89.99, 45, 5), (0, 180, 25), (0, -180, 25), (10, 179.99, 100)]
+    mismatches += check("synthetic", synthetic, synthetic_positions, queries)
+
+    if len(positions):
+        # The test client runs the app's startup (migrations, model, indexes)
+        from fastapi.testclient import TestClient
+        import main
+
+        with TestClient(main.app) as client:
+            samples = []
+            for lat, lon, radius in [(40.7, -74.0, 2)] * min(args.queries, 500):
+                start = time.perf_counter()
+                response = client.get("/predictions/nearby", params={"lat": lat, "lon": lon, "radius": radius})
+                samples.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise RuntimeError(f"/predictions/nearby returned {response.status_code}: {response.text[:200]}")
+            report("http GET nearby r=2 km", samples)
+
+    if mismatches:
+        print(f"❌ {mismatches} queries differ from the brute-force scan")
+        sys.exit(1)
+    print("✅ Location index matches the brute-force haversine scan")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Latency of single-bike and what-if scoring from the in-memory feature index.
+
+Runs against the database in DATABASE_URL (and the promoted model, if any)
+and reports p50/p99/max per call for:
+
+  * index      FeatureIndex.score, the work done inside the endpoint
+  * query      the same bikes read from the database on every call, as
+               /predictions does for bikes missing from the result cache
+  * http       the full request through the ASGI app (middleware, routing,
+               validation, JSON), called directly so neither a network hop
+               nor an HTTP client is counted
+
+    DATABASE_URL=sqlite:///./bike_maintenance.db python scripts/benchmark_point_predictions.py --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SessionLocal  # noqa: E402
+from feature_index import feature_index  # noqa: E402
+from model_serving import model_server  # noqa: E402
+from predictions import get_fleet_predictions  # noqa: E402
+
+WHAT_IF = {"km_since_service": "+200", "total_distance_km": "+200"}
+
+
+def report(name, samples):
+    ms = np.array(samples) * 1000
+    print(f"{name:<28} {np.percentile(ms, 50):>8.3f} {np.percentile(ms, 99):>8.3f} {ms.max():>8.3f}")
+
+
+def timed(call, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        call(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def asgi_request(app, method, path, body=None) -> int:
+    """Run one request through the ASGI app and return its status code"""
+    payload = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(payload)).encode()),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    messages = [{"type": "http.request", "body": payload, "more_body": False}]
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+async def timed_http(app, requests):
+    samples = []
+    for method, path, body in requests:
+        start = time.perf_counter()
+        status = await asgi_request(app, method, path, body)
+        samples.append(time.perf_counter() - start)
+        if status != 200:
+            raise RuntimeError(f"{method} {path} returned {status}")
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000, help="Calls per scenario")
+    parser.add_argument("--batch", type=int, default=10, help="Bikes per POST /predictions/score")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    model_server.load()
+    start = time.perf_counter()
+    feature_index.refresh()
+    print(f"Indexed {len(feature_index)} bikes in {(time.perf_counter() - start) * 1000:.0f} ms, "
+          f"model: {model_server.version or 'none (thresholds)'}")
+    bike_ids = np.array(feature_index.bike_ids())
+    if not len(bike_ids):
+        print("No bikes in the database")
+        return
+
+    rng = np.random.default_rng(args.seed)
+    singles = [[int(b)] for b in rng.choice(bike_ids, args.requests)]
+    batches = [[int(b) for b in rng.choice(bike_ids, args.batch)] for _ in range(args.requests)]
+
+    print(f"{'scenario (ms per call)':<28} {'p50':>8} {'p99':>8} {'max':>8}")
+    report("index single", timed(lambda ids: feature_index.score(ids, model_server), [(ids,) for ids in singles]))
+    report(f"index batch of {args.batch}",
+           timed(lambda ids: feature_index.score(ids, model_server), [(ids,) for ids in batches]))
+    report(f"index what-if x{args.batch}",
+           timed(lambda ids: feature_index.score(ids, model_server, WHAT_IF), [(ids,) for ids in batches]))
+
+    db = SessionLocal()
+    try:
+        queried = singles[: max(1, args.requests // 10)]
+        report("query single", timed(
+            lambda ids: get_fleet_predictions(db, model_server=model_server, bike_ids=ids), [(ids,) for ids in queried]
+        ))
+    finally:
+        db.close()
+
+    # Called without a lifespan: the model and feature index are already loaded above
+    from main import app
+
+    report("http GET single", asyncio.run(timed_http(
+        app, [("GET", f"/predictions/{ids[0]}", None) for ids in singles]
+    )))
+    report(f"http POST batch of {args.batch}", asyncio.run(timed_http(
+        app, [("POST", "/predictions/score", {"bike_ids": ids}) for ids in batches]
+    )))
+    report(f"http POST what-if x{args.batch}", asyncio.run(timed_http(
+        app, [("POST", "/predictions/score", {"bike_ids": ids, "overrides": WHAT_IF}) for ids in batches]
+    )))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Benchmark the /predictions engine against the legacy per-bike query loop.
+
+Seeds a throwaway SQLite database at several fleet sizes and reports the
+number of SQL statements and wall time for each implementation.
+
+    python scripts/benchmark_predictions.py --sizes 1000 10000 100000
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import feature_store  # noqa: E402
+import models  # noqa: E402
+from database import run_migrations  # noqa: E402
+from predictions import get_fleet_predictions  # noqa: E402
+
+
+def seed(engine, n_bikes, rides_per_bike, seed_value=42):
+    """Insert n_bikes bikes with rides_per_bike rides each"""
+    rng = np.random.default_rng(seed_value)
+    now = datetime(2024, 1, 1)
+    run_migrations(engine)
+
+    bikes = [
+        {
+            "bike_id": i,
+            "status": "active",
+            "total_distance_km": float(d),
+            "last_serviced_date": (now - timedelta(days=int(s))).date(),
+        }
+        for i, d, s in zip(
+            range(1, n_bikes + 1),
+            rng.uniform(0, 2500, n_bikes),
+            rng.integers(1, 200, n_bikes),
+        )
+    ]
+
+    n_rides = n_bikes * rides_per_bike
+    bike_ids = np.repeat(np.arange(1, n_bikes + 1), rides_per_bike)
+    offsets = rng.integers(0, 90 * 24 * 3600, n_rides)
+    distances = rng.uniform(0.5, 15, n_rides)
+    vibrations = rng.uniform(0, 1.2, n_rides)
+    rides = [
+        {
+            "bike_id": int(b),
+            "start_time": now - timedelta(seconds=int(o)),
+            "end_time": now - timedelta(seconds=int(o) - 1800),
+            "distance_km": float(d),
+            "avg_vibration": float(v),
+            "weather_condition": "clear",
+        }
+        for b, o, d, v in zip(bike_ids, offsets, distances, vibrations)
+    ]
+
+    with engine.begin() as conn:
+        conn.execute(models.Bike.__table__.insert(), bikes)
+        conn.execute(models.Ride.__table__.insert(), rides)
+
+
+def legacy_predictions(db):
+    """The original N+1 implementation of GET /predictions, frozen here so the
+    set-based path is checked against the old rules rather than its own.
+
+    Copied from the first version of main.py; the only change is that
+    ``priority`` starts at "low" (it raised NameError when only the distance
+    rules fired) and "prediction_source", which newer payloads carry.
+    """
+    predictions = []
+    for bike in db.query(models.Bike).all():
+        recent_rides = db.query(models.Ride).filter(
+            models.Ride.bike_id == bike.bike_id
+        ).order_by(models.Ride.start_time.desc()).limit(10).all()
+
+        total_vibration = 0
+        vibration_count = 0
+        recent_distance = 0
+        for ride in recent_rides:
+            if ride.avg_vibration is not None:
+                total_vibration += ride.avg_vibration
+                vibration_count += 1
+            if ride.distance_km is not None:
+                recent_distance += ride.distance_km
+
+        avg_vibration = total_vibration / vibration_count if vibration_count > 0 else 0
+        total_distance = bike.total_distance_km or 0
+        bike_status = bike.status or "active"
+
+        issues = []
+        confidence = 0.5
+        priority = "low"
+
+        if avg_vibration > 0.8:
+            priority = "high"
+            issues.extend(["suspension issues", "wheel alignment"])
+            confidence = max(confidence, 0.9)
+        elif avg_vibration > 0.5:
+            priority = "medium"
+            issues.extend(["tire pressure", "general checkup"])
+            confidence = max(confidence, 0.7)
+
+        if total_distance > 2000:
+            priority = "high"
+            issues.extend(["chain wear", "brake pads", "bearing replacement"])
+            confidence = max(confidence, 0.85)
+        elif total_distance > 1000:
+            priority = "medium" if priority != "high" else "high"
+            issues.extend(["chain lubrication", "brake adjustment"])
+            confidence = max(confidence, 0.65)
+
+        if not issues:
+            priority = "low"
+            issues = ["routine maintenance"]
+            confidence = 0.5
+
+        issues = list(set(issues))
+
+        last_service = None
+        if bike.last_serviced_date:
+            if isinstance(bike.last_serviced_date, str):
+                last_service = bike.last_serviced_date
+            else:
+                last_service = bike.last_serviced_date.isoformat()
+
+        predictions.append({
+            "bike_id": bike.bike_id,
+            "bike_status": bike_status,
+            "total_distance_km": total_distance,
+            "recent_distance_km": recent_distance,
+            "avg_vibration": round(avg_vibration, 2),
+            "maintenance_priority": priority,
+            "predicted_issues": issues,
+            "confidence_score": round(confidence, 2),
+            "recommended_maintenance": f"Check {', '.join(issues)}",
+            "last_service": last_service or "Never",
+            "recent_rides_count": len(recent_rides),
+            "prediction_source": "threshold",
+        })
+    return predictions
+
+
+def _issue_set(prediction, key):
+    # The legacy loop deduplicated issues through a set, so their order is arbitrary
+    if key == "predicted_issues":
+        return sorted(prediction[key])
+    return sorted(prediction[key].removeprefix("Check ").split(", "))
+
+
+def same_predictions(left, right, ordered_issues: bool = True):
+    """Compare payloads, allowing for float summation order differences (and
+    for the order of the issues unless ``ordered_issues``)"""
+    if len(left) != len(right):
+        return False
+    for a, b in zip(left, right):
+        if a.keys() != b.keys():
+            return False
+        for key, value in a.items():
+            if not ordered_issues and key in ("predicted_issues", "recommended_maintenance"):
+                if _issue_set(a, key) != _issue_set(b, key):
+                    return False
+            elif isinstance(value, float):
+                if not math.isclose(value, b[key], rel_tol=1e-9):
+                    return False
+            elif value != b[key]:
+                return False
+    return True
+
+
+def measure(engine, fn):
+    """Run fn with a fresh session and return (result, query_count, seconds)"""
+    counter = {"queries": 0}
+
+    def count(*_):
+        counter["queries"] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    try:
+        start = time.perf_counter()
+        result = fn(db)
+        elapsed = time.perf_counter() - start
+    finally:
+        db.close()
+        event.remove(engine, "before_cursor_execute", count)
+    return result, counter["queries"], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--rides-per-bike", type=int, default=20)
+    parser.add_argument(
+        "--legacy-max-bikes", type=int, default=1000,
+        help="Skip the legacy loop above this fleet size (it is O(bikes) queries)",
+    )
+    args = parser.parse_args()
+
+    print(f"{'bikes':>8} {'impl':>8} {'queries':>8} {'seconds':>9}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            seed(engine, size, args.rides_per_bike)
+
+            new, queries, seconds = measure(engine, lambda db: get_fleet_predictions(db, source="rides"))
+            print(f"{size:>8} {'set':>8} {queries:>8} {seconds:>9.3f}")
+
+            measure(engine, feature_store.rebuild)
+            stored, queries, seconds = measure(engine, lambda db: get_fleet_predictions(db, source="store"))
+            print(f"{size:>8} {'store':>8} {queries:>8} {seconds:>9.3f}")
+            if not same_predictions(stored, new):
+                print("❌ Feature store predictions differ from the set-based query")
+                sys.exit(1)
+
+            if size <= args.legacy_max_bikes:
+                old, queries, seconds = measure(engine, legacy_predictions)
+                print(f"{size:>8} {'legacy':>8} {queries:>8} {seconds:>9.3f}")
+                if not same_predictions(old, new, ordered_issues=False):
+                    print("❌ Set-based predictions differ from the legacy loop")
+                    sys.exit(1)
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Startup time and memory of the API with 1..N workers.
+
+For each worker count the API is started twice against DATABASE_URL:
+
+  * uvicorn   ``uvicorn main:app --workers N``: every worker is a fresh
+              interpreter that imports and loads everything itself
+  * prefork   ``scripts/serve.py --workers N``: loaded once in the parent,
+              then forked, so workers share those pages copy-on-write
+
+and reports the seconds until every worker has completed its startup, and
+the memory of the whole process tree after some requests: RSS (counts
+shared pages once per process), PSS (shared pages split between their
+users, i.e. the real footprint) and USS (pages private to each worker).
+The import time of main and the time of main.preload() are measured first
+in fresh interpreters. Reads /proc, so Linux only.
+
+    DATABASE_URL=sqlite:///./bike_maintenance.db python scripts/benchmark_startup.py --workers 1 2 4
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_COMPLETE = "Application startup complete"
+WARMUP_PATHS = ["/predictions", "/predictions/1", "/predictions/nearby?lat=40.7&lon=-74.0&radius=2", "/bikes?limit=100"]
+
+IMPORT_CHILD = """
+import sys, time
+sys.path.insert(0, {backend!r})
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.preload()
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def children(pid: int) -> List[int]:
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            found.append(int(entry))
+    return found
+
+
+def process_tree(pid: int) -> List[int]:
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children(current))
+    return tree
+
+
+def memory_mb(pid: int) -> Dict[str, float]:
+    """RSS, PSS and USS of one process from /proc/<pid>/smaps_rollup"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if rest.strip().endswith("kB"):
+                values[name] = int(rest.split()[0]) / 1024
+    return {
+        "rss": values.get("Rss", 0.0),
+        "pss": values.get("Pss", 0.0),
+        "uss": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+    }
+
+
+def import_times(env) -> List[float]:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_CHILD.format(backend=BACKEND_DIR)],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return [float(value) for value in output.strip().splitlines()[-1].split()]
+
+
+def wait_for_port(port: int, timeout: float) -> None:
+    """uvicorn logs the startup before it binds, so also wait for the socket"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def measure(mode: str, workers: int, port: int, env, requests: int, timeout: float) -> Dict[str, float]:
+    if mode == "uvicorn":
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers)]
+    else:
+        # Only reads are sent, so the per-worker cache cannot serve stale data here
+        command = [sys.executable, "scripts/serve.py", "--port", str(port), "--workers", str(workers),
+                   "--unshared-cache"]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True)
+    ready = threading.Event()
+    started = [0]
+
+    def read_log():
+        for line in process.stdout:
+            if STARTUP_COMPLETE in line:
+                started[0] += 1
+                if started[0] >= workers:
+                    ready.set()
+
+    threading.Thread(target=read_log, daemon=True).start()
+    try:
+        if not ready.wait(timeout):
+            raise RuntimeError(f"{mode} with {workers} workers did not start within {timeout}s")
+        wait_for_port(port, timeout)
+        ready_seconds = time.perf_counter() - start
+        for index in range(requests):
+            path = WARMUP_PATHS[index % len(WARMUP_PATHS)]
+            urllib.request.urlopen(f"http://127.0.0.1:{port}{path}").read()
+        tree = [memory_mb(pid) for pid in process_tree(process.pid)]
+        worker_uss = sorted(m["uss"] for m in tree)[-workers:]
+        return {
+            "ready_seconds": ready_seconds,
+            "rss_mb": sum(m["rss"] for m in tree),
+            "pss_mb": sum(m["pss"] for m in tree),
+            "worker_uss_mb": sum(worker_uss) / len(worker_uss),
+        }
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            for pid in process_tree(process.pid):
+                os.kill(pid, signal.SIGKILL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--modes", nargs="+", default=["uvicorn", "prefork"], choices=["uvicorn", "prefork"])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=200, help="Requests sent before memory is read")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    env = dict(os.environ, PREDICTION_SCHEDULER="off", PYTHONUNBUFFERED="1")
+    import_seconds, preload_seconds = import_times(env)
+    print(f"import main: {import_seconds:.2f}s, preload(): {preload_seconds:.2f}s")
+    print(f"{'mode':<8} {'workers':>7} {'ready s':>8} {'RSS MB':>8} {'PSS MB':>8} {'USS/worker MB':>14}")
+    for workers in args.workers:
+        for mode in args.modes:
+            result = measure(mode, workers, args.port, env, args.requests, args.timeout)
+            print(f"{mode:<8} {workers:>7} {result['ready_seconds']:>8.2f} {result['rss_mb']:>8.0f} "
+                  f"{result['pss_mb']:>8.0f} {result['worker_uss_mb']:>14.0f}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Check the maintenance work queue's ordering and claims, and time its calls.
+
+Runs against the database in DATABASE_URL (and the promoted model, if any):
+
+  * heap         IndexedHeap pops and top(k) must match a full sort after
+                 random pushes, priority changes and removals
+  * claims       --mechanics threads claim shifts at once through two queues
+                 (two API workers); no job may be handed out twice and no
+                 mechanic may get more minutes than their capacity, also
+                 when one mechanic claims from several threads at once
+  * complete     one claimed job is completed; the replacement must be
+                 written and the bike's km_since_service reset to 0
+  * timings      a priority change against re-sorting, rescoring one
+                 changed bike, peek and claim
+
+The claims are released at the end, but the completion check writes a
+real replacement, so point DATABASE_URL at a copy of the database. The
+exit status is 1 on any mismatch.
+
+    DATABASE_URL=sqlite:///./bike_maintenance_copy.db python scripts/benchmark_work_queue.py
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from sqlalchemy import delete, select
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models  # noqa: E402
+from database import SessionLocal, run_migrations  # noqa: E402
+from model_serving import model_server  # noqa: E402
+from work_queue import IndexedHeap, WorkQueue  # noqa: E402
+
+MECHANIC_PREFIX = "benchmark-"
+
+
+def report(name, samples):
+    ms = np.array(samples) * 1000
+    print(f"{name:<36} {np.percentile(ms, 50):>8.3f} {np.percentile(ms, 99):>8.3f} {ms.max():>8.3f}")
+
+
+def check_heap(rng: random.Random, size: int) -> int:
+    heap = IndexedHeap({key: rng.randint(0, 50) / 10 for key in range(size)})
+    expected = {key: heap._priority[key] for key in range(size)}
+    for _ in range(size * 3):
+        key = rng.randrange(size * 2)
+        if rng.random() < 0.2:
+            heap.remove(key)
+            expected.pop(key, None)
+        else:
+            # Few distinct priorities, so ties are common
+            expected[key] = rng.randint(0, 50) / 10
+            heap.push(key, expected[key])
+    ordered = sorted(expected.items(), key=lambda item: (-item[1], item[0]))
+    failures = 0
+    if heap.top(100) != ordered[:100]:
+        print("❌ top(100) differs from a sort")
+        failures += 1
+    popped = [heap.pop() for _ in range(len(heap))]
+    if popped != ordered:
+        print("❌ pop order differs from a sort")
+        failures += 1
+    return failures
+
+
+def check_claims(args) -> int:
+    queues = [WorkQueue(), WorkQueue()]
+    for queue in queues:
+        queue.sync()
+    results = {}
+
+    def claim(i):
+        queue = queues[i % len(queues)]
+        results[i] = queue.claim(f"{MECHANIC_PREFIX}{i}", args.capacity)
+
+    threads = [threading.Thread(target=claim, args=(i,)) for i in range(args.mechanics)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    failures = 0
+    handed_out = Counter((job["bike_id"], job["component"]) for r in results.values() for job in r["jobs"])
+    duplicates = [key for key, count in handed_out.items() if count > 1]
+    if duplicates:
+        print(f"❌ {len(duplicates)} jobs handed out twice, e.g. {duplicates[:3]}")
+        failures += 1
+    over = [r["mechanic"] for r in results.values() if r["minutes"] > args.capacity]
+    if over:
+        print(f"❌ {len(over)} mechanics got more than {args.capacity} minutes")
+        failures += 1
+    claims = models.WorkQueueClaim.__table__
+    with SessionLocal() as db:
+        stored = db.execute(
+            select(claims.c.bike_id, claims.c.component).where(claims.c.mechanic.startswith(MECHANIC_PREFIX))
+        ).all()
+    if Counter(tuple(row) for row in stored) != handed_out:
+        print(f"❌ {len(stored)} claims stored for {sum(handed_out.values())} jobs handed out")
+        failures += 1
+    minutes = sum(r["minutes"] for r in results.values())
+    print(f"{args.mechanics} mechanics claimed {len(handed_out)} jobs, {minutes} minutes "
+          f"({minutes / (args.mechanics * args.capacity):.0%} of capacity)")
+
+    # A mechanic's second claim only gets what is left of their capacity
+    again = queues[0].claim(f"{MECHANIC_PREFIX}0", args.capacity)
+    if results[0]["minutes"] + again["minutes"] > args.capacity:
+        print("❌ a second claim ignored the jobs already held")
+        failures += 1
+
+    # Concurrent claims by one mechanic (a double-submitted form) share one capacity
+    same = []
+
+    def claim_same(i):
+        same.append(queues[i % len(queues)].claim(f"{MECHANIC_PREFIX}same", args.capacity)["minutes"])
+
+    threads = [threading.Thread(target=claim_same, args=(i,)) for i in range(args.mechanics)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if sum(same) > args.capacity:
+        print(f"❌ concurrent claims by one mechanic got {sum(same)} minutes, capacity {args.capacity}")
+        failures += 1
+    failures += check_complete(queues[0], results)
+    return failures
+
+
+def check_complete(queue: WorkQueue, results) -> int:
+    jobs = [(r["mechanic"], job) for r in results.values() for job in r["jobs"]]
+    if not jobs:
+        print("⚠️ No jobs were claimed, completion not checked")
+        return 0
+    mechanic, job = jobs[0]
+    failures = 0
+    try:
+        queue.complete(job["bike_id"], job["component"], "someone else")
+        print("❌ a job was completed by a mechanic who did not claim it")
+        failures += 1
+    except LookupError:
+        pass
+    record = queue.complete(job["bike_id"], job["component"], mechanic)
+    with SessionLocal() as db:
+        features = db.get(models.BikeFeatures, job["bike_id"])
+        written = db.get(models.MaintenanceRecord, record["record_id"])
+    if written is None or written.component != job["component"] or written.action != "replaced":
+        print("❌ completing a job did not write its replacement")
+        failures += 1
+    if features is None or features.km_since_service != 0:
+        print(f"❌ km_since_service is {features and features.km_since_service} after completing a job")
+        failures += 1
+    queue.sync()
+    if any(p["bike_id"] == job["bike_id"] and p["component"] == job["component"] for p in queue.peek(limit=100000)):
+        print("❌ a completed job is back in the queue")
+        failures += 1
+    print(f"completed {job['component']} on bike {job['bike_id']}: record {record['record_id']}")
+    return failures
+
+
+def release_all() -> None:
+    claims = models.WorkQueueClaim.__table__
+    with SessionLocal() as db:
+        db.execute(delete(claims).where(claims.c.mechanic.startswith(MECHANIC_PREFIX)))
+        db.commit()
+
+
+def benchmark(args, rng: random.Random) -> None:
+    print(f"\n{'call':<36} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    size = args.heap_size
+    heap = IndexedHeap({key: rng.random() for key in range(size)})
+    keys = [rng.randrange(size) for _ in range(args.requests)]
+    report(f"heap priority change ({size} keys)", [
+        _timed(heap.push, key, rng.random()) for key in keys
+    ])
+    priorities = {key: rng.random() for key in range(size)}
+    samples = []
+    for key in keys[:20]:
+        started = time.perf_counter()
+        priorities[key] = rng.random()
+        sorted(priorities, key=priorities.__getitem__, reverse=True)
+        samples.append(time.perf_counter() - started)
+    report(f"re-sort instead ({size} keys)", samples)
+
+    queue = WorkQueue()
+    started = time.perf_counter()
+    queue.sync()
+    print(f"{'full build':<36} {(time.perf_counter() - started) * 1000:>8.3f}")
+    bike_ids = queue.index.bike_ids()
+    samples = []
+    for _ in range(args.requests // 10):
+        queue.invalidate([rng.choice(bike_ids)])
+        samples.append(_timed(queue.sync))
+    report("rescore one changed bike", samples)
+    report("peek 20", [_timed(queue.peek, None, 20) for _ in range(args.requests)])
+    samples = []
+    for _ in range(args.requests // 10):
+        started = time.perf_counter()
+        result = queue.claim(f"{MECHANIC_PREFIX}timing", 60)
+        samples.append(time.perf_counter() - started)
+        for job in result["jobs"]:
+            queue.release(job["bike_id"], job["component"], f"{MECHANIC_PREFIX}timing")
+    report("claim 60 minutes", samples)
+
+
+def _timed(call, *args) -> float:
+    started = time.perf_counter()
+    call(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mechanics", type=int, default=8)
+    parser.add_argument("--capacity", type=int, default=4 * 60, help="Minutes each mechanic can take on")
+    parser.add_argument("--heap-size", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    run_migrations()
+    model_server.load()
+    rng = random.Random(args.seed)
+    failures = check_heap(rng, 2000)
+    try:
+        failures += check_claims(args)
+        benchmark(args, rng)
+    finally:
+        release_all()
+    if failures:
+        print(f"❌ {failures} checks failed")
+        sys.exit(1)
+    print("✅ Work queue order, claims and completion are consistent")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Build (or extend) the cached point-in-time training snapshots.
+
+Each row holds a bike's features as of the end of a day and whether a
+component was replaced within the following horizon. Only days newer than
+the cache are computed.
+
+    python scripts/build_training_dataset.py
+    python scripts/build_training_dataset.py --horizon-days 14 --every-days 7 --verify 3
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from predictions import FEATURE_COLUMNS  # noqa: E402
+from training_dataset import (  # noqa: E402
+    LABEL_COLUMN,
+    SNAPSHOT_CACHE_DIR,
+    SNAPSHOT_HORIZON_DAYS,
+    SNAPSHOT_SHARD_SIZE,
+    build_dataset,
+    load_dataset,
+    snapshot_time,
+)
+from training_features import training_features  # noqa: E402
+
+load_dotenv()
+
+
+def verify(url, dataset, samples):
+    """Compare a few snapshot days with a direct as-of feature computation"""
+    engine = create_engine(url)
+    days = dataset["snapshot_date"].unique()
+    failed = False
+    for day in days[np.linspace(0, len(days) - 1, samples).astype(int)]:
+        expected = training_features(engine, as_of=snapshot_time(day).to_pydatetime())
+        actual = dataset[dataset["snapshot_date"] == day].merge(expected, on="bike_id", suffixes=("", "_expected"))
+        bad = {
+            column: int((~np.isclose(actual[column], actual[f"{column}_expected"], rtol=1e-9, atol=1e-6)).sum())
+            for column in FEATURE_COLUMNS
+        }
+        status = "❌" if any(bad.values()) else "✅"
+        print(f"{status} {day.date()}: {len(actual)} bikes, mismatches {bad}")
+        failed = failed or any(bad.values())
+    engine.dispose()
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--horizon-days", type=int, default=SNAPSHOT_HORIZON_DAYS)
+    parser.add_argument("--every-days", type=int, default=1, help="Days between snapshots")
+    parser.add_argument("--cache-dir", default=SNAPSHOT_CACHE_DIR)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--shard-size", type=int, default=SNAPSHOT_SHARD_SIZE)
+    parser.add_argument("--rebuild", action="store_true", help="Discard the cache first")
+    parser.add_argument("--verify", type=int, metavar="DAYS", default=0,
+                        help="Check this many snapshot days against training_features")
+    args = parser.parse_args()
+
+    manifest = build_dataset(
+        args.url, horizon_days=args.horizon_days, every_days=args.every_days, cache_dir=args.cache_dir,
+        workers=args.workers, shard_size=args.shard_size, rebuild=args.rebuild,
+    )
+    dataset = load_dataset(manifest)
+    print(f"{len(dataset)} snapshots over {dataset['snapshot_date'].nunique()} days, "
+          f"{dataset[LABEL_COLUMN].mean():.1%} positive")
+    if args.verify and len(dataset) and not verify(args.url, dataset, args.verify):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
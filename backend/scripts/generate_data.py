@@ -1,115 +1,313 @@
-import pandas as pd
+"""Generate a synthetic fleet of bikes, rides and maintenance records.
+
+Bikes are split into shards that are generated with vectorized NumPy in a
+process pool; the parent streams each finished shard into the database in
+chunks (COPY on PostgreSQL, executemany elsewhere) while later shards are
+still being generated. The output depends only on the seed, the fleet size,
+the number of days, the end date and the shard size, not on the number of
+workers.
+
+    python scripts/generate_data.py
+    python scripts/generate_data.py --bikes 50000 --days 1095 --seed 7 --end-date 2026-01-01
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
 import numpy as np
-from datetime import datetime, timedelta
-import random
-from sqlalchemy import create_engine, text
+import pandas as pd
 from dotenv import load_dotenv
-import os
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import feature_store  # noqa: E402
+import models  # noqa: E402
+import ride_archive  # noqa: E402
+import rollups  # noqa: E402
 
 load_dotenv()
 
-def generate_synthetic_data():
-    engine = create_engine(os.getenv("DATABASE_URL"))
-    
-    # Clear existing data
-    with engine.connect() as conn:
-        conn.execute(text("DELETE FROM maintenance_records;"))
-        conn.execute(text("DELETE FROM rides;"))
-        conn.execute(text("DELETE FROM bikes;"))
-        conn.commit()
-
-    # Generate bikes
-    bikes_data = []
-    for i in range(1, 101):  # 100 bikes
-        bikes_data.append({
-            'bike_id': i,
-            'purchased_date': datetime.now() - timedelta(days=random.randint(100, 365)),
-            'status': 'active',
-            'total_distance_km': 0
-        })
-    
-    bikes_df = pd.DataFrame(bikes_data)
-    bikes_df.to_sql('bikes', engine, if_exists='append', index=False)
-    print("Generated 100 bikes")
-
-    # Generate rides and maintenance records
-    all_rides = []
-    all_maintenance = []
-    
-    for bike_id in range(1, 101):
-        current_date = datetime.now() - timedelta(days=90)  # 90 days of history
-        last_maintenance_date = current_date - timedelta(days=random.randint(10, 30))
-        total_km = 0
-        
-        # Only 70% of bikes will have failures (more realistic)
-        bike_will_have_failures = random.random() < 0.7
-        
-        while current_date <= datetime.now():
-            # 0-4 rides per day
-            num_rides = random.randint(0, 4)
-            for _ in range(num_rides):
-                # Simulate ride
-                is_long_ride = random.random() < 0.2
-                distance = random.uniform(1, 15) if is_long_ride else random.uniform(0.5, 5)
-                is_hard_ride = random.random() < 0.15
-                vibration = random.uniform(8, 20) if is_hard_ride else random.uniform(1, 7)
-                weather = 'rain' if random.random() < 0.2 else 'clear'
-                
-                ride_data = {
-                    'bike_id': bike_id,
-                    'start_time': current_date - timedelta(hours=random.randint(1, 5)),
-                    'end_time': current_date,
-                    'start_lat': 40.7 + random.uniform(-0.1, 0.1),
-                    'start_lon': -74.0 + random.uniform(-0.1, 0.1),
-                    'end_lat': 40.7 + random.uniform(-0.1, 0.1),
-                    'end_lon': -74.0 + random.uniform(-0.1, 0.1),
-                    'distance_km': distance,
-                    'avg_vibration': vibration,
-                    'weather_condition': weather
-                }
-                all_rides.append(ride_data)
-                total_km += distance
-                
-                # Only simulate maintenance for bikes that will have failures
-                if bike_will_have_failures and is_hard_ride and (datetime.now() - last_maintenance_date).days > 7:
-                    fail_component = random.choice(['brake', 'chain', 'tire'])
-                    failure_date = current_date + timedelta(days=random.randint(5, 14))
-                    if failure_date <= datetime.now():
-                        maint_data = {
-                            'bike_id': bike_id,
-                            'maintenance_date': failure_date,
-                            'component': fail_component,
-                            'action': 'replaced',
-                            'associated_ride_id': len(all_rides)
-                        }
-                        all_maintenance.append(maint_data)
-                        last_maintenance_date = failure_date
-            
-            current_date += timedelta(days=1)
-    
-    # Save to database
-    rides_df = pd.DataFrame(all_rides)
-    rides_df.to_sql('rides', engine, if_exists='append', index=False)
-    print(f"Generated {len(all_rides)} rides")
-    
-    if all_maintenance:
-        maint_df = pd.DataFrame(all_maintenance)
-        maint_df.to_sql('maintenance_records', engine, if_exists='append', index=False)
-        print(f"Generated {len(all_maintenance)} maintenance records for {len(set([m['bike_id'] for m in all_maintenance]))} bikes")
+SECONDS_PER_DAY = 86400
+COMPONENTS = np.array(["brake", "chain", "tire"])
+# Share of bikes that will have failures at all (more realistic)
+FAILING_BIKE_RATIO = 0.7
+# A hard ride only leads to a failure once the last service is this old
+MIN_DAYS_BETWEEN_FAILURES = 8
+
+
+def shard_bounds(bikes, shard_size):
+    """(first_bike_id, bike_count) for each shard"""
+    return [(first, min(shard_size, bikes - first + 1)) for first in range(1, bikes + 1, shard_size)]
+
+
+def ride_counts(seed, shard, n_bikes, days):
+    """Rides per bike per day (0-4). Drawn from their own stream so the parent
+    can size every shard, and hand out ride ids, without generating it."""
+    rng = np.random.default_rng([seed, shard, 0])
+    return rng.integers(0, 5, size=(n_bikes, days + 1))
+
+
+def generate_shard(seed, shard, first_bike_id, n_bikes, days, end_date, first_ride_id):
+    """Generate the bikes, rides and maintenance records of one shard as
+    column arrays keyed like the table columns"""
+    rng = np.random.default_rng([seed, shard, 1])
+    first_day = np.datetime64(end_date, "D") - days
+
+    bike_ids = np.arange(first_bike_id, first_bike_id + n_bikes)
+    purchased = np.datetime64(end_date, "D") - rng.integers(100, 366, n_bikes)
+    will_fail = rng.random(n_bikes) < FAILING_BIKE_RATIO
+    # Seconds from first_day to the last service before the simulated period
+    last_service = -rng.integers(10, 31, n_bikes) * SECONDS_PER_DAY
+
+    counts = ride_counts(seed, shard, n_bikes, days).ravel()
+    slot = np.repeat(np.arange(counts.size), counts)
+    n = slot.size
+    bike = slot // (days + 1)
+    end_offset = (slot % (days + 1)) * SECONDS_PER_DAY + rng.integers(6 * 3600, 23 * 3600, n)
+
+    # Ride ids follow time order within each bike
+    order = np.lexsort((end_offset, bike))
+    bike, end_offset = bike[order], end_offset[order]
+    start_offset = end_offset - rng.integers(1, 6, n) * 3600
+
+    is_long = rng.random(n) < 0.2
+    distance = np.where(is_long, rng.uniform(1, 15, n), rng.uniform(0.5, 5, n))
+    is_hard = rng.random(n) < 0.15
+    vibration = np.where(is_hard, rng.uniform(8, 20, n), rng.uniform(1, 7, n))
+    weather = np.where(rng.random(n) < 0.2, "rain", "clear")
+    ride_ids = np.arange(first_ride_id, first_ride_id + n)
+
+    base = first_day.astype("datetime64[s]")
+    rides = {
+        "ride_id": ride_ids,
+        "bike_id": bike_ids[bike],
+        "start_time": base + start_offset,
+        "end_time": base + end_offset,
+        "start_lat": 40.7 + rng.uniform(-0.1, 0.1, n),
+        "start_lon": -74.0 + rng.uniform(-0.1, 0.1, n),
+        "end_lat": 40.7 + rng.uniform(-0.1, 0.1, n),
+        "end_lon": -74.0 + rng.uniform(-0.1, 0.1, n),
+        "distance_km": distance,
+        "avg_vibration": vibration,
+        "weather_condition": weather,
+    }
+
+    # A hard ride on a failing bike breaks a component 5-14 days later, unless
+    # the bike was serviced recently. Each round finds, for every bike at
+    # once, its next eligible hard ride, so the loop runs once per failure
+    # per bike rather than once per ride.
+    candidates = np.flatnonzero(is_hard & will_fail[bike])
+    cand_bike, cand_time = bike[candidates], end_offset[candidates]
+    span = (days + 2) * SECONDS_PER_DAY
+    keys = cand_bike * span + cand_time
+    eligible = last_service + MIN_DAYS_BETWEEN_FAILURES * SECONDS_PER_DAY
+    active = np.unique(cand_bike)
+    failures = []
+    while active.size:
+        pos = np.searchsorted(keys, active * span + np.maximum(eligible[active], 0))
+        found = pos < keys.size
+        found[found] &= cand_bike[pos[found]] == active[found]
+        active, pos = active[found], pos[found]
+        if not active.size:
+            break
+        fail_day = cand_time[pos] // SECONDS_PER_DAY + rng.integers(5, 15, active.size)
+        component = rng.integers(0, len(COMPONENTS), active.size)
+        recorded = fail_day <= days
+        failures.append((active[recorded], fail_day[recorded], component[recorded], candidates[pos[recorded]]))
+        eligible[active] = np.where(
+            recorded,
+            (fail_day + MIN_DAYS_BETWEEN_FAILURES) * SECONDS_PER_DAY,
+            cand_time[pos] + 1,
+        )
+
+    if failures:
+        fail_bike, fail_day, component, ride_index = (np.concatenate(c) for c in zip(*failures))
     else:
-        print("No maintenance records generated")
-    
-    # Update total distance for each bike
-    with engine.connect() as conn:
-        for bike_id in range(1, 101):
-            result = conn.execute(text(f"SELECT SUM(distance_km) FROM rides WHERE bike_id = {bike_id}"))
-            total_dist = result.scalar() or 0
-            conn.execute(text(f"UPDATE bikes SET total_distance_km = {total_dist} WHERE bike_id = {bike_id}"))
-        conn.commit()
-    
+        fail_bike = fail_day = component = ride_index = np.array([], dtype=np.int64)
+    order = np.lexsort((fail_day, fail_bike))
+    maintenance = {
+        "bike_id": bike_ids[fail_bike[order]],
+        "maintenance_date": first_day + fail_day[order],
+        "component": COMPONENTS[component[order]],
+        "action": np.full(order.size, "replaced"),
+        "associated_ride_id": ride_ids[ride_index[order]],
+    }
+
+    bikes = {
+        "bike_id": bike_ids,
+        "purchased_date": purchased,
+        "status": np.full(n_bikes, "active"),
+        "total_distance_km": np.zeros(n_bikes),
+    }
+    return bikes, rides, maintenance
+
+
+def sqlite_values(values):
+    """Column values as stored by SQLAlchemy's SQLite Date/DateTime types"""
+    if values.dtype == "datetime64[s]":
+        text_values = np.char.replace(np.datetime_as_string(values, unit="s"), "T", " ")
+        return np.char.add(text_values, ".000000").tolist()
+    if values.dtype.kind == "M":
+        return np.datetime_as_string(values, unit="D").tolist()
+    return values.tolist()
+
+
+def write_columns(conn, table, columns, chunk_size):
+    """Stream column arrays into ``table`` in chunks of ``chunk_size`` rows"""
+    names = list(columns)
+    total = len(columns[names[0]])
+    for start in range(0, total, chunk_size):
+        chunk = {name: values[start:start + chunk_size] for name, values in columns.items()}
+        if conn.dialect.name == "postgresql":
+            buffer = io.StringIO()
+            pd.DataFrame(chunk).to_csv(buffer, header=False, index=False)
+            buffer.seek(0)
+            cursor = conn.connection.cursor()
+            try:
+                cursor.copy_expert(f"COPY {table.name} ({', '.join(names)}) FROM STDIN WITH (FORMAT csv)", buffer)
+            finally:
+                cursor.close()
+        else:
+            # Plain driver executemany; going through table.insert() costs a
+            # Python-level type conversion per value
+            rows = list(zip(*(sqlite_values(chunk[name]) for name in names)))
+            conn.exec_driver_sql(
+                f"INSERT INTO {table.name} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                rows,
+            )
+
+
+def clear_tables(conn):
+    """Empty every table, children first; returns the archive files that
+    were catalogued, to be deleted once the transaction commits"""
+    archived = ride_archive.archived_parts(conn)
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("TRUNCATE work_queue_claims, predictions, ride_rollups_daily, maintenance_rollups_daily, "
+                          "bike_features, ride_archive_parts, maintenance_records, rides, bikes"))
+    else:
+        for table in ("work_queue_claims", "predictions", "ride_rollups_daily", "maintenance_rollups_daily",
+                      "bike_features", "ride_archive_parts", "maintenance_records", "rides", "bikes"):
+            conn.execute(text(f"DELETE FROM {table}"))
+    return archived
+
+
+def remove_archive_files(paths, archive_dir=ride_archive.RIDE_ARCHIVE_DIR):
+    for path in paths:
+        try:
+            os.remove(os.path.join(archive_dir, path))
+        except FileNotFoundError:
+            pass
+
+
+def finish(conn):
+    """Set bike totals with one aggregate UPDATE and fix up sequences"""
+    conn.execute(text(
+        "UPDATE bikes SET total_distance_km = COALESCE("
+        "(SELECT SUM(distance_km) FROM rides WHERE rides.bike_id = bikes.bike_id), 0)"
+    ))
+    if conn.dialect.name == "postgresql":
+        # Ids were written explicitly, so move the sequences past them
+        for table, key in (("bikes", "bike_id"), ("rides", "ride_id")):
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', '{key}'), "
+                f"COALESCE((SELECT MAX({key}) FROM {table}), 0) + 1, false)"
+            ))
+    conn.execute(text("ANALYZE"))
+
+
+def generate_synthetic_data(url=None, bikes=100, days=90, seed=42, end_date=None,
+                            workers=None, shard_size=250, chunk_size=50000):
+    engine = create_engine(url or os.getenv("DATABASE_URL"))
+    end_date = end_date or date.today()
+    shards = shard_bounds(bikes, shard_size)
+    workers = workers or os.cpu_count() or 1
+
+    # Ride ids are handed out up front so shards can be generated independently
+    first_ride_ids, next_id = [], 1
+    for shard, (_, n_bikes) in enumerate(shards):
+        first_ride_ids.append(next_id)
+        next_id += int(ride_counts(seed, shard, n_bikes, days).sum())
+
+    started = time.perf_counter()
+    totals = {"bikes": 0, "rides": 0, "maintenance": 0}
+    failing_bikes = 0
+    with engine.begin() as conn:
+        archived = clear_tables(conn)
+    remove_archive_files(archived)
+    if archived:
+        print(f"Removed {len(archived)} archived ride files")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        tasks = iter(enumerate(shards))
+
+        def submit_next():
+            for shard, (first_bike_id, n_bikes) in tasks:
+                pending.append(pool.submit(
+                    generate_shard, seed, shard, first_bike_id, n_bikes, days, end_date,
+                    first_ride_ids[shard],
+                ))
+                return
+
+        # Keep a bounded number of shards in flight so memory stays flat
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            bikes_cols, rides_cols, maintenance_cols = pending.popleft().result()
+            submit_next()
+            with engine.begin() as conn:
+                write_columns(conn, models.Bike.__table__, bikes_cols, chunk_size)
+                write_columns(conn, models.Ride.__table__, rides_cols, chunk_size)
+                write_columns(conn, models.MaintenanceRecord.__table__, maintenance_cols, chunk_size)
+            totals["bikes"] += len(bikes_cols["bike_id"])
+            totals["rides"] += len(rides_cols["ride_id"])
+            totals["maintenance"] += len(maintenance_cols["bike_id"])
+            failing_bikes += len(np.unique(maintenance_cols["bike_id"]))
+            print(f"Wrote {totals['bikes']}/{bikes} bikes, {totals['rides']} rides", flush=True)
+
+    with engine.begin() as conn:
+        finish(conn)
+
+    # Bulk-loaded rows bypass the incremental updates, so rebuild the store
+    # and the rollups
+    with Session(engine) as db:
+        feature_store.rebuild(db)
+        rollups.rebuild(db)
+
+    elapsed = time.perf_counter() - started
+    rows = sum(totals.values())
     print("Synthetic data generation complete!")
-    print(f"Bikes with failures: {len(set([m['bike_id'] for m in all_maintenance])) if all_maintenance else 0}")
-    print(f"Bikes without failures: {100 - (len(set([m['bike_id'] for m in all_maintenance])) if all_maintenance else 0)}")
+    print(f"Generated {totals['bikes']} bikes, {totals['rides']} rides and "
+          f"{totals['maintenance']} maintenance records in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+    print(f"Bikes with failures: {failing_bikes}")
+    print(f"Bikes without failures: {totals['bikes'] - failing_bikes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Database URL (defaults to DATABASE_URL)")
+    parser.add_argument("--bikes", type=int, default=100)
+    parser.add_argument("--days", type=int, default=90, help="Days of ride history")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end-date", type=date.fromisoformat,
+                        help="Last simulated day, YYYY-MM-DD (default: today)")
+    parser.add_argument("--workers", type=int, help="Generator processes (default: CPU count)")
+    parser.add_argument("--shard-size", type=int, default=250,
+                        help="Bikes per shard; part of what the seed reproduces")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows per COPY/executemany")
+    args = parser.parse_args()
+    generate_synthetic_data(
+        url=args.url, bikes=args.bikes, days=args.days, seed=args.seed, end_date=args.end_date,
+        workers=args.workers, shard_size=args.shard_size, chunk_size=args.chunk_size,
+    )
+
 
 if __name__ == "__main__":
-    generate_synthetic_data()
\ No newline at end of file
+    main()
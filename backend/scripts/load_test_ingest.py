@@ -0,0 +1,161 @@
+"""Load-test ride ingestion and report sustained rows per second.
+
+Against a running API (python main.py):
+
+    python scripts/load_test_ingest.py --url http://localhost:8000 --clients 16
+
+Or directly against the micro-batcher and database, without HTTP:
+
+    python scripts/load_test_ingest.py --direct
+
+A batch of rides with UTC offsets ("Z", "+02:00") is sent first and must
+be written in full; the exit status is 1 otherwise.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_rides(count, bike_ids, rng):
+    now = datetime.now()
+    rides = []
+    for _ in range(count):
+        end = now - timedelta(seconds=rng.randint(0, 3600))
+        rides.append({
+            "bike_id": rng.choice(bike_ids),
+            "start_time": (end - timedelta(minutes=rng.randint(5, 90))).isoformat(),
+            "end_time": end.isoformat(),
+            "distance_km": round(rng.uniform(0.5, 15), 3),
+            "avg_vibration": round(rng.uniform(1, 20), 3),
+            "weather_condition": "rain" if rng.random() < 0.2 else "clear",
+        })
+    return rides
+
+
+def http_sender(url, ndjson):
+    import requests
+
+    session = requests.Session()
+
+    def send(rides):
+        if ndjson:
+            body = "\n".join(json.dumps(r) for r in rides)
+            response = session.post(f"{url}/rides/stream", data=body,
+                                    headers={"Content-Type": "application/x-ndjson"})
+        else:
+            response = session.post(f"{url}/rides/batch", json=rides)
+        response.raise_for_status()
+        return response.json()["written"]
+
+    return send
+
+
+def direct_sender():
+    from database import SessionLocal
+    from ingest import prepare_rides, ride_batcher
+
+    def send(rides):
+        db = SessionLocal()
+        try:
+            accepted, _ = prepare_rides(db, rides)
+        finally:
+            db.close()
+        return ride_batcher.submit(accepted).result()
+
+    return send
+
+
+def check_timezones(send, bike_id) -> bool:
+    """Rides with a UTC offset ("Z", "+02:00") must be written, not fail the batch"""
+    end = datetime.now().replace(microsecond=0) - timedelta(hours=3)
+    rides = [
+        {"bike_id": bike_id, "start_time": (end - timedelta(minutes=30)).isoformat() + "Z",
+         "end_time": end.isoformat() + "Z", "distance_km": 1.0},
+        {"bike_id": bike_id, "start_time": (end - timedelta(minutes=30)).isoformat() + "+02:00",
+         "end_time": end.isoformat() + "+02:00", "distance_km": 1.0},
+    ]
+    try:
+        written = send(rides)
+    except Exception as e:
+        print(f"❌ Rides with a UTC offset failed: {e}")
+        return False
+    if written != len(rides):
+        print(f"❌ {written} of {len(rides)} rides with a UTC offset were written")
+        return False
+    return True
+
+
+def bike_ids_from(url, direct):
+    if direct:
+        import models
+        from database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            return [b for (b,) in db.query(models.Bike.bike_id).all()]
+        finally:
+            db.close()
+    import requests
+
+    return [b["bike_id"] for b in requests.get(f"{url}/bikes").json()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--direct", action="store_true", help="Bypass HTTP and use the batcher in-process")
+    parser.add_argument("--ndjson", action="store_true", help="Use the /rides/stream endpoint")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=500, help="Rides per request")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    bike_ids = bike_ids_from(args.url, args.direct)
+    if not bike_ids:
+        print("No bikes found; generate data first")
+        sys.exit(1)
+
+    send = direct_sender() if args.direct else http_sender(args.url, args.ndjson)
+    if not check_timezones(send, bike_ids[0]):
+        sys.exit(1)
+    deadline = time.monotonic() + args.duration
+    lock = threading.Lock()
+    totals = {"rows": 0, "requests": 0, "latencies": []}
+
+    def client(index):
+        rng = random.Random(args.seed + index)
+        while time.monotonic() < deadline:
+            rides = make_rides(args.batch_size, bike_ids, rng)
+            start = time.perf_counter()
+            written = send(rides)
+            elapsed = time.perf_counter() - start
+            with lock:
+                totals["rows"] += written
+                totals["requests"] += 1
+                totals["latencies"].append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        for future in [pool.submit(client, i) for i in range(args.clients)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(totals["latencies"])
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0
+    print(f"clients={args.clients} batch_size={args.batch_size} requests={totals['requests']}")
+    print(f"rows written: {totals['rows']} in {elapsed:.1f}s")
+    print(f"sustained throughput: {totals['rows'] / elapsed:,.0f} rows/s")
+    print(f"request latency p50={latencies[len(latencies) // 2] * 1000:.1f}ms p99={p99 * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
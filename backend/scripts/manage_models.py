@@ -0,0 +1,56 @@
+"""Inspect the model registry and move the promoted-version pointer.
+
+    python scripts/manage_models.py list
+    python scripts/manage_models.py promote 20261016-093000-ab12cd
+    python scripts/manage_models.py rollback
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_registry import MODEL_REGISTRY_DIR, ModelRegistry  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--registry", default=MODEL_REGISTRY_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List versions, marking the promoted one")
+    show = commands.add_parser("show", help="Print a version's schema and metrics")
+    show.add_argument("version", nargs="?")
+    promote = commands.add_parser("promote", help="Serve this version")
+    promote.add_argument("version")
+    commands.add_parser("rollback", help="Serve the previously promoted version")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry)
+    try:
+        if args.command == "list":
+            current = registry.current()
+            for version in registry.versions():
+                metrics = registry.metrics(version)
+                score = metrics.get("cv_score")
+                marker = "*" if version == current else " "
+                print(f"{marker} {version}  rows={metrics.get('rows')}"
+                      + (f"  cv_{metrics.get('metric')}={score:.4f}" if score is not None else ""))
+        elif args.command == "show":
+            version = args.version or registry.current()
+            if version is None:
+                raise ValueError("No version promoted")
+            print(json.dumps({"version": version, "schema": registry.schema(version),
+                              "metrics": registry.metrics(version)}, indent=2))
+        elif args.command == "promote":
+            registry.promote(args.version)
+            print(f"✅ Promoted {args.version}")
+        elif args.command == "rollback":
+            print(f"✅ Rolled back to {registry.rollback()}")
+    except (ValueError, FileNotFoundError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Rebuild or verify the incremental bike_features store.
+
+    python scripts/rebuild_features.py            # full recomputation
+    python scripts/rebuild_features.py --verify   # compare without writing
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import feature_store  # noqa: E402
+from database import SessionLocal, run_migrations  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verify", action="store_true", help="Only compare the store with a full recomputation")
+    args = parser.parse_args()
+
+    run_migrations()
+    db = SessionLocal()
+    try:
+        if args.verify:
+            mismatches = feature_store.verify(db)
+            for mismatch in mismatches[:20]:
+                print(f"bike {mismatch['bike_id']}: {mismatch['field']} stored={mismatch['stored']!r} expected={mismatch['expected']!r}")
+            if mismatches:
+                print(f"❌ {len(mismatches)} feature mismatches")
+                sys.exit(1)
+            print("✅ Feature store matches a full recomputation")
+        else:
+            count = feature_store.rebuild(db)
+            print(f"Rebuilt features for {count} bikes")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Rebuild the daily ride and maintenance rollups behind /analytics.
+
+    python scripts/rebuild_rollups.py                                    # every day
+    python scripts/rebuild_rollups.py --start 2024-01-01 --end 2024-01-31
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rollups  # noqa: E402
+from database import SessionLocal, run_migrations  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--start", type=date.fromisoformat, help="First day to rebuild (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last day to rebuild, inclusive")
+    args = parser.parse_args()
+
+    run_migrations()
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        counts = rollups.rebuild(db, args.start, args.end)
+        days = f"{args.start or 'first day'} to {args.end or 'last day'}"
+        print(f"Rebuilt rollups from {days} in {time.perf_counter() - started:.1f}s: "
+              + ", ".join(f"{count} {table} rows" for table, count in counts.items()))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Precompute fleet predictions into the predictions table.
+
+Runs the scheduler as its own process, so API workers can be started with
+PREDICTION_SCHEDULER=off and only read the table:
+
+    python scripts/run_prediction_scheduler.py              # every PREDICTION_REFRESH_SECONDS
+    python scripts/run_prediction_scheduler.py --once       # one run, then exit
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import run_migrations  # noqa: E402
+from drift_monitor import drift_monitor  # noqa: E402
+from model_serving import model_server  # noqa: E402
+from prediction_scheduler import (  # noqa: E402
+    PREDICTION_BATCH_SIZE,
+    PREDICTION_MAX_AGE_SECONDS,
+    PREDICTION_REFRESH_SECONDS,
+    PredictionScheduler,
+)
+
+
+def report(run):
+    print(f"{run['started_at']} {run['processed']}/{run['dirty_bikes']} dirty bikes in "
+          f"{run['batches']} batches, {run['duration_seconds']:.2f}s ({run['variant']})", flush=True)
+    if run["drift_breaches"]:
+        print(f"⚠️ Drift: {'; '.join(run['drift_breaches'])}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--once", action="store_true", help="Run once and exit")
+    parser.add_argument("--interval", type=float, default=PREDICTION_REFRESH_SECONDS)
+    parser.add_argument("--batch-size", type=int, default=PREDICTION_BATCH_SIZE)
+    parser.add_argument("--max-age", type=float, default=PREDICTION_MAX_AGE_SECONDS,
+                        help="Recompute predictions older than this many seconds even if unchanged")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    run_migrations()
+    model_server.load()
+    scheduler = PredictionScheduler(
+        model_server=model_server, interval=args.interval, batch_size=args.batch_size, max_age=args.max_age,
+        drift_monitor=drift_monitor,
+    )
+    if args.once:
+        report(scheduler.run_once())
+        return
+
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                report(scheduler.run_once())
+            except Exception as e:
+                print(f"❌ Prediction scheduler run failed: {e}", flush=True)
+            time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
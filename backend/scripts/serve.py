@@ -0,0 +1,158 @@
+"""Serve the API from pre-forked workers that share the loaded model.
+
+The parent runs the migrations, loads the model (and with it xgboost) and
+fills the in-memory feature and location indexes once, then forks the
+workers. They start with those pages shared copy-on-write instead of each
+importing and loading them again, which is what ``uvicorn --workers`` does
+since it spawns fresh interpreters. A worker that dies is forked again
+from the parent. Linux/macOS only.
+
+    python scripts/serve.py --workers 4 --port 8000
+
+With several workers, run the prediction scheduler in one of them
+(the default when PREDICTION_SCHEDULER=thread) or as its own process.
+
+Several workers also need CACHE_URL pointing at a shared cache (Redis).
+The default in-process cache keeps its invalidation counters per worker,
+so a ride ingested through one worker, or a scheduler run in worker 0,
+would leave the others serving the old predictions and answering 304 to
+the old ETag until the entries expire. serve.py refuses --workers > 1
+without one; --unshared-cache overrides that for benchmarks that never
+write.
+
+    CACHE_URL=redis://localhost:6379/0 python scripts/serve.py --workers 4
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from cache import LRUCache, result_cache  # noqa: E402
+from database import engine  # noqa: E402
+from prediction_scheduler import PREDICTION_SCHEDULER  # noqa: E402
+
+# A worker exiting sooner than this after its fork is not restarted, so a
+# crash at startup does not turn into a fork loop
+MIN_WORKER_SECONDS = 5
+
+
+def listen(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(index: int, sock: socket.socket, args) -> None:
+    """Body of a forked worker; never returns"""
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    app = main.create_app(start_scheduler=index == 0 and PREDICTION_SCHEDULER == "thread")
+    config = uvicorn.Config(app, lifespan="on", log_level=args.log_level, access_log=args.access_log)
+    status = 0
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException as e:
+        print(f"❌ Worker {index} failed: {e}", flush=True)
+        status = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)
+
+
+def main_loop(args) -> None:
+    start = time.perf_counter()
+    if args.preload:
+        main.preload()
+        # The workers open their own connections
+        engine.dispose()
+        print(f"Preloaded in {time.perf_counter() - start:.2f}s", flush=True)
+    sock = listen(args.host, args.port)
+    # Objects created so far are never collected, so the collector does not
+    # touch (and un-share) their pages in the workers
+    gc.collect()
+    gc.freeze()
+
+    workers = {}  # pid -> (index, forked at)
+
+    def fork(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            run_worker(index, sock, args)
+        workers[pid] = (index, time.monotonic())
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(args.workers):
+        fork(index)
+    print(f"✅ Serving on http://{args.host}:{args.port} with {args.workers} workers "
+          f"(parent pid {os.getpid()})", flush=True)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index, forked_at = workers.pop(pid, (None, 0.0))
+        if index is None or stopping:
+            continue
+        if time.monotonic() - forked_at < MIN_WORKER_SECONDS:
+            print(f"❌ Worker {index} exited during startup (status {status}), stopping", flush=True)
+            stop(signal.SIGTERM, None)
+            continue
+        print(f"⚠️ Worker {index} exited (status {status}), starting a new one", flush=True)
+        fork(index)
+    sock.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    shared_cache = not isinstance(result_cache.backend, LRUCache)
+    parser.add_argument("--workers", type=int, default=(os.cpu_count() or 1) if shared_cache else 1,
+                        help="Default: one per CPU with CACHE_URL set, otherwise 1")
+    parser.add_argument("--no-preload", dest="preload", action="store_false",
+                        help="Let every worker load on its own after the fork (for comparison)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument("--unshared-cache", action="store_true",
+                        help="Allow several workers with the in-process cache (stale reads after writes)")
+    args = parser.parse_args()
+    if args.workers > 1 and not shared_cache and not args.unshared_cache:
+        parser.error("--workers > 1 needs CACHE_URL set to a shared cache; each worker's in-process "
+                     "cache would miss invalidations from the others")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # uvicorn only configures its own loggers; this shows the app's too
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.DEBUG),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    main_loop(args)
@@ -1,57 +1,116 @@
+import argparse
+import sys
+import time
+from datetime import datetime
 import pandas as pd
 from sqlalchemy import create_engine, text
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
 import xgboost as xgb
-import joblib
 import os
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model_search
+from drift_monitor import feature_baseline
+from model_registry import BASELINE_FILE, ModelRegistry
+from predictions import FEATURE_COLUMNS
+from training_dataset import LABEL_COLUMN, SNAPSHOT_HORIZON_DAYS, build_dataset, load_dataset
+from training_features import training_features
+
 load_dotenv()
 
-def train_model():
-    engine = create_engine(os.getenv("DATABASE_URL"))
-    
-    # SQLite-compatible query with 30-day window instead of 90
+def store_features(engine):
+    """Current features from the incrementally maintained bike_features store"""
+    # One row per bike instead of rescanning every ride
     query = """
     SELECT 
         b.bike_id,
         b.total_distance_km,
-        COALESCE((
-            SELECT SUM(distance_km) 
-            FROM rides r 
-            WHERE r.bike_id = b.bike_id 
-            AND r.end_time > COALESCE((SELECT MAX(maintenance_date) 
-                                    FROM maintenance_records 
-                                    WHERE bike_id = b.bike_id AND action = 'replaced'), '2000-01-01')
-        ), b.total_distance_km) as km_since_service,
-        COALESCE(julianday('now') - julianday(MAX(m.maintenance_date)), 999) as days_since_service,
-        COALESCE((
-            SELECT AVG(avg_vibration) 
-            FROM (
-                SELECT avg_vibration 
-                FROM rides 
-                WHERE bike_id = b.bike_id 
-                ORDER BY end_time DESC 
-                LIMIT 10
-            ) as recent_rides
-        ), 0) as avg_vibration_last_10,
-        CASE 
-            WHEN EXISTS (
-                SELECT 1 FROM maintenance_records mr 
-                WHERE mr.bike_id = b.bike_id 
-                AND mr.maintenance_date BETWEEN date('now', '-30 days') AND date('now')
-                AND mr.action = 'replaced'
-            ) THEN 1 
-            ELSE 0 
-        END as had_failure
+        COALESCE(f.km_since_service, b.total_distance_km) as km_since_service,
+        f.last_maintenance_date,
+        f.last_replaced_date,
+        COALESCE(f.avg_vibration_last_10, 0) as avg_vibration_last_10
     FROM bikes b
-    LEFT JOIN maintenance_records m ON b.bike_id = m.bike_id
-    GROUP BY b.bike_id
+    LEFT JOIN bike_features f ON b.bike_id = f.bike_id
     """
     
     df = pd.read_sql_query(query, engine)
     
+    now = pd.Timestamp.now()
+    df['days_since_service'] = (
+        (now - pd.to_datetime(df['last_maintenance_date'])).dt.total_seconds() / 86400
+    ).fillna(999)
+    # Label: a replacement within the last 30 days
+    last_replaced = pd.to_datetime(df['last_replaced_date'])
+    df['had_failure'] = ((last_replaced >= now.normalize() - pd.Timedelta(days=30)) & (last_replaced <= now)).astype(int)
+    return df
+
+def snapshot_features():
+    """Point-in-time snapshots: features at the end of day D, label = a
+    replacement within the following horizon (no label leakage)"""
+    manifest = build_dataset(os.getenv("DATABASE_URL"))
+    df = load_dataset(manifest)
+    return df.rename(columns={LABEL_COLUMN: 'had_failure'})
+
+def save_model(model, metrics, X_train, promote=True, extra_files=None):
+    """Register the booster as a new registry version and optionally promote it.
+
+    The training feature distributions are stored with it as the drift
+    monitor's baseline.
+    """
+    registry = ModelRegistry()
+    extra_files = {**(extra_files or {}), BASELINE_FILE: feature_baseline(X_train[FEATURE_COLUMNS])}
+    version = registry.register(model.get_booster(), FEATURE_COLUMNS, metrics, extra_files)
+    print(f"Model saved as version {version} in {registry.version_dir(version)}")
+    if promote:
+        registry.promote(version)
+        print(f"Promoted {version}; running APIs pick it up on their next request")
+    return version
+
+def search_model(df, X, y, folds, workers, early_stopping_rounds, promote=True):
+    """Cross-validated hyperparameter search; saves the best model and a leaderboard"""
+    start = time.perf_counter()
+    cv_folds = model_search.time_series_folds(
+        df['snapshot_date'].to_numpy(), n_splits=folds, gap_days=SNAPSHOT_HORIZON_DAYS
+    )
+    if not cv_folds:
+        print("Not enough snapshot days for time-series cross-validation")
+        return
+    leaderboard = model_search.search(
+        X.to_numpy(), y.to_numpy(), cv_folds, workers=workers, early_stopping_rounds=early_stopping_rounds
+    )
+    search_seconds = time.perf_counter() - start
+    model = model_search.best_model(leaderboard, X, y)
+    
+    print(f"Best: {leaderboard[0]['params']} ({model_search.EVAL_METRIC} {leaderboard[0]['score']:.4f}, "
+          f"{model.n_estimators} trees)")
+    metrics = {
+        "rows": len(df),
+        "folds": len(cv_folds),
+        "metric": model_search.EVAL_METRIC,
+        "cv_score": leaderboard[0]["score"],
+        "params": leaderboard[0]["params"],
+        "final_n_estimators": model.n_estimators,
+        "search_seconds": search_seconds,
+        "total_seconds": time.perf_counter() - start,
+    }
+    save_model(model, metrics, X, promote, {"leaderboard.json": leaderboard})
+    print(f"Search finished in {time.perf_counter() - start:.1f}s")
+
+def train_model(source="snapshots", as_of=None, search=False, folds=3, workers=None,
+                early_stopping_rounds=model_search.EARLY_STOPPING_ROUNDS, promote=True):
+    engine = create_engine(os.getenv("DATABASE_URL"))
+    
+    if source == "snapshots":
+        df = snapshot_features()
+    elif source == "store":
+        df = store_features(engine)
+    else:
+        # Recomputed from raw rides and maintenance; works for any as_of date
+        df = training_features(engine, as_of=as_of)
+    
     if df.empty:
         print("No data available for training")
         return
@@ -67,11 +126,25 @@ def train_model():
         return
     
     # Prepare features and target
-    X = df[['total_distance_km', 'km_since_service', 'days_since_service', 'avg_vibration_last_10']]
+    X = df[FEATURE_COLUMNS]
     y = df['had_failure']
     
+    if search:
+        if source != "snapshots":
+            print("--search needs the snapshots source for time-series folds")
+            return
+        search_model(df, X, y, folds, workers, early_stopping_rounds, promote)
+        return
+    
     # Split data
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    if source == "snapshots":
+        # Hold out the latest days: a bike's neighbouring days are near
+        # duplicates, so a random split would leak into the test set
+        cutoff = df['snapshot_date'].quantile(0.8)
+        train = (df['snapshot_date'] <= cutoff).to_numpy()
+        X_train, X_test, y_train, y_test = X[train], X[~train], y[train], y[~train]
+    else:
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
     # Train XGBoost model
     model = xgb.XGBClassifier(
@@ -91,9 +164,29 @@ def train_model():
     print(classification_report(y_test, y_pred))
     
     # Save model
-    os.makedirs('prod_model', exist_ok=True)
-    joblib.dump(model, 'prod_model/xgboost_model.joblib')
-    print("Model saved to prod_model/xgboost_model.joblib")
+    metrics = {
+        "source": source,
+        "rows": len(df),
+        "train_rows": len(X_train),
+        "test_rows": len(X_test),
+        "classification_report": classification_report(y_test, y_pred, output_dict=True),
+    }
+    save_model(model, metrics, X_train, promote)
 
 if __name__ == "__main__":
-    train_model()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the failure prediction model")
+    parser.add_argument("--source", choices=["snapshots", "rides", "store"], default="snapshots",
+                        help="Cached point-in-time snapshots, one as-of computation from raw rides, "
+                             "or the feature store")
+    parser.add_argument("--as-of", type=datetime.fromisoformat,
+                        help="Train on the fleet as it was at this time (rides source only)")
+    parser.add_argument("--search", action="store_true",
+                        help="Time-series cross-validated hyperparameter search in a process pool")
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--workers", type=int, help="Search processes (default: available cores)")
+    parser.add_argument("--early-stopping-rounds", type=int, default=model_search.EARLY_STOPPING_ROUNDS)
+    parser.add_argument("--no-promote", action="store_true",
+                        help="Register the new version without making it the served model")
+    args = parser.parse_args()
+    train_model(args.source, args.as_of, args.search, args.folds, args.workers, args.early_stopping_rounds,
+                not args.no_promote)
\ No newline at end of file
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+
+# database.py, ride_archive.py and model_registry.py read their settings at
+# import time, so point them at a scratch directory before anything imports them
+TEST_DIR = tempfile.mkdtemp(prefix="bike-maintenance-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}"
+os.environ["RIDE_ARCHIVE_DIR"] = os.path.join(TEST_DIR, "ride_archive")
+os.environ["MODEL_REGISTRY_DIR"] = os.path.join(TEST_DIR, "model_registry")
+os.environ["PREDICTION_SCHEDULER"] = "off"
+os.environ.pop("CACHE_URL", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+import models  # noqa: E402
+from database import SessionLocal, engine, run_migrations  # noqa: E402
+
+# Children first, so deleting respects the foreign keys
+TABLES = (
+    models.WorkQueueClaim, models.Prediction, models.RideRollup, models.MaintenanceRollup,
+    models.BikeFeatures, models.RideArchivePart, models.MaintenanceRecord, models.Ride, models.Bike,
+)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    run_migrations(engine)
+    yield
+    engine.dispose()
+
+
+@pytest.fixture
+def db():
+    """A session on an emptied database"""
+    with engine.begin() as conn:
+        for model in TABLES:
+            conn.execute(delete(model.__table__))
+    with SessionLocal() as session:
+        yield session
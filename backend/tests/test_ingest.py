@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+import models
+from ingest import ride_batcher
+from main import create_app
+
+
+def test_batcher_restarts_after_a_lifespan_closes_it(db):
+    db.add(models.Bike(bike_id=1, status="active", total_distance_km=0.0))
+    db.commit()
+    start = datetime(2025, 6, 1, 8)
+
+    # Each lifespan closes the module's batcher on shutdown
+    for app_number in range(3):
+        ride_start = start + timedelta(days=app_number)
+        with TestClient(create_app()) as client:
+            response = client.post("/rides/batch", json=[{
+                "bike_id": 1, "start_time": ride_start.isoformat(),
+                "end_time": (ride_start + timedelta(minutes=20)).isoformat(), "distance_km": 3.5,
+            }])
+            assert response.status_code == 200, response.text
+            assert response.json()["written"] == 1
+    assert db.execute(select(func.count()).select_from(models.Ride)).scalar() == 3
+    assert not ride_batcher._thread.is_alive()
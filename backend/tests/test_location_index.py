@@ -0,0 +1,80 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from location_index import KM_PER_DEGREE, LocationIndex, haversine_km
+
+# Where bikes are clustered: a city, both poles and both sides of the antimeridian
+CENTRES = [(52.52, 13.40), (89.95, 45.0), (-89.9, -120.0), (0.0, 179.99), (-33.9, -179.995), (65.0, 179.5)]
+
+
+def scatter(rng: random.Random, count: int):
+    """(lat, lon) points within about 150 km of the centres, wrapped onto
+    valid coordinates"""
+    points = []
+    for _ in range(count):
+        lat, lon = rng.choice(CENTRES)
+        lat += rng.uniform(-1.5, 1.5)
+        lon += rng.uniform(-3, 3)
+        if lat > 90:
+            lat, lon = 180 - lat, lon + 180
+        elif lat < -90:
+            lat, lon = -180 - lat, lon + 180
+        points.append((lat, (lon + 180) % 360 - 180))
+    return points
+
+
+def brute_force(positions, lat: float, lon: float, radius_km: float):
+    found = sorted(
+        (haversine_km(lat, lon, bike_lat, bike_lon), bike_id) for bike_id, (bike_lat, bike_lon) in positions.items()
+    )
+    return [bike_id for distance, bike_id in found if distance <= radius_km]
+
+
+@pytest.mark.parametrize("cell_km", [0.5, 1.0, 25.0])
+def test_nearby_matches_brute_force(cell_km):
+    rng = random.Random(cell_km)
+    index = LocationIndex(cell_km=cell_km)
+    positions = {}
+    start = datetime(2025, 1, 1)
+    for bike_id, (lat, lon) in enumerate(scatter(rng, 2000), start=1):
+        index._move(index._positions, index._cells, bike_id, lat, lon, start)
+        positions[bike_id] = (lat, lon)
+    # Later rides move a third of the bikes; older ones must not move them back
+    for bike_id in rng.sample(sorted(positions), 700):
+        lat, lon = scatter(rng, 1)[0]
+        index._move(index._positions, index._cells, bike_id, lat, lon, start + timedelta(hours=1))
+        index._move(index._positions, index._cells, bike_id, 0.0, 0.0, start - timedelta(hours=1))
+        positions[bike_id] = (lat, lon)
+
+    queries = scatter(rng, 60) + [(90.0, 0.0), (-90.0, 0.0), (0.0, 180.0), (0.0, -180.0), (65.0, -179.9)]
+    for lat, lon in queries:
+        for radius_km in (0.5, 5, 30, 100):
+            found = index.nearby(lat, lon, radius_km)
+            assert [bike["bike_id"] for bike in found] == brute_force(positions, lat, lon, radius_km), (
+                lat, lon, radius_km)
+            for bike in found:
+                assert (bike["lat"], bike["lon"]) == positions[bike["bike_id"]]
+
+
+def test_apply_rides_moves_bikes(db):
+    index = LocationIndex(cell_km=1.0)
+    index.refresh()
+    start = datetime(2025, 1, 1, 8)
+    index.apply_rides([
+        {"bike_id": 1, "end_lat": 0.0, "end_lon": 179.999, "start_time": start},
+        {"bike_id": 2, "end_lat": 0.0, "end_lon": -179.999, "start_time": start},
+        {"bike_id": 3, "end_lat": 10.0, "end_lon": 10.0, "start_time": start},
+        {"bike_id": 4, "end_lat": None, "end_lon": None, "start_time": start},
+    ])
+    assert sorted(bike["bike_id"] for bike in index.nearby(0.0, 180.0, 1)) == [1, 2]
+
+    # Bike 3 rides across the antimeridian; a ride that started earlier arrives late
+    index.apply_rides([
+        {"bike_id": 3, "end_lat": 0.0, "end_lon": -179.99, "start_time": start + timedelta(hours=1)},
+        {"bike_id": 3, "end_lat": 10.0, "end_lon": 10.0, "start_time": start - timedelta(hours=1)},
+    ])
+    assert [bike["bike_id"] for bike in index.nearby(0.0, 179.995, 2 * KM_PER_DEGREE * 0.01)] == [1, 2, 3]
+    assert index.nearby(10.0, 10.0, 50) == []
+    assert len(index) == 3
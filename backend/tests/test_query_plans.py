@@ -0,0 +1,162 @@
+"""The prediction, listing and rollup queries must be served by their indexes.
+
+SQLite plans are checked against a small seeded database. PostgreSQL is
+checked too when TEST_POSTGRESQL_URL points at a database the tests may
+migrate.
+"""
+import os
+import re
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine, func, select, text
+
+import models
+import rollups
+from database import run_migrations
+from feature_store import RECENT_RIDES_WINDOW, features_query
+from listing import list_query
+from predictions import fleet_features_query
+
+HOT_TABLES = ("rides", "maintenance_records")
+
+
+def hot_queries(dialect: str = "sqlite"):
+    """name -> (statement, SQLite plan lines it must contain)"""
+    ride = models.Ride.__table__
+    maintenance = models.MaintenanceRecord.__table__
+    ride_rollup = models.RideRollup.__table__
+    return {
+        "fleet features (windowed)": (fleet_features_query(), [
+            "SCAN rides USING INDEX ix_rides_bike_id_start_time",
+            "SCAN maintenance_records USING COVERING INDEX ix_maintenance_records_bike_id_action_date",
+            "SCAN rides USING INDEX ix_rides_bike_id_end_time",
+        ]),
+        "fleet features (store)": (features_query(), [
+            "SEARCH bike_features USING INTEGER PRIMARY KEY (rowid=?) LEFT-JOIN",
+        ]),
+        "bike ride window": (
+            select(ride.c.avg_vibration, ride.c.distance_km)
+            .where(ride.c.bike_id == 1)
+            .order_by(ride.c.start_time.desc(), ride.c.ride_id.desc())
+            .limit(RECENT_RIDES_WINDOW),
+            ["SEARCH rides USING INDEX ix_rides_bike_id_start_time (bike_id=?)"],
+        ),
+        "km since replacement": (
+            select(func.sum(ride.c.distance_km)).where(ride.c.bike_id == 1, ride.c.end_time > datetime(2024, 1, 1)),
+            ["SEARCH rides USING INDEX ix_rides_bike_id_end_time (bike_id=? AND end_time>?)"],
+        ),
+        "last replacement": (
+            select(func.max(maintenance.c.maintenance_date)).where(
+                maintenance.c.bike_id == 1, maintenance.c.action == "replaced"
+            ),
+            ["SEARCH maintenance_records USING COVERING INDEX ix_maintenance_records_bike_id_action_date "
+             "(bike_id=? AND action=?)"],
+        ),
+        "training failure label": (
+            select(maintenance.c.bike_id).where(
+                maintenance.c.action == "replaced",
+                maintenance.c.maintenance_date.between(date(2024, 1, 1), date(2024, 1, 31)),
+            ),
+            ["SEARCH maintenance_records USING INDEX ix_maintenance_records_maintenance_date "
+             "(maintenance_date>? AND maintenance_date<?)"],
+        ),
+        "rides by bike": (list_query(ride, bike_id=1).limit(100), ["SEARCH rides USING INDEX ix_rides_bike_id_"]),
+        "rides by time": (
+            list_query(ride, time_column="start_time", since=datetime(2024, 1, 1), until=datetime(2024, 1, 2))
+            .limit(100),
+            ["SEARCH rides USING INDEX ix_rides_start_time (start_time>? AND start_time<?)"],
+        ),
+        "maintenance by bike": (
+            list_query(maintenance, bike_id=1).limit(100),
+            ["SEARCH maintenance_records USING INDEX ix_maintenance_records_bike_id_action_date (bike_id=?)"],
+        ),
+        "ride rollups of a bike": (
+            select(ride_rollup.c.day, ride_rollup.c.rides, ride_rollup.c.distance_km).where(
+                ride_rollup.c.bike_id == 1, ride_rollup.c.day.between(date(2024, 1, 1), date(2024, 1, 31))
+            ),
+            ["SEARCH ride_rollups_daily USING INDEX ix_ride_rollups_daily_bike_id_day (bike_id=? AND day>? AND day<?)"],
+        ),
+        "ride rollup refill": (
+            rollups.ride_rollup_query(dialect, date(2024, 1, 2), date(2024, 1, 3)),
+            ["SEARCH rides USING INDEX ix_rides_start_time (start_time>? AND start_time<?)"],
+        ),
+        "maintenance rollup refill": (
+            rollups.maintenance_rollup_query(dialect, date(2024, 1, 2), date(2024, 1, 3)),
+            ["SEARCH rides USING INDEX ix_rides_bike_id_end_time (bike_id=? AND end_time>? AND end_time<?)"],
+        ),
+    }
+
+
+def sqlite_plan(conn, statement):
+    sql = str(statement.compile(conn, compile_kwargs={"literal_binds": True}))
+    plan = [row[3] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    pattern = re.compile(rf"^SCAN ({'|'.join(HOT_TABLES)})$")
+    return plan, [line for line in plan if pattern.match(line)]
+
+
+def postgresql_plan(conn, statement):
+    sql = str(statement.compile(conn, compile_kwargs={"literal_binds": True}))
+    conn.execute(text("SET enable_seqscan = off"))
+    (plan,) = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+
+    nodes, violations, stack = [], [], [plan["Plan"]]
+    while stack:
+        node = stack.pop()
+        label = f"{node['Node Type']} {node.get('Relation Name', '')}".strip()
+        if node.get("Index Name"):
+            label += f" using {node['Index Name']}"
+        nodes.append(label)
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in HOT_TABLES:
+            violations.append(label)
+        stack.extend(node.get("Plans", []))
+    return nodes, violations
+
+
+@pytest.fixture(scope="module")
+def sqlite_engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}")
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(models.Bike.__table__.insert(), [{"bike_id": i, "status": "active"} for i in range(1, 51)])
+        conn.execute(models.Ride.__table__.insert(), [
+            {
+                "bike_id": i % 50 + 1,
+                "start_time": datetime(2024, 1, 1 + i % 28, i % 24),
+                "end_time": datetime(2024, 1, 1 + i % 28, i % 24, 30),
+                "distance_km": 1.0,
+                "avg_vibration": 1.0,
+            }
+            for i in range(2000)
+        ])
+        conn.execute(models.MaintenanceRecord.__table__.insert(), [
+            {"bike_id": i % 50 + 1, "maintenance_date": date(2024, 1, 1 + i % 28), "action": "replaced"}
+            for i in range(200)
+        ])
+        conn.execute(text("ANALYZE"))
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("name", list(hot_queries()))
+def test_sqlite_uses_indexes(sqlite_engine, name):
+    statement, expected = hot_queries()[name]
+    with sqlite_engine.connect() as conn:
+        plan, violations = sqlite_plan(conn, statement)
+    assert not violations, plan
+    for line in expected:
+        assert any(step.startswith(line) for step in plan), (line, plan)
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRESQL_URL"), reason="TEST_POSTGRESQL_URL is not set")
+@pytest.mark.parametrize("name", list(hot_queries()))
+def test_postgresql_uses_indexes(name):
+    engine = create_engine(os.environ["TEST_POSTGRESQL_URL"])
+    try:
+        run_migrations(engine)
+        statement, _ = hot_queries("postgresql")[name]
+        with engine.connect() as conn:
+            plan, violations = postgresql_plan(conn, statement)
+    finally:
+        engine.dispose()
+    assert not violations, plan
@@ -0,0 +1,91 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select
+
+import feature_store
+import models
+import rollups
+from database import engine
+from ride_archive import archive_rides
+from work_queue import WorkQueue
+
+TODAY = date.today()
+
+
+def days_ago(days: int) -> datetime:
+    return datetime.combine(TODAY - timedelta(days=days), datetime.min.time())
+
+
+def seed(db) -> None:
+    """One bike with rides two years ago and in the last two months, and
+    earlier brake and tire replacements"""
+    db.add(models.Bike(bike_id=1, status="active", purchased_date=TODAY - timedelta(days=800)))
+    db.flush()
+    for days in list(range(730, 700, -1)) + list(range(60, 0, -1)):
+        start = days_ago(days) + timedelta(hours=9)
+        db.add(models.Ride(
+            bike_id=1, start_time=start, end_time=start + timedelta(minutes=30), distance_km=days % 7 + 1.0,
+            avg_vibration=0.3, weather_condition="sunny", created_at=start,
+        ))
+    for days, component in ((720, "brake"), (100, "brake"), (710, "tire"), (90, "tire")):
+        db.add(models.MaintenanceRecord(
+            bike_id=1, maintenance_date=TODAY - timedelta(days=days), component=component, action="replaced",
+        ))
+    db.commit()
+    rollups.rebuild(db)
+    feature_store.rebuild(db)
+
+
+def maintenance_rollups(db):
+    table = models.MaintenanceRollup.__table__
+    rows = db.execute(select(table).order_by(table.c.day, table.c.component, table.c.action)).all()
+    return [(row.day, row.component, row.records, row.intervals, round(row.interval_km_sum or 0, 6)) for row in rows]
+
+
+def test_archived_rides_keep_interval_km(db):
+    seed(db)
+    before = maintenance_rollups(db)
+    archive_rides(engine, before=days_ago(365))
+    assert db.execute(select(models.Ride.__table__.c.ride_id).where(
+        models.Ride.__table__.c.start_time < days_ago(365))).first() is None
+
+    rollups.rebuild(db)
+    assert maintenance_rollups(db) == before
+
+
+def test_replacement_after_archive_with_no_archived_rides_in_interval(db):
+    seed(db)
+    archive_rides(engine, before=days_ago(365))
+
+    # The brake interval since 100 days ago holds only live rides
+    record = models.MaintenanceRecord(bike_id=1, maintenance_date=TODAY, component="brake", action="replaced")
+    db.add(record)
+    db.flush()
+    rollups.apply_maintenance(db, [record])
+    db.commit()
+    applied = maintenance_rollups(db)
+
+    rollups.rebuild(db, start=TODAY - timedelta(days=30))
+    assert maintenance_rollups(db) == applied
+    rollups.rebuild(db)
+    assert maintenance_rollups(db) == applied
+
+
+def test_complete_job_after_archive(db):
+    seed(db)
+    archive_rides(engine, before=days_ago(365))
+    now = datetime.now()
+    db.add(models.WorkQueueClaim(
+        bike_id=1, component="tire", mechanic="ann", score=1.0, minutes=20,
+        claimed_at=now, expires_at=now + timedelta(hours=1),
+    ))
+    db.commit()
+
+    record = WorkQueue().complete(1, "tire", "ann")
+
+    db.expire_all()
+    assert db.get(models.MaintenanceRecord, record["record_id"]).component == "tire"
+    assert db.get(models.WorkQueueClaim, (1, "tire")) is None
+    table = models.MaintenanceRollup.__table__
+    row = db.execute(select(table).where(table.c.day == TODAY, table.c.component == "tire")).one()
+    assert (row.records, row.intervals) == (1, 1)
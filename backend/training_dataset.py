@@ -0,0 +1,256 @@
+import json
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import List, Optional
+
+import pandas as pd
+from sqlalchemy import create_engine, func, select
+
+import models
+from feature_store import RECENT_RIDES_WINDOW
+from predictions import FEATURE_COLUMNS, NEVER_SERVICED_DAYS
+from ride_archive import archive_span, read_rides
+
+# A snapshot is labelled positive if a component is replaced within this many
+# days after the snapshot day
+SNAPSHOT_HORIZON_DAYS = int(os.getenv("SNAPSHOT_HORIZON_DAYS", "30"))
+SNAPSHOT_CACHE_DIR = os.getenv("SNAPSHOT_CACHE_DIR", "data/training_snapshots")
+SNAPSHOT_SHARD_SIZE = 500
+
+LABEL_COLUMN = "will_fail"
+MANIFEST = "manifest.json"
+RIDE_COLUMNS = ["ride_id", "bike_id", "start_time", "end_time", "distance_km", "avg_vibration"]
+
+
+def snapshot_time(day) -> pd.Timestamp:
+    """Features of a snapshot day are taken at the last second of that day"""
+    return pd.Timestamp(day) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+
+
+def shard_snapshots(url: str, first_bike_id: int, last_bike_id: int, days: List[date],
+                    horizon_days: int = SNAPSHOT_HORIZON_DAYS) -> pd.DataFrame:
+    """Point-in-time features and labels of bikes first..last for every day in ``days``.
+
+    The bikes' rides are read once and turned into running aggregates
+    (cumulative distance by start and by end time, rolling vibration over the
+    last 10 rides); each snapshot then picks the latest value at or before
+    its time with merge_asof, so no query runs per snapshot. Definitions
+    match training_features.training_features(engine, as_of=snapshot_time(day)).
+    """
+    engine = create_engine(url)
+    bike = models.Bike.__table__
+    maintenance = models.MaintenanceRecord.__table__
+    try:
+        bike_ids = pd.read_sql(
+            select(bike.c.bike_id).where(bike.c.bike_id.between(first_bike_id, last_bike_id)), engine
+        )["bike_id"]
+        chunks = list(read_rides(
+            engine, RIDE_COLUMNS, first_bike_id=first_bike_id, last_bike_id=last_bike_id,
+        ))
+        records = pd.read_sql(
+            select(maintenance.c.bike_id, maintenance.c.maintenance_date, maintenance.c.action)
+            .where(maintenance.c.bike_id.between(first_bike_id, last_bike_id)),
+            engine,
+        )
+    finally:
+        engine.dispose()
+
+    rides = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=RIDE_COLUMNS)
+    # Archived and live rides arrive in separate chunks
+    rides = rides.sort_values(["bike_id", "start_time", "ride_id"], ignore_index=True)
+    rides["bike_id"] = rides["bike_id"].astype("int64")
+    for column in ("start_time", "end_time"):
+        # merge_asof needs both sides of a key in the same resolution
+        rides[column] = pd.to_datetime(rides[column], format="ISO8601").astype("datetime64[ns]")
+    for column in ("distance_km", "avg_vibration"):
+        rides[column] = rides[column].astype("float64")
+    distance = rides["distance_km"].fillna(0)
+
+    # Running aggregates, by start time (rides already sorted that way) ...
+    by_start = rides[["bike_id", "start_time"]].copy()
+    by_start["total_km"] = distance.groupby(rides["bike_id"]).cumsum()
+    by_start["vibration"] = (
+        rides.groupby("bike_id")["avg_vibration"]
+        .rolling(RECENT_RIDES_WINDOW, min_periods=1)
+        .mean()
+        .to_numpy()
+    )
+    by_start = by_start.sort_values("start_time", kind="stable")
+    # ... and by end time, for the distance ridden before each replacement
+    by_end = rides[["bike_id", "end_time"]].assign(distance=distance).sort_values(["bike_id", "end_time"])
+    by_end["ended_km"] = by_end.groupby("bike_id")["distance"].cumsum()
+    by_end = by_end.sort_values("end_time", kind="stable")
+
+    records["bike_id"] = records["bike_id"].astype("int64")
+    records["maintenance_date"] = pd.to_datetime(records["maintenance_date"]).astype("datetime64[ns]")
+    records = records.dropna(subset=["maintenance_date"])
+    serviced = records[["bike_id", "maintenance_date"]].sort_values("maintenance_date")
+    replaced = (
+        records.loc[records["action"] == "replaced", ["bike_id", "maintenance_date"]]
+        .sort_values("maintenance_date")
+        .rename(columns={"maintenance_date": "replaced_date"})
+    )
+
+    snapshots = pd.MultiIndex.from_product(
+        [bike_ids.astype("int64"), pd.to_datetime(days)], names=["bike_id", "snapshot_date"]
+    ).to_frame(index=False)
+    snapshots["snapshot_date"] = snapshots["snapshot_date"].astype("datetime64[ns]")
+    snapshots["as_of"] = snapshots["snapshot_date"] + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    snapshots = snapshots.sort_values("as_of", kind="stable")
+
+    snapshots = pd.merge_asof(
+        snapshots, by_start, left_on="as_of", right_on="start_time", by="bike_id"
+    )
+    snapshots = pd.merge_asof(
+        snapshots, serviced.rename(columns={"maintenance_date": "last_maintenance_date"}),
+        left_on="snapshot_date", right_on="last_maintenance_date", by="bike_id",
+    )
+    snapshots = pd.merge_asof(
+        snapshots, replaced.rename(columns={"replaced_date": "last_replaced_date"}),
+        left_on="snapshot_date", right_on="last_replaced_date", by="bike_id",
+    )
+    # Label: the first replacement strictly after the snapshot day
+    snapshots = pd.merge_asof(
+        snapshots, replaced.rename(columns={"replaced_date": "next_replaced_date"}),
+        left_on="snapshot_date", right_on="next_replaced_date", by="bike_id",
+        direction="forward", allow_exact_matches=False,
+    )
+    # Rides that ended by the (midnight of the) last replacement don't count
+    snapshots["replaced_key"] = snapshots["last_replaced_date"].fillna(pd.Timestamp(0))
+    snapshots = pd.merge_asof(
+        snapshots.sort_values("replaced_key", kind="stable"), by_end[["bike_id", "end_time", "ended_km"]],
+        left_on="replaced_key", right_on="end_time", by="bike_id",
+    )
+
+    total = snapshots["total_km"].fillna(0)
+    snapshots["total_distance_km"] = total
+    snapshots["km_since_service"] = total - snapshots["ended_km"].fillna(0).where(
+        snapshots["last_replaced_date"].notna(), 0
+    )
+    snapshots["days_since_service"] = (
+        (snapshots["as_of"] - snapshots["last_maintenance_date"]).dt.total_seconds() / 86400
+    ).fillna(NEVER_SERVICED_DAYS)
+    snapshots["avg_vibration_last_10"] = snapshots["vibration"].fillna(0)
+    snapshots[LABEL_COLUMN] = (
+        snapshots["next_replaced_date"] <= snapshots["snapshot_date"] + pd.Timedelta(days=horizon_days)
+    ).astype(int)
+
+    return (
+        snapshots[["bike_id", "snapshot_date"] + FEATURE_COLUMNS + [LABEL_COLUMN]]
+        .sort_values(["snapshot_date", "bike_id"])
+        .reset_index(drop=True)
+    )
+
+
+def _build_part(url, first_bike_id, last_bike_id, days, horizon_days, path):
+    frame = shard_snapshots(url, first_bike_id, last_bike_id, days, horizon_days)
+    frame.to_parquet(path, index=False)
+    return len(frame)
+
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def data_range(engine):
+    """(first ride day, last ride day) in the database and archive, or None when empty"""
+    ride = models.Ride.__table__
+    with engine.connect() as conn:
+        first, last = conn.execute(select(func.min(ride.c.start_time), func.max(ride.c.start_time))).one()
+        archived_first, archived_last = archive_span(conn)
+    firsts = [pd.Timestamp(value) for value in (first, archived_first) if value is not None]
+    lasts = [pd.Timestamp(value) for value in (last, archived_last) if value is not None]
+    if not firsts:
+        return None
+    return min(firsts).date(), max(lasts).date()
+
+
+def build_dataset(url: str, horizon_days: int = SNAPSHOT_HORIZON_DAYS, every_days: int = 1,
+                  start: Optional[date] = None, cache_dir: str = SNAPSHOT_CACHE_DIR,
+                  workers: Optional[int] = None, shard_size: int = SNAPSHOT_SHARD_SIZE,
+                  rebuild: bool = False) -> dict:
+    """Bring the Parquet snapshot cache up to date and return its manifest.
+
+    Snapshot days run every ``every_days`` from ``start`` (default: the first
+    ride) up to the last day whose label window is fully covered by the
+    data. Days already in the cache are kept, so a later run only computes
+    the new days; pass ``rebuild`` after back-filling history.
+    """
+    engine = create_engine(url)
+    try:
+        span = data_range(engine)
+        bike = models.Bike.__table__
+        with engine.connect() as conn:
+            max_bike_id = conn.execute(select(func.max(bike.c.bike_id))).scalar() or 0
+    finally:
+        engine.dispose()
+
+    directory = os.path.join(cache_dir, f"horizon={horizon_days}d")
+    os.makedirs(directory, exist_ok=True)
+    manifest = None if rebuild else _read_manifest(directory)
+    if manifest is not None and manifest["every_days"] != every_days:
+        manifest = None
+    if manifest is None:
+        for name in os.listdir(directory):
+            if name.endswith(".parquet"):
+                os.remove(os.path.join(directory, name))
+        manifest = {"horizon_days": horizon_days, "every_days": every_days, "days": [], "parts": []}
+
+    if span is not None:
+        last_day = span[1] - timedelta(days=horizon_days)
+        if manifest["days"]:
+            next_day = date.fromisoformat(manifest["days"][-1]) + timedelta(days=every_days)
+        else:
+            next_day = start or span[0]
+        days = [d.date() for d in pd.date_range(next_day, last_day, freq=f"{every_days}D")]
+    else:
+        days = []
+
+    if days:
+        run = uuid.uuid4().hex[:8]
+        shards = [
+            (first, min(first + shard_size - 1, max_bike_id))
+            for first in range(1, max_bike_id + 1, shard_size)
+        ]
+        parts = [f"part-{days[0]}-{days[-1]}-{run}-{i:05d}.parquet" for i in range(len(shards))]
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = [
+                pool.submit(_build_part, url, first, last, days, horizon_days, os.path.join(directory, part))
+                for (first, last), part in zip(shards, parts)
+            ]
+            rows = sum(future.result() for future in futures)
+        # Parts only become visible once the manifest lists them
+        manifest["days"] += [d.isoformat() for d in days]
+        manifest["parts"] += parts
+        _write_manifest(directory, manifest)
+        print(f"Built {rows} snapshots for {len(days)} new days ({days[0]} .. {days[-1]})")
+    else:
+        print("Snapshot cache is up to date")
+
+    manifest["directory"] = directory
+    return manifest
+
+
+def load_dataset(manifest: dict) -> pd.DataFrame:
+    """Read every cached part listed in a manifest"""
+    paths = [os.path.join(manifest["directory"], part) for part in manifest["parts"]]
+    if not paths:
+        return pd.DataFrame(columns=["bike_id", "snapshot_date"] + FEATURE_COLUMNS + [LABEL_COLUMN])
+    return (
+        pd.concat((pd.read_parquet(path) for path in paths), ignore_index=True)
+        .sort_values(["snapshot_date", "bike_id"])
+        .reset_index(drop=True)
+    )
@@ -0,0 +1,135 @@
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+from sqlalchemy import select
+
+import models
+from feature_store import RECENT_RIDES_WINDOW
+from predictions import FEATURE_COLUMNS, NEVER_SERVICED_DAYS
+
+# Rides read per round trip; only one chunk plus the per-bike ride window is
+# held in memory at a time
+CHUNK_SIZE = 200_000
+
+# A replacement within this many days before as_of labels the bike as failed
+FAILURE_WINDOW_DAYS = 30
+
+
+def service_dates(engine, as_of: Optional[datetime] = None) -> pd.DataFrame:
+    """Last maintenance and last replacement date per bike (indexed by bike_id)"""
+    maintenance = models.MaintenanceRecord.__table__
+    query = select(maintenance.c.bike_id, maintenance.c.maintenance_date, maintenance.c.action)
+    if as_of is not None:
+        query = query.where(maintenance.c.maintenance_date <= as_of.date())
+    records = pd.read_sql(query, engine)
+    records["maintenance_date"] = pd.to_datetime(records["maintenance_date"])
+    replaced = records["maintenance_date"].where(records["action"] == "replaced")
+    return pd.DataFrame({
+        "last_maintenance_date": records.groupby("bike_id")["maintenance_date"].max(),
+        "last_replaced_date": replaced.groupby(records["bike_id"]).max(),
+    })
+
+
+def read_chunks(engine, query, chunksize: int = CHUNK_SIZE):
+    """Run ``query`` on a raw DBAPI cursor and yield DataFrames of its rows.
+
+    Rows are taken straight from the driver because SQLAlchemy's per-row
+    result processing costs more than the fetch itself at these sizes. The
+    statement is rendered with literal values, which only ever are ids and
+    timestamps here.
+    """
+    sql = str(query.compile(engine, compile_kwargs={"literal_binds": True}))
+    connection = engine.raw_connection()
+    try:
+        # Named cursors are server-side on psycopg2, so PostgreSQL streams too
+        if engine.dialect.name == "postgresql":
+            cursor = connection.cursor(name="training_features")
+        else:
+            cursor = connection.cursor()
+        cursor.execute(sql)
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=[c[0] for c in cursor.description])
+        cursor.close()
+    finally:
+        connection.close()
+
+
+def ride_chunks(engine, as_of: Optional[datetime] = None, chunksize: int = CHUNK_SIZE):
+    """Archived and live rides as DataFrames of at most ``chunksize`` rows"""
+    # Imported here: ride_archive uses read_chunks from this module
+    from ride_archive import read_rides
+
+    columns = ["ride_id", "bike_id", "start_time", "end_time", "distance_km", "avg_vibration"]
+    yield from read_rides(engine, columns, until=as_of, chunksize=chunksize)
+
+
+def training_features(engine, as_of: Optional[datetime] = None, chunksize: int = CHUNK_SIZE) -> pd.DataFrame:
+    """Model features and failure label of every bike, computed from raw rides.
+
+    Feature definitions match the serving path (predictions.py): distance
+    since the last replacement, fractional days since the last maintenance
+    and the mean vibration of the last 10 rides by start time. Rides are
+    streamed in chunks and folded into per-bike aggregates with groupby, so
+    memory stays at one chunk plus 10 rides per bike.
+
+    With ``as_of`` only rides and maintenance up to that moment are used and
+    total_distance_km is summed from those rides; without it, the bikes'
+    running totals are used as the API does.
+    """
+    now = pd.Timestamp(as_of or datetime.now())
+    bike = models.Bike.__table__
+    bikes = pd.read_sql(
+        select(bike.c.bike_id, bike.c.total_distance_km).order_by(bike.c.bike_id), engine
+    ).set_index("bike_id")
+    service = service_dates(engine, as_of).reindex(bikes.index)
+
+    km_since = pd.Series(dtype="float64")
+    total = pd.Series(dtype="float64")
+    window = None
+    for chunk in ride_chunks(engine, as_of, chunksize):
+        replaced = chunk["bike_id"].map(service["last_replaced_date"])
+        after = replaced.isna() | (chunk["end_time"] > replaced)
+        by_bike = chunk.groupby("bike_id")["distance_km"]
+        # min_count=1 keeps SUM() semantics: NULL when nothing was summed
+        km_since = km_since.add(
+            chunk["distance_km"].where(after).groupby(chunk["bike_id"]).sum(min_count=1), fill_value=0
+        )
+        total = total.add(by_bike.sum(min_count=1), fill_value=0)
+        # Carry the newest rides of each bike forward into the next chunk
+        recent = chunk[["bike_id", "start_time", "ride_id", "avg_vibration"]]
+        if window is not None:
+            recent = pd.concat([window, recent], ignore_index=True)
+        window = (
+            recent.sort_values(["bike_id", "start_time", "ride_id"])
+            .groupby("bike_id")
+            .tail(RECENT_RIDES_WINDOW)
+        )
+
+    features = pd.DataFrame(index=bikes.index)
+    features["total_distance_km"] = (
+        bikes["total_distance_km"] if as_of is None else total.reindex(bikes.index)
+    ).fillna(0)
+    # Never replaced: every ride counts (and the bike total if it has none)
+    never_replaced = service["last_replaced_date"].isna()
+    km_since = km_since.reindex(bikes.index)
+    features["km_since_service"] = km_since.where(
+        ~never_replaced | km_since.notna(), features["total_distance_km"]
+    ).fillna(0)
+    features["days_since_service"] = (
+        (now - service["last_maintenance_date"]).dt.total_seconds() / 86400
+    ).fillna(NEVER_SERVICED_DAYS)
+    if window is None:
+        vibration = pd.Series(dtype="float64")
+    else:
+        vibration = window.groupby("bike_id")["avg_vibration"].mean()
+    features["avg_vibration_last_10"] = vibration.reindex(bikes.index).fillna(0)
+
+    replaced = service["last_replaced_date"]
+    features["had_failure"] = (
+        (replaced >= now.normalize() - pd.Timedelta(days=FAILURE_WINDOW_DAYS)) & (replaced <= now)
+    ).astype(int)
+    return features[FEATURE_COLUMNS + ["had_failure"]].reset_index()
@@ -0,0 +1,625 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, select, text
+
+import feature_store
+import models
+import rollups
+from cache import result_cache
+from database import SessionLocal
+from feature_index import feature_index
+from model_serving import model_server
+from predictions import HIGH_RISK_PROBABILITY, MEDIUM_RISK_PROBABILITY, prediction_variant
+
+logger = logging.getLogger(__name__)
+
+# Minutes a mechanic needs for one job on each component
+JOB_MINUTES = {"brake": 45, "chain": 30, "tire": 20}
+COMPONENTS = tuple(JOB_MINUTES)
+# Predicted issue -> component whose job addresses it; bikes whose issues
+# name none of these get no job. "wheel alignment" is wheel/frame work, which
+# has no component here, so it stays unmapped
+ISSUE_COMPONENTS = {
+    "brake pads": "brake",
+    "brake adjustment": "brake",
+    "chain wear": "chain",
+    "chain lubrication": "chain",
+    "tire pressure": "tire",
+}
+
+# Queue score = risk weight * failure risk + km weight * km since service
+# + days weight * days since service, each term scaled to [0, 1]
+WORK_QUEUE_RISK_WEIGHT = float(os.getenv("WORK_QUEUE_RISK_WEIGHT", "0.6"))
+WORK_QUEUE_KM_WEIGHT = float(os.getenv("WORK_QUEUE_KM_WEIGHT", "0.25"))
+WORK_QUEUE_DAYS_WEIGHT = float(os.getenv("WORK_QUEUE_DAYS_WEIGHT", "0.15"))
+# km and days since service at which those terms reach their full weight
+WORK_QUEUE_SERVICE_KM = float(os.getenv("WORK_QUEUE_SERVICE_KM", "1000"))
+WORK_QUEUE_SERVICE_DAYS = float(os.getenv("WORK_QUEUE_SERVICE_DAYS", "180"))
+# Failure risk of threshold predictions, which have no model probability
+PRIORITY_RISK = {"high": HIGH_RISK_PROBABILITY, "medium": MEDIUM_RISK_PROBABILITY, "low": 0.0}
+# A component replaced this recently gets no job: the threshold rules look at
+# total distance, which a replacement does not reset
+WORK_QUEUE_REPLACED_COOLDOWN_DAYS = int(os.getenv("WORK_QUEUE_REPLACED_COOLDOWN_DAYS", "30"))
+# The queue is rebuilt in the background once this old, which picks up writes
+# and claims made by other processes and returns expired claims
+WORK_QUEUE_MAX_AGE_SECONDS = float(os.getenv("WORK_QUEUE_MAX_AGE_SECONDS", "300"))
+# Claimed jobs not completed within this go back to the queue
+WORK_QUEUE_CLAIM_HOURS = float(os.getenv("WORK_QUEUE_CLAIM_HOURS", "12"))
+# Capacity of a claim when the mechanic gives none: one shift
+WORK_QUEUE_SHIFT_MINUTES = int(os.getenv("WORK_QUEUE_SHIFT_MINUTES", "480"))
+
+# Largest page returned by GET /work-queue
+MAX_PEEK = 500
+# Times a batch is topped up after losing jobs to another API worker
+CLAIM_ROUNDS = 3
+
+
+def job_components(prediction: Dict[str, Any]) -> List[str]:
+    """Components with a job for this prediction, in COMPONENTS order"""
+    named = {ISSUE_COMPONENTS.get(issue) for issue in prediction["predicted_issues"]}
+    return [component for component in COMPONENTS if component in named]
+
+
+def job_score(prediction: Dict[str, Any]) -> float:
+    """Urgency of a bike's jobs from its failure risk and time since service"""
+    if prediction["prediction_source"] == "model":
+        risk = prediction["confidence_score"]
+    else:
+        risk = PRIORITY_RISK[prediction["maintenance_priority"]]
+    features = prediction["features"]
+    km = min(max(features["km_since_service"], 0.0) / WORK_QUEUE_SERVICE_KM, 1.0)
+    days = min(max(features["days_since_service"], 0.0) / WORK_QUEUE_SERVICE_DAYS, 1.0)
+    return WORK_QUEUE_RISK_WEIGHT * risk + WORK_QUEUE_KM_WEIGHT * km + WORK_QUEUE_DAYS_WEIGHT * days
+
+
+class IndexedHeap:
+    """Binary max-heap of integer keys with a key -> position map.
+
+    Pushing a key already in the heap changes its priority, and any key can
+    be removed; both are O(log n). Equal priorities go to the lower key.
+    """
+
+    def __init__(self, priorities: Optional[Dict[int, float]] = None):
+        self._priority: Dict[int, float] = dict(priorities or {})
+        self._keys: List[int] = list(self._priority)
+        self._pos: Dict[int, int] = {key: i for i, key in enumerate(self._keys)}
+        # Floyd's bottom-up build, O(n)
+        for i in reversed(range(len(self._keys) // 2)):
+            self._down(i)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._pos
+
+    def _above(self, a: int, b: int) -> bool:
+        pa, pb = self._priority[a], self._priority[b]
+        return pa > pb or (pa == pb and a < b)
+
+    def _swap(self, i: int, j: int) -> None:
+        keys = self._keys
+        keys[i], keys[j] = keys[j], keys[i]
+        self._pos[keys[i]] = i
+        self._pos[keys[j]] = j
+
+    def _up(self, i: int) -> None:
+        while i:
+            parent = (i - 1) // 2
+            if not self._above(self._keys[i], self._keys[parent]):
+                return
+            self._swap(i, parent)
+            i = parent
+
+    def _down(self, i: int) -> None:
+        keys, size = self._keys, len(self._keys)
+        while True:
+            best = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size and self._above(keys[child], keys[best]):
+                    best = child
+            if best == i:
+                return
+            self._swap(i, best)
+            i = best
+
+    def push(self, key: int, priority: float) -> None:
+        """Add ``key``, or move it to ``priority`` if it is already queued"""
+        if key in self._pos:
+            old = self._priority[key]
+            self._priority[key] = priority
+            if priority > old:
+                self._up(self._pos[key])
+            elif priority < old:
+                self._down(self._pos[key])
+            return
+        self._priority[key] = priority
+        self._keys.append(key)
+        self._pos[key] = len(self._keys) - 1
+        self._up(len(self._keys) - 1)
+
+    def remove(self, key: int) -> bool:
+        i = self._pos.pop(key, None)
+        if i is None:
+            return False
+        del self._priority[key]
+        last = self._keys.pop()
+        if i < len(self._keys):
+            self._keys[i] = last
+            self._pos[last] = i
+            self._up(i)
+            self._down(self._pos[last])
+        return True
+
+    def peek(self) -> Optional[Tuple[int, float]]:
+        if not self._keys:
+            return None
+        key = self._keys[0]
+        return key, self._priority[key]
+
+    def pop(self) -> Tuple[int, float]:
+        key, priority = self.peek()
+        self.remove(key)
+        return key, priority
+
+    def top(self, k: int) -> List[Tuple[int, float]]:
+        """The ``k`` highest (key, priority) pairs, best first, in O(k log k)"""
+        keys, priority = self._keys, self._priority
+        result = []
+        frontier = [(-priority[keys[0]], keys[0], 0)] if keys else []
+        while frontier and len(result) < k:
+            negated, key, i = heapq.heappop(frontier)
+            result.append((key, -negated))
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(keys):
+                    heapq.heappush(frontier, (-priority[keys[child]], keys[child], child))
+        return result
+
+
+class WorkQueue:
+    """Maintenance jobs of the fleet, most urgent first, one heap per component.
+
+    Every bike is scored from the in-memory feature index (with the served
+    model when one is loaded) and gets a job for each component its
+    predicted issues name. Writes in this process mark bikes dirty through
+    the result cache's invalidation listeners, and dirty bikes are rescored
+    and moved in their heaps on the next peek or claim. The whole queue is
+    rebuilt when the served model changes and in the background when it
+    gets older than ``max_age`` seconds.
+
+    Claims are rows of ``work_queue_claims`` inserted with ON CONFLICT DO
+    NOTHING, so a job lost to another mechanic or API worker is dropped
+    from the batch and replaced by the next one. Completing a job writes
+    the replacement and resets the bike's features in one transaction.
+    """
+
+    def __init__(self, session_factory=SessionLocal, index=feature_index, server=model_server,
+                 max_age: float = WORK_QUEUE_MAX_AGE_SECONDS, claim_hours: float = WORK_QUEUE_CLAIM_HOURS):
+        self.session_factory = session_factory
+        self.index = index
+        self.server = server
+        self.max_age = max_age
+        self.claim_hours = claim_hours
+        self._heaps = {component: IndexedHeap() for component in COMPONENTS}
+        # bike_id -> what its jobs were scored from
+        self._bikes: Dict[int, Dict[str, Any]] = {}
+        # (bike_id, component) claimed by any mechanic, kept out of the heaps
+        self._claimed: Set[Tuple[int, str]] = set()
+        # (bike_id, component) -> last replacement within the cooldown
+        self._replaced: Dict[Tuple[int, str], date] = {}
+        self._dirty: Set[int] = set()
+        self._variant: Optional[str] = None
+        self._built_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._rebuilding = False
+        self.full_builds = 0
+        self.rescored = 0
+
+    def __len__(self) -> int:
+        return sum(len(heap) for heap in self._heaps.values())
+
+    def invalidate(self, bike_ids: Optional[Iterable[int]]) -> None:
+        """Mark bikes as changed; None rebuilds the whole queue"""
+        if bike_ids is None:
+            self._built_at = None
+            return
+        with self._lock:
+            self._dirty.update(bike_ids)
+
+    def _model(self):
+        return self.server if self.server is not None and self.server.available else None
+
+    def _score(self, bike_ids: Optional[List[int]], server) -> List[Dict[str, Any]]:
+        """Predictions for ``bike_ids`` (every indexed bike when None)"""
+        if bike_ids is None:
+            if self.index.pending([]):
+                self.index.load([])
+            bike_ids = self.index.bike_ids()
+        elif self.index.pending(bike_ids):
+            self.index.load(bike_ids)
+        return self.index.score(bike_ids, server)
+
+    def _cooled_down(self, key: Tuple[int, str], today: date) -> bool:
+        replaced = self._replaced.get(key)
+        return replaced is None or (today - replaced).days >= WORK_QUEUE_REPLACED_COOLDOWN_DAYS
+
+    def _place(self, bike_id: int, prediction: Optional[Dict[str, Any]], today: date) -> None:
+        """Move one bike's jobs to its new score (call with the lock held)"""
+        components = job_components(prediction) if prediction is not None else []
+        if not components:
+            self._bikes.pop(bike_id, None)
+        else:
+            score = job_score(prediction)
+            self._bikes[bike_id] = self._details(prediction, score)
+        for component, heap in self._heaps.items():
+            key = (bike_id, component)
+            if component in components and key not in self._claimed and self._cooled_down(key, today):
+                heap.push(bike_id, score)
+            else:
+                heap.remove(bike_id)
+
+    @staticmethod
+    def _details(prediction: Dict[str, Any], score: float) -> Dict[str, Any]:
+        return {
+            "score": round(score, 4),
+            "maintenance_priority": prediction["maintenance_priority"],
+            "confidence_score": prediction["confidence_score"],
+            "prediction_source": prediction["prediction_source"],
+            "km_since_service": prediction["features"]["km_since_service"],
+            "days_since_service": prediction["features"]["days_since_service"],
+            "predicted_issues": prediction["predicted_issues"],
+        }
+
+    def _recent_replacements(self, db, bike_ids: Optional[List[int]] = None) -> Dict[Tuple[int, str], date]:
+        maintenance = models.MaintenanceRecord.__table__
+        since = date.today() - timedelta(days=WORK_QUEUE_REPLACED_COOLDOWN_DAYS)
+        query = (
+            select(maintenance.c.bike_id, maintenance.c.component, func.max(maintenance.c.maintenance_date))
+            .where(
+                maintenance.c.action == "replaced",
+                maintenance.c.component.in_(COMPONENTS),
+                maintenance.c.maintenance_date > since,
+            )
+            .group_by(maintenance.c.bike_id, maintenance.c.component)
+        )
+        if bike_ids is not None:
+            query = query.where(maintenance.c.bike_id.in_(bike_ids))
+        return {(bike_id, component): feature_store.to_date(day) for bike_id, component, day in db.execute(query)}
+
+    def rebuild(self) -> None:
+        """Rescore every bike and re-read the open claims and recent replacements"""
+        started = time.monotonic()
+        server = self._model()
+        with self._lock:
+            # Bikes marked dirty from here on are rescored again later
+            self._dirty.clear()
+        claims = models.WorkQueueClaim.__table__
+        with self.session_factory() as db:
+            claimed = {
+                (row.bike_id, row.component)
+                for row in db.execute(
+                    select(claims.c.bike_id, claims.c.component).where(claims.c.expires_at > datetime.now())
+                )
+            }
+            replaced = self._recent_replacements(db)
+        predictions = self._score(None, server)
+
+        today = date.today()
+        bikes = {}
+        priorities = {component: {} for component in COMPONENTS}
+        for prediction in predictions:
+            components = job_components(prediction)
+            if not components:
+                continue
+            score = job_score(prediction)
+            bikes[prediction["bike_id"]] = self._details(prediction, score)
+            for component in components:
+                key = (prediction["bike_id"], component)
+                if key not in claimed and (
+                    key not in replaced or (today - replaced[key]).days >= WORK_QUEUE_REPLACED_COOLDOWN_DAYS
+                ):
+                    priorities[component][prediction["bike_id"]] = score
+        heaps = {component: IndexedHeap(priorities[component]) for component in COMPONENTS}
+        with self._lock:
+            self._heaps, self._bikes, self._claimed, self._replaced = heaps, bikes, claimed, replaced
+        self._variant = prediction_variant(server)
+        self._built_at = started
+        self.full_builds += 1
+
+    def _background_rebuild(self) -> None:
+        try:
+            with self._build_lock:
+                self.rebuild()
+        except Exception:
+            logger.exception("Work queue rebuild failed")
+        finally:
+            self._rebuilding = False
+
+    def sync(self) -> None:
+        """Bring the heaps up to date before reading them.
+
+        Rebuilds in place on first use, after invalidate(None) or when the
+        served model changed; otherwise only the dirty bikes are rescored.
+        """
+        if self._built_at is None or self._variant != prediction_variant(self._model()):
+            with self._build_lock:
+                if self._built_at is None or self._variant != prediction_variant(self._model()):
+                    self.rebuild()
+            return
+        if time.monotonic() - self._built_at >= self.max_age:
+            with self._lock:
+                start = not self._rebuilding
+                self._rebuilding = True
+            if start:
+                threading.Thread(target=self._background_rebuild, name="work-queue-rebuild", daemon=True).start()
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        bike_ids = sorted(dirty)
+        scored = {p["bike_id"]: p for p in self._score(bike_ids, self._model())}
+        today = date.today()
+        with self._lock:
+            for bike_id in bike_ids:
+                self._place(bike_id, scored.get(bike_id), today)
+        self.rescored += len(bike_ids)
+
+    def _job(self, bike_id: int, component: str, score: float) -> Dict[str, Any]:
+        details = self._bikes.get(bike_id, {})
+        return {
+            "bike_id": bike_id,
+            "component": component,
+            "minutes": JOB_MINUTES[component],
+            **details,
+            "score": round(score, 4),
+        }
+
+    def peek(self, component: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """The most urgent unclaimed jobs, without claiming them"""
+        components = check_components([component] if component else None)
+        self.sync()
+        with self._lock:
+            candidates = [
+                (score, -bike_id, component, bike_id)
+                for component in components
+                for bike_id, score in self._heaps[component].top(limit)
+            ]
+            candidates.sort(key=lambda c: (-c[0], -c[1], COMPONENTS.index(c[2])))
+            return [self._job(bike_id, component, score) for score, _, component, bike_id in candidates[:limit]]
+
+    def _pick(self, minutes: int, components: List[str], limit: Optional[int]) -> List[Tuple[int, str, float]]:
+        """Pop the most urgent jobs fitting in ``minutes``; every job of a
+        component takes as long, so a component stops once one does not fit"""
+        picked = []
+        with self._lock:
+            while limit is None or len(picked) < limit:
+                best = None
+                for component in components:
+                    top = self._heaps[component].peek()
+                    if top is None or JOB_MINUTES[component] > minutes:
+                        continue
+                    rank = (top[1], -top[0])
+                    if best is None or rank > best[0]:
+                        best = (rank, component)
+                if best is None:
+                    break
+                component = best[1]
+                bike_id, score = self._heaps[component].pop()
+                self._claimed.add((bike_id, component))
+                picked.append((bike_id, component, score))
+                minutes -= JOB_MINUTES[component]
+        return picked
+
+    def _unpick(self, keys: Iterable[Tuple[int, str]]) -> None:
+        """Return jobs popped by _pick to the queue"""
+        with self._lock:
+            for key in keys:
+                self._claimed.discard(key)
+                self._dirty.add(key[0])
+
+    def claim(self, mechanic: str, capacity_minutes: int = WORK_QUEUE_SHIFT_MINUTES,
+              components: Optional[List[str]] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Claim the most urgent jobs that fit in the mechanic's remaining capacity.
+
+        Jobs the mechanic already holds count against ``capacity_minutes``.
+        """
+        components = check_components(components)
+        if capacity_minutes <= 0:
+            raise ValueError("capacity_minutes must be positive")
+        self.sync()
+        claims = models.WorkQueueClaim.__table__
+        now = datetime.now()
+        expires_at = now + timedelta(hours=self.claim_hours)
+        won: List[Tuple[int, str, float]] = []
+        pending: List[Tuple[int, str]] = []
+        replaced: Dict[Tuple[int, str], date] = {}
+        with self.session_factory() as db:
+            try:
+                # Held until commit, so the capacity read below and the inserts
+                # are not interleaved with another claim for this mechanic
+                lock_mechanic(db, mechanic)
+                db.execute(delete(claims).where(claims.c.expires_at <= now))
+                held = db.execute(
+                    select(func.coalesce(func.sum(claims.c.minutes), 0)).where(claims.c.mechanic == mechanic)
+                ).scalar()
+                remaining = capacity_minutes - held
+                _, dialect_insert = rollups.dialect_insert_for(db)
+                for _ in range(CLAIM_ROUNDS):
+                    picked = self._pick(remaining, components, None if limit is None else limit - len(won))
+                    if not picked:
+                        break
+                    pending.extend((bike_id, component) for bike_id, component, _ in picked)
+                    wanted = len(picked)
+                    # Replaced through another API worker since the last rebuild
+                    replaced.update(self._recent_replacements(db, sorted({bike_id for bike_id, _, _ in picked})))
+                    picked = [job for job in picked if job[:2] not in replaced]
+                    inserted = set()
+                    if picked:
+                        statement = (
+                            dialect_insert(claims)
+                            .values([
+                                {"bike_id": bike_id, "component": component, "mechanic": mechanic,
+                                 "score": score, "minutes": JOB_MINUTES[component],
+                                 "claimed_at": now, "expires_at": expires_at}
+                                for bike_id, component, score in picked
+                            ])
+                            .on_conflict_do_nothing()
+                            .returning(claims.c.bike_id, claims.c.component)
+                        )
+                        inserted = {(row.bike_id, row.component) for row in db.execute(statement)}
+                    won.extend(job for job in picked if job[:2] in inserted)
+                    remaining = capacity_minutes - held - sum(JOB_MINUTES[c] for _, c, _ in won)
+                    if len(inserted) == wanted:
+                        break
+                db.commit()
+            except Exception:
+                db.rollback()
+                self._unpick(pending)
+                raise
+        with self._lock:
+            # Jobs lost to another worker stay claimed; replaced ones are
+            # kept out by the cooldown instead
+            self._claimed.difference_update(replaced)
+            self._replaced.update(replaced)
+            jobs = [
+                {**self._job(bike_id, component, score), "claimed_at": now.isoformat(),
+                 "expires_at": expires_at.isoformat()}
+                for bike_id, component, score in won
+            ]
+        minutes = sum(job["minutes"] for job in jobs)
+        return {
+            "mechanic": mechanic,
+            "jobs": jobs,
+            "minutes": minutes,
+            "remaining_minutes": capacity_minutes - held - minutes,
+        }
+
+    def _delete_claim(self, db, bike_id: int, component: str, mechanic: str) -> None:
+        claims = models.WorkQueueClaim.__table__
+        deleted = db.execute(
+            delete(claims).where(
+                claims.c.bike_id == bike_id, claims.c.component == component, claims.c.mechanic == mechanic,
+            )
+        ).rowcount
+        if not deleted:
+            raise LookupError(f"No {component} job on bike {bike_id} is claimed by {mechanic}")
+
+    def complete(self, bike_id: int, component: str, mechanic: str) -> Dict[str, Any]:
+        """Close a claimed job: record the replacement and reset the bike's features"""
+        check_components([component])
+        today = date.today()
+        with self.session_factory() as db:
+            try:
+                self._delete_claim(db, bike_id, component, mechanic)
+                record = models.MaintenanceRecord(
+                    bike_id=bike_id, maintenance_date=today, component=component, action="replaced",
+                    created_at=datetime.now(),
+                )
+                db.add(record)
+                db.flush()
+                feature_store.apply_maintenance(db, [record])
+                rollups.apply_maintenance(db, [record])
+                db.execute(
+                    models.Bike.__table__.update()
+                    .where(models.Bike.__table__.c.bike_id == bike_id)
+                    .values(last_serviced_date=today)
+                )
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            record_id = record.record_id
+        with self._lock:
+            self._claimed.discard((bike_id, component))
+            self._replaced[(bike_id, component)] = today
+        # Rescores this bike here and in the feature index
+        result_cache.invalidate_bikes([bike_id], tables=("maintenance",))
+        return {
+            "record_id": record_id,
+            "bike_id": bike_id,
+            "component": component,
+            "action": "replaced",
+            "maintenance_date": today.isoformat(),
+            "mechanic": mechanic,
+        }
+
+    def release(self, bike_id: int, component: str, mechanic: str) -> None:
+        """Hand a claimed job back to the queue without doing it"""
+        check_components([component])
+        with self.session_factory() as db:
+            self._delete_claim(db, bike_id, component, mechanic)
+            db.commit()
+        self._unpick([(bike_id, component)])
+
+    def claims(self, mechanic: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Open claims, oldest first"""
+        claims = models.WorkQueueClaim.__table__
+        query = select(claims).where(claims.c.expires_at > datetime.now())
+        if mechanic is not None:
+            query = query.where(claims.c.mechanic == mechanic)
+        with self.session_factory() as db:
+            rows = db.execute(query.order_by(claims.c.claimed_at, claims.c.bike_id, claims.c.component)).all()
+        return [
+            {
+                "bike_id": row.bike_id,
+                "component": row.component,
+                "mechanic": row.mechanic,
+                "score": row.score,
+                "minutes": row.minutes,
+                "claimed_at": row.claimed_at.isoformat(),
+                "expires_at": row.expires_at.isoformat(),
+            }
+            for row in rows
+        ]
+
+    def sizes(self) -> Dict[str, int]:
+        return {component: len(heap) for component, heap in self._heaps.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        built_at = self._built_at
+        return {
+            "jobs": self.sizes(),
+            "claimed": len(self._claimed),
+            "dirty": len(self._dirty),
+            "variant": self._variant,
+            "age_seconds": None if built_at is None else time.monotonic() - built_at,
+            "max_age_seconds": self.max_age,
+            "full_builds": self.full_builds,
+            "rescored": self.rescored,
+        }
+
+
+def lock_mechanic(db, mechanic: str) -> None:
+    """Serialise claims for ``mechanic`` until the transaction ends.
+
+    PostgreSQL takes a transaction-level advisory lock on the name; SQLite
+    has no row locks, so the transaction is started with BEGIN IMMEDIATE,
+    which holds the database's write lock (claims by every mechanic queue
+    up for a few milliseconds). Must be the session's first statement.
+    database.check_dialect() admits no other databases.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:mechanic))"), {"mechanic": mechanic})
+    else:
+        db.execute(text("BEGIN IMMEDIATE"))
+
+
+def check_components(components: Optional[List[str]]) -> List[str]:
+    """The requested components (all by default), rejecting unknown ones"""
+    if components is None:
+        return list(COMPONENTS)
+    for component in components:
+        if component not in JOB_MINUTES:
+            raise ValueError(f"Unknown component '{component}', expected one of {list(COMPONENTS)}")
+    return list(dict.fromkeys(components))
+
+
+work_queue = WorkQueue()
+result_cache.add_listener(work_queue.invalidate)
@@ -21,11 +21,24 @@ function App() {
 
   useEffect(() => {
     fetchPredictions();
+
+    // Priority changes are pushed as deltas; "resync" means refetch everything
+    const events = new EventSource('http://localhost:8000/predictions/stream');
+    events.addEventListener('priorities', (event) => {
+      const changes = new globalThis.Map(
+        JSON.parse(event.data).changes.map(change => [change.bike_id, change])
+      );
+      setBikes(current => current.map(bike =>
+        changes.has(bike.bike_id) ? { ...bike, ...changes.get(bike.bike_id) } : bike
+      ));
+    });
+    events.addEventListener('resync', () => fetchPredictions(false));
+    return () => events.close();
   }, []);
 
-  const fetchPredictions = async () => {
+  const fetchPredictions = async (showLoading = true) => {
     try {
-      setLoading(true);
+      if (showLoading) setLoading(true);
       // Try to connect to backend with timeout
       const response = await axios.get('http://localhost:8000/predictions', {
         timeout: 3000